@@ -2,9 +2,15 @@ from typing import Any, Dict, List
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.core.database import get_db
-from app.core.security import get_current_user
+from app.core.security import get_current_user, get_current_superuser
+from app.crud.organization import get_organization, get_similar_organizations
 from app.services.analytics_service import AnalyticsService
+from app.services.co_bidding import co_bidding_graph_cache
+from app.services.organization_matching import iter_duplicate_pairs, rebuild_organization_index
+from app.services.supplier_concentration import get_buyer_concentration, rebuild_supplier_concentration
+from app.services.value_screens import get_value_scores
 
 router = APIRouter()
 
@@ -76,4 +82,118 @@ def get_dashboard_overview(
 ) -> Any:
     """Get dashboard overview data"""
     analytics = AnalyticsService(db)
-    return analytics.get_dashboard_overview() 
\ No newline at end of file
+    return analytics.get_dashboard_overview()
+
+
+@router.get("/concentration/{buyer_id}")
+def get_supplier_concentration(
+    buyer_id: str,
+    procurement_method: str = "",
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_user),
+) -> Any:
+    """Get the supplier concentration (HHI) and top supplier of a buyer"""
+    concentration = get_buyer_concentration(db, buyer_id, procurement_method)
+    if concentration is None:
+        raise HTTPException(
+            status_code=404,
+            detail="No awards found for this buyer"
+        )
+    return concentration
+
+
+@router.post("/concentration/rebuild")
+def rebuild_supplier_concentration_endpoint(
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_superuser),
+) -> Any:
+    """Recompute supplier concentration of every buyer from the award items"""
+    return {"buyers": rebuild_supplier_concentration(db)}
+
+
+@router.get("/value-distribution")
+def get_value_distribution_scores(
+    source: str = "award_items",
+    group_by: str = "supplier",
+    statistic: str = "first_digit_mad",
+    min_values: int = 100,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_user),
+) -> Any:
+    """Get the entities whose award or contract values deviate most from Benford's law"""
+    try:
+        return get_value_scores(db, source, group_by, statistic, min_values, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/organizations/duplicates")
+def get_duplicate_organizations(
+    min_similarity: float = settings.ORG_DUPLICATE_SIMILARITY,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_user),
+) -> Any:
+    """Get pairs of organizations whose names and addresses are near-duplicates"""
+    pairs = []
+    for left_id, right_id, similarity in iter_duplicate_pairs(db, min_similarity):
+        pairs.append({"organization_id": left_id, "duplicate_id": right_id, "similarity": similarity})
+        if len(pairs) >= limit:
+            break
+    return pairs
+
+
+@router.get("/organizations/{organization_id}/similar")
+def get_similar_organizations_endpoint(
+    organization_id: str,
+    limit: int = 20,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_user),
+) -> Any:
+    """Get organizations that are likely the same as this one"""
+    organization = get_organization(db, id=organization_id)
+    if not organization:
+        raise HTTPException(
+            status_code=404,
+            detail="Organization not found"
+        )
+    return get_similar_organizations(db, db_obj=organization, limit=limit)
+
+
+@router.post("/organizations/index/rebuild")
+def rebuild_organization_index_endpoint(
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_superuser),
+) -> Any:
+    """Recompute the near-duplicate index of every organization"""
+    return {"organizations": rebuild_organization_index(db)}
+
+
+@router.get("/co-bidding/clusters")
+def get_co_bidding_clusters(
+    min_tenders: int = settings.CO_BIDDING_MIN_TENDERS,
+    min_size: int = 2,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_user),
+) -> Any:
+    """Get groups of suppliers that repeatedly bid on the same tenders"""
+    clusters = co_bidding_graph_cache.get(db).clusters(min_tenders, min_size)
+    return [{"size": len(suppliers), "suppliers": suppliers} for suppliers in clusters[:limit]]
+
+
+@router.get("/co-bidding/suppliers/{supplier_id}")
+def get_co_bidders(
+    supplier_id: str,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_user),
+) -> Any:
+    """Get the suppliers bidding on the same tenders as this one, with their bid rotation scores"""
+    neighbours = co_bidding_graph_cache.get(db).neighbours(supplier_id)
+    if neighbours is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Supplier not found in the co-bidding graph"
+        )
+    return neighbours
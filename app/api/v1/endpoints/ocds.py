@@ -1,6 +1,7 @@
 from typing import Any, List
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
+import logging
 
 from app.core.database import get_db
 from app.core.security import get_current_user
@@ -13,6 +14,9 @@ from app.schemas.ocds import (
     OCDSContract, OCDSContractCreate, OCDSParty, OCDSPartyCreate,
     OCDSTender, OCDSTenderCreate
 )
+from app.services.red_flag_engine import observe_peer_statistics
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -38,6 +42,13 @@ def create_ocds_contract_endpoint(
 ) -> Any:
     """Create new OCDS contract"""
     contract = create_ocds_contract(db, obj_in=contract_in)
+    record = {column.name: getattr(contract, column.name) for column in contract.__table__.columns}
+    try:
+        observe_peer_statistics(db, [record])
+    except Exception:
+        # The contract is already stored; POST /red-flags/statistics/rebuild/ocds_contracts catches up
+        db.rollback()
+        logger.exception("Could not update peer statistics with OCDS contract %s", record["id"])
     return contract
 
 
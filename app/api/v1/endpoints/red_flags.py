@@ -1,15 +1,35 @@
-from typing import Any, List
+from typing import Any, List, Optional
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.core.database import get_db
-from app.core.security import get_current_user
+from app.core.security import get_current_user, get_current_superuser
+from app.crud.detection_job import (
+    get_detection_job, enqueue_detection_job, enqueue_rescan_job, cancel_detection_job
+)
 from app.crud.red_flag import (
     get_red_flag, get_red_flags, create_red_flag, 
-    update_red_flag, delete_red_flag, get_red_flag_rules
+    update_red_flag, delete_red_flag, get_red_flag_rule, get_red_flag_rules
+)
+from app.schemas.red_flag import (
+    RedFlag, RedFlagCreate, RedFlagUpdate, RedFlagRule, RedFlagBatchDetectRequest,
+    DetectionJob, DetectionJobCreate
 )
-from app.schemas.red_flag import RedFlag, RedFlagCreate, RedFlagUpdate, RedFlagRule
-from app.services.red_flag_engine import RedFlagEngine
+from app.services.bid_screens import run_bid_rigging_screens
+from app.services.co_bidding import run_bid_rotation_detector
+from app.services.detection_cache import detection_cache
+from app.services.detection_jobs import detection_job_pool
+from app.services.organization_matching import run_related_suppliers_detector
+from app.services.red_flag_engine import RedFlagEngine, rebuild_peer_statistics
+from app.services.rule_profiler import rule_profiler
+from app.services.rule_pushdown import PUSHDOWN_TARGETS
+from app.services.rule_set import DATASET_RULE_TYPES, rule_set_registry
+from app.services.shadow_rules import shadow_evaluator
+from app.services.single_bidder import run_single_bidder_detector
+from app.services.split_purchases import run_split_purchase_detector
+from app.services.tender_timing import run_tender_timing_screens
+from app.services.value_screens import run_value_screens
 
 router = APIRouter()
 
@@ -104,14 +124,335 @@ def read_red_flag_rules(
     return rules
 
 
+# Report per-rule evaluation counters, hottest rules first
+@router.get("/rules/profile")
+def read_red_flag_rule_profile(
+    sort_by: str = "total_ms",
+    limit: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_superuser),
+) -> Any:
+    """Get per-rule evaluation counts, timings, match rates and errors, and the rules that failed to compile"""
+    try:
+        report = rule_profiler.report(sort_by=sort_by, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Reported whether or not profiling is enabled
+    report["invalid_rules"] = rule_set_registry.get(db).errors
+    return report
+
+
+# Reset the per-rule evaluation counters
+@router.delete("/rules/profile")
+def reset_red_flag_rule_profile(
+    current_user: Any = Depends(get_current_superuser),
+) -> Any:
+    """Reset per-rule evaluation counters"""
+    rule_profiler.reset()
+    return {"message": "Rule profile reset successfully"}
+
+
+# Report hit counters and evaluation cost of shadow rules on sampled traffic
+@router.get("/rules/shadow")
+def read_shadow_rule_stats(
+    current_user: Any = Depends(get_current_superuser),
+) -> Any:
+    """Get shadow rule match rates, overlap with production flags, timings and examples"""
+    return shadow_evaluator.report()
+
+
+# Reset the shadow rule counters
+@router.delete("/rules/shadow")
+def reset_shadow_rule_stats(
+    current_user: Any = Depends(get_current_superuser),
+) -> Any:
+    """Reset shadow rule counters"""
+    shadow_evaluator.reset()
+    return {"message": "Shadow rule stats reset successfully"}
+
+
+# Queue a re-scan of stored data with a single rule after it was added or edited
+@router.post("/rules/{rule_id}/rescan", response_model=DetectionJob, status_code=202)
+def rescan_red_flag_rule(
+    rule_id: int,
+    priority: int = 0,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_superuser),
+) -> Any:
+    """Re-evaluate one rule over stored data in a background job, retiring flags it no longer produces"""
+    rule = get_red_flag_rule(db, id=rule_id)
+    if rule is not None and rule.rule_type in DATASET_RULE_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Rule {rule_id} is evaluated by the {rule.rule_type} detector, not by re-scans"
+        )
+    if rule is not None and rule.rule_type == "composite":
+        raise HTTPException(
+            status_code=400,
+            detail=f"Rule {rule_id} combines other rules and is re-evaluated by detection jobs, not by re-scans"
+        )
+    job = enqueue_rescan_job(db, rule_id=rule_id, priority=priority, created_by=str(current_user.id))
+    detection_job_pool.ensure_started()
+    detection_job_pool.notify()
+    return job
+
+
 # Detect red flags in the provided data using the rule engine
 @router.post("/detect/")
 def detect_red_flags(
     data: dict,
+    persist: bool = False,
+    entity_type: Optional[str] = None,
+    entity_id: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: Any = Depends(get_current_user),
 ) -> Any:
-    """Detect red flags in given data"""
+    """Detect red flags in given data, optionally storing them for the given entity"""
+    if persist and not (entity_type and entity_id):
+        raise HTTPException(
+            status_code=400,
+            detail="entity_type and entity_id are required to persist red flags"
+        )
     engine = RedFlagEngine(db)
     results = engine.detect_red_flags(data)
-    return {"red_flags": results} 
\ No newline at end of file
+    if persist:
+        engine.persist_red_flags(entity_type, [(entity_id, results)])
+    shadow_evaluator.submit([data])
+    return {"red_flags": results}
+
+
+# Detect red flags in many records with a single request
+@router.post("/detect/batch")
+def detect_red_flags_batch(
+    batch_in: RedFlagBatchDetectRequest,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_user),
+) -> Any:
+    """Detect red flags in a batch of records, optionally storing them"""
+    if len(batch_in.records) > settings.DETECT_BATCH_MAX_RECORDS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds {settings.DETECT_BATCH_MAX_RECORDS} records"
+        )
+    if batch_in.persist:
+        if not batch_in.entity_type:
+            raise HTTPException(
+                status_code=400,
+                detail="entity_type is required to persist red flags"
+            )
+        if any(record.get(batch_in.id_field) is None for record in batch_in.records):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Every record needs '{batch_in.id_field}' to persist red flags"
+            )
+    engine = RedFlagEngine(db)
+    results = engine.detect_red_flags_batch(batch_in.records)
+    if batch_in.persist:
+        engine.persist_red_flags(batch_in.entity_type, [
+            (record[batch_in.id_field], flags)
+            for record, flags in zip(batch_in.records, results)
+        ])
+    shadow_evaluator.submit(batch_in.records)
+    return {
+        "ruleset_version": engine.ruleset_version,
+        "results": [{"red_flags": flags} for flags in results]
+    }
+
+
+# Detect red flags directly in stored OCDS tables
+@router.post("/detect/stored/{target}")
+def detect_red_flags_in_table(
+    target: str,
+    persist: bool = False,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_user),
+) -> Any:
+    """Detect red flags in a stored table, returning matching row IDs per rule, optionally storing them"""
+    if persist and not current_user.is_superuser:
+        # Storing flags rewrites them for the whole table, like a rule re-scan
+        raise HTTPException(
+            status_code=400, detail="The user doesn't have enough privileges to persist red flags"
+        )
+    engine = RedFlagEngine(db)
+    try:
+        matches = engine.detect_in_table(target, persist=persist)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {
+        "ruleset_version": engine.ruleset_version,
+        "target": target,
+        "matches": matches
+    }
+
+
+# Queue detection over a payload or a stored table, returning immediately
+@router.post("/detect/jobs", response_model=DetectionJob, status_code=202)
+def create_detection_job(
+    job_in: DetectionJobCreate,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_user),
+) -> Any:
+    """Submit a detection job to the background workers"""
+    if (job_in.records is None) == (job_in.target is None):
+        raise HTTPException(status_code=400, detail="Provide either records or a target table")
+    if job_in.target is not None and job_in.target not in PUSHDOWN_TARGETS:
+        raise HTTPException(status_code=404, detail=f"Unknown detection target: {job_in.target}")
+    if job_in.records is not None:
+        if len(job_in.records) > settings.DETECTION_JOB_MAX_RECORDS:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Job exceeds {settings.DETECTION_JOB_MAX_RECORDS} records"
+            )
+        if job_in.persist and not job_in.entity_type:
+            raise HTTPException(
+                status_code=400,
+                detail="entity_type is required to persist red flags"
+            )
+        if job_in.persist and any(record.get(job_in.id_field) is None for record in job_in.records):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Every record needs '{job_in.id_field}' to persist red flags"
+            )
+    job = enqueue_detection_job(db, obj_in=job_in, created_by=str(current_user.id))
+    detection_job_pool.ensure_started()
+    detection_job_pool.notify()
+    return job
+
+
+# Report the status, progress and results of a detection job
+@router.get("/detect/jobs/{job_id}", response_model=DetectionJob)
+def read_detection_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_user),
+) -> Any:
+    """Get detection job by ID"""
+    job = get_detection_job(db, id=job_id)
+    if not job:
+        raise HTTPException(
+            status_code=404,
+            detail="Detection job not found"
+        )
+    return job
+
+
+# Cancel a queued or running detection job
+@router.post("/detect/jobs/{job_id}/cancel", response_model=DetectionJob)
+def cancel_detection_job_endpoint(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_user),
+) -> Any:
+    """Cancel detection job, if submitted by the current user or as a superuser"""
+    job = get_detection_job(db, id=job_id)
+    if not job:
+        raise HTTPException(
+            status_code=404,
+            detail="Detection job not found"
+        )
+    if job.created_by != str(current_user.id) and not current_user.is_superuser:
+        raise HTTPException(
+            status_code=400,
+            detail="The user doesn't have enough privileges to cancel this job"
+        )
+    return cancel_detection_job(db, db_obj=job)
+
+
+# Recompute peer group statistics of statistical rules from a stored table
+@router.post("/statistics/rebuild/{target}")
+def rebuild_red_flag_statistics(
+    target: str,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_superuser),
+) -> Any:
+    """Rebuild peer group statistics from a stored table"""
+    try:
+        observed = rebuild_peer_statistics(db, target)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"target": target, "observed": observed}
+
+
+# Run the bid rigging screens over all tender responses
+@router.post("/screens/bid-rigging")
+def run_bid_rigging_screens_endpoint(
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_user),
+) -> Any:
+    """Evaluate bid_rigging rules on tender bid prices, storing flags on tender items"""
+    return run_bid_rigging_screens(db)
+
+
+# Flag single-bid tenders and buyers with a high share of them
+@router.post("/screens/single-bidder")
+def run_single_bidder_detector_endpoint(
+    full: bool = False,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_user),
+) -> Any:
+    """Recount bids of tenders changed since the last run and evaluate single_bidder rules"""
+    return run_single_bidder_detector(db, full=full)
+
+
+# Flag short tender periods and late contract amendments
+@router.post("/screens/tender-timing")
+def run_tender_timing_screens_endpoint(
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_user),
+) -> Any:
+    """Evaluate tender_timing rules on tender periods, publication dates and contract amendments"""
+    return run_tender_timing_screens(db)
+
+
+# Flag awards split to stay under an approval threshold
+@router.post("/screens/split-purchase")
+def run_split_purchase_detector_endpoint(
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_user),
+) -> Any:
+    """Evaluate split_purchase rules in one pass over awards sorted by buyer, supplier and date"""
+    return run_split_purchase_detector(db)
+
+
+# Flag supplier pairs that bid together and take turns winning
+@router.post("/screens/bid-rotation")
+def run_bid_rotation_detector_endpoint(
+    full: bool = False,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_user),
+) -> Any:
+    """Update the co-bidding graph from tenders changed since the last run and evaluate bid_rotation rules"""
+    return run_bid_rotation_detector(db, full=full)
+
+
+# Flag tenders bid on by near-duplicate suppliers
+@router.post("/screens/related-suppliers")
+def run_related_suppliers_detector_endpoint(
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_user),
+) -> Any:
+    """Find near-duplicate suppliers and evaluate related_suppliers rules on the tenders they bid on"""
+    return run_related_suppliers_detector(db)
+
+
+# Run the Benford and round-number screens over award and contract values
+@router.post("/screens/value-distribution")
+def run_value_screens_endpoint(
+    source: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(get_current_user),
+) -> Any:
+    """Rescore value distributions of one source table, or all of them, and evaluate value_distribution rules"""
+    try:
+        return run_value_screens(db, sources=[source] if source else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# Report detection cache hit/miss counters
+@router.get("/detect/cache")
+def read_detection_cache_stats(
+    current_user: Any = Depends(get_current_user),
+) -> Any:
+    """Get detection cache statistics"""
+    return detection_cache.stats()
@@ -27,6 +27,37 @@ class Settings(BaseSettings):
     # CORS settings
     ALLOWED_HOSTS: List[str] = ["*"]
     
+    # Red flag engine settings
+    RULESET_REFRESH_SECONDS: int = 60
+    DETECT_BATCH_MAX_RECORDS: int = 10000
+    DETECT_STREAM_CHUNK_SIZE: int = 1000
+    DETECTION_CACHE_MAX_ENTRIES: int = 100000  # 0 disables the cache
+    DETECTION_CACHE_TTL_SECONDS: int = 3600
+    SCAN_WORKERS: Optional[int] = None  # defaults to the CPU count
+    REGEX_MAX_INPUT_LENGTH: int = 10000  # characters of a field scanned by regex rules
+    RULE_PROFILING_ENABLED: bool = False  # per-rule timings, see GET /red-flags/rules/profile
+    RULE_PROFILE_SAMPLE_RATE: float = 0.1  # share of detection calls timed when profiling is enabled
+    RULE_PROFILE_WINDOW: int = 1000  # recent evaluations kept per rule for percentiles
+    SLOW_RULE_LOG_MS: Optional[float] = None  # log rules slower than this per record
+    DETECTION_JOB_WORKERS: int = 2  # in-process job workers; 0 when running run_detection_workers.py
+    DETECTION_JOB_MAX_RECORDS: int = 1000000
+    DETECTION_JOB_POLL_SECONDS: float = 2.0
+    DETECTION_JOB_STALE_SECONDS: int = 600  # requeue running jobs without progress for this long
+    SHADOW_SAMPLE_RATE: float = 0.05  # share of detected records also evaluated by shadow rules
+    SHADOW_QUEUE_SIZE: int = 1000  # sampled batches waiting; further samples are dropped
+    SHADOW_EXAMPLES: int = 20  # recent matching records kept per shadow rule
+    DETECTOR_WATERMARK_OVERLAP_SECONDS: int = 300  # re-read rows this much older than an incremental watermark
+    CONCENTRATION_MIN_AWARDS: int = 5  # buyers with fewer awards get no competition risk
+    VALUE_SCREEN_ROUND_UNIT: float = 1000.0  # values that are multiples of this count as round
+    VALUE_SCREEN_THRESHOLDS: List[float] = []  # approval thresholds screened for values bunching just below
+    VALUE_SCREEN_THRESHOLD_MARGIN: float = 0.1  # relative width of the bands below and above a threshold
+    ORG_MINHASH_BANDS: int = 32  # LSH bands; rebuild the organization index after changing either
+    ORG_MINHASH_ROWS: int = 6  # MinHash values per band
+    ORG_LSH_MAX_BUCKET_SIZE: int = 100  # larger buckets, e.g. of generic names, yield no duplicate pairs
+    ORG_DUPLICATE_SIMILARITY: float = 0.85  # string similarity from which two organizations are duplicates
+    CO_BIDDING_MAX_BIDDERS: int = 50  # tenders with more bidders add no co-bidding edges
+    CO_BIDDING_MIN_TENDERS: int = 3  # shared tenders for two suppliers to be linked in clusters
+    
     # Logging
     LOG_LEVEL: str = "INFO"
     
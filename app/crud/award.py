@@ -1,3 +1,4 @@
+import logging
 from typing import Optional, List
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
@@ -9,6 +10,9 @@ from app.schemas.award import (
     AwardEvaluationCreate, AwardEvaluationUpdate,
     AwardApprovalCreate, AwardApprovalUpdate
 )
+from app.services.supplier_concentration import AwardContribution, apply_award_change, award_contribution
+
+logger = logging.getLogger(__name__)
 
 
 class CRUDAwardItem(CRUDBase[AwardItem, AwardItemCreate, AwardItemUpdate]):
@@ -113,6 +117,21 @@ award_item = CRUDAwardItem(AwardItem)
 award_evaluation = CRUDAwardEvaluation(AwardEvaluation)
 award_approval = CRUDAwardApproval(AwardApproval)
 
+
+def _update_concentration(
+    db: Session,
+    award_id: str,
+    before: Optional[AwardContribution],
+    after: Optional[AwardContribution]
+) -> None:
+    try:
+        apply_award_change(db, before, after)
+    except Exception:
+        # The award is already stored; POST /analytics/concentration/rebuild catches up
+        db.rollback()
+        logger.exception("Could not update supplier concentration with award item %s", award_id)
+
+
 # Convenience functions for AwardItem
 def get_award_item(db: Session, id: str) -> Optional[AwardItem]:
     return award_item.get(db, id=id)
@@ -123,15 +142,24 @@ def get_award_items(db: Session, skip: int = 0, limit: int = 100) -> List[AwardI
 
 
 def create_award_item(db: Session, *, obj_in: AwardItemCreate) -> AwardItem:
-    return award_item.create(db, obj_in=obj_in)
+    award = award_item.create(db, obj_in=obj_in)
+    _update_concentration(db, award.id, None, award_contribution(db, award))
+    return award
 
 
 def update_award_item(db: Session, *, db_obj: AwardItem, obj_in: AwardItemUpdate) -> AwardItem:
-    return award_item.update(db, db_obj=db_obj, obj_in=obj_in)
+    before = award_contribution(db, db_obj)
+    award = award_item.update(db, db_obj=db_obj, obj_in=obj_in)
+    _update_concentration(db, award.id, before, award_contribution(db, award))
+    return award
 
 
 def delete_award_item(db: Session, *, id: str) -> AwardItem:
-    return award_item.remove(db, id=id)
+    award = award_item.get(db, id=id)
+    before = award_contribution(db, award) if award is not None else None
+    award = award_item.remove(db, id=id)
+    _update_concentration(db, id, before, None)
+    return award
 
 
 def get_award_items_by_contracting_process(db: Session, *, contracting_process_id: str, skip: int = 0, limit: int = 100) -> List[AwardItem]:
@@ -0,0 +1,158 @@
+from typing import List, Optional
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from app.crud.base import CRUDBase
+from app.models.red_flag import DetectionJob
+from app.schemas.red_flag import DetectionJobCreate
+
+
+class CRUDDetectionJob(CRUDBase[DetectionJob, DetectionJobCreate, DetectionJobCreate]):
+    """CRUD operations for DetectionJob model, doubling as the job queue"""
+
+    def enqueue(self, db: Session, *, obj_in: DetectionJobCreate, created_by: Optional[str] = None) -> DetectionJob:
+        """Queue a new detection job"""
+        job = DetectionJob(
+            status="queued",
+            priority=obj_in.priority,
+            target=obj_in.target,
+            records=obj_in.records,
+            persist=obj_in.persist,
+            entity_type=obj_in.target or obj_in.entity_type,
+            id_field=obj_in.id_field,
+            total=len(obj_in.records) if obj_in.records is not None else None,
+            processed=0,
+            flagged=0,
+            cancel_requested=False,
+            created_by=created_by,
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    def enqueue_rescan(
+        self,
+        db: Session,
+        *,
+        rule_id: int,
+        priority: int = 0,
+        created_by: Optional[str] = None
+    ) -> DetectionJob:
+        """Queue a re-scan of the stored tables with one rule"""
+        job = DetectionJob(
+            status="queued",
+            priority=priority,
+            rescan_rule_id=rule_id,
+            persist=True,
+            processed=0,
+            flagged=0,
+            cancel_requested=False,
+            created_by=created_by,
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    def get_by_status(self, db: Session, *, status: str) -> List[DetectionJob]:
+        """Get detection jobs by status"""
+        return db.query(DetectionJob).filter(DetectionJob.status == status).all()
+
+    def claim_next(self, db: Session, *, worker: str) -> Optional[DetectionJob]:
+        """
+        Mark the highest priority, oldest queued job as running for a worker.
+        The status check in the UPDATE makes the claim atomic across workers.
+        """
+        while True:
+            job_id = db.query(DetectionJob.id).filter(
+                DetectionJob.status == "queued"
+            ).order_by(DetectionJob.priority.desc(), DetectionJob.id).limit(1).scalar()
+            if job_id is None:
+                db.rollback()
+                return None
+
+            claimed = db.query(DetectionJob).filter(
+                DetectionJob.id == job_id,
+                DetectionJob.status == "queued"
+            ).update({
+                DetectionJob.status: "running",
+                DetectionJob.worker: worker,
+                DetectionJob.started_at: func.now(),
+                DetectionJob.updated_at: func.now(),
+            }, synchronize_session=False)
+            db.commit()
+            if claimed:
+                return self.get(db, id=job_id)
+
+    def request_cancel(self, db: Session, *, db_obj: DetectionJob) -> DetectionJob:
+        """Cancel a queued job at once, or ask the worker running it to stop"""
+        cancelled = db.query(DetectionJob).filter(
+            DetectionJob.id == db_obj.id,
+            DetectionJob.status == "queued"
+        ).update({
+            DetectionJob.status: "cancelled",
+            DetectionJob.finished_at: func.now(),
+        }, synchronize_session=False)
+        if not cancelled:
+            db.query(DetectionJob).filter(
+                DetectionJob.id == db_obj.id,
+                DetectionJob.status == "running"
+            ).update({DetectionJob.cancel_requested: True}, synchronize_session=False)
+        db.commit()
+        db.refresh(db_obj)
+        return db_obj
+
+    def requeue_stale(self, db: Session, *, stale_seconds: int) -> int:
+        """Return running jobs without progress for stale_seconds, e.g. after a worker died, to the queue"""
+        cutoff = datetime.utcnow() - timedelta(seconds=stale_seconds)
+        requeued = db.query(DetectionJob).filter(
+            DetectionJob.status == "running",
+            func.coalesce(DetectionJob.updated_at, DetectionJob.started_at) < cutoff
+        ).update({
+            DetectionJob.status: "queued",
+            DetectionJob.worker: None,
+            DetectionJob.processed: 0,
+            DetectionJob.flagged: 0,
+        }, synchronize_session=False)
+        db.commit()
+        return requeued
+
+
+# Create CRUD instance
+detection_job = CRUDDetectionJob(DetectionJob)
+
+# Convenience functions for DetectionJob
+def get_detection_job(db: Session, id: int) -> Optional[DetectionJob]:
+    return detection_job.get(db, id=id)
+
+
+def get_detection_jobs(db: Session, skip: int = 0, limit: int = 100):
+    return detection_job.get_multi(db, skip=skip, limit=limit)
+
+
+def enqueue_detection_job(db: Session, *, obj_in: DetectionJobCreate, created_by: Optional[str] = None) -> DetectionJob:
+    return detection_job.enqueue(db, obj_in=obj_in, created_by=created_by)
+
+
+def enqueue_rescan_job(
+    db: Session,
+    *,
+    rule_id: int,
+    priority: int = 0,
+    created_by: Optional[str] = None
+) -> DetectionJob:
+    return detection_job.enqueue_rescan(db, rule_id=rule_id, priority=priority, created_by=created_by)
+
+
+def claim_detection_job(db: Session, *, worker: str) -> Optional[DetectionJob]:
+    return detection_job.claim_next(db, worker=worker)
+
+
+def cancel_detection_job(db: Session, *, db_obj: DetectionJob) -> DetectionJob:
+    return detection_job.request_cancel(db, db_obj=db_obj)
+
+
+def requeue_stale_detection_jobs(db: Session, *, stale_seconds: int) -> int:
+    return detection_job.requeue_stale(db, stale_seconds=stale_seconds)
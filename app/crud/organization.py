@@ -1,9 +1,12 @@
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
+from sqlalchemy import delete
 from sqlalchemy.orm import Session
 
 from app.crud.base import CRUDBase
 from app.models.organization import Organization
+from app.models.risk_analytics import OrganizationLshBucket
 from app.schemas.organization import OrganizationCreate, OrganizationUpdate
+from app.services.organization_matching import find_similar_organizations, index_organization
 
 
 class CRUDOrganization(CRUDBase[Organization, OrganizationCreate, OrganizationUpdate]):
@@ -43,16 +46,28 @@ def get_organizations(db: Session, skip: int = 0, limit: int = 100) -> List[Orga
 
 
 def create_organization(db: Session, *, obj_in: OrganizationCreate) -> Organization:
-    return organization.create(db, obj_in=obj_in)
+    db_obj = organization.create(db, obj_in=obj_in)
+    index_organization(db, db_obj)
+    db.commit()
+    return db_obj
 
 
 def update_organization(db: Session, *, db_obj: Organization, obj_in: OrganizationUpdate) -> Organization:
-    return organization.update(db, db_obj=db_obj, obj_in=obj_in)
+    db_obj = organization.update(db, db_obj=db_obj, obj_in=obj_in)
+    if obj_in.name is not None or obj_in.address is not None:
+        index_organization(db, db_obj)
+        db.commit()
+    return db_obj
 
 
 def delete_organization(db: Session, *, id: str) -> Organization:
+    db.execute(delete(OrganizationLshBucket).where(OrganizationLshBucket.organization_id == id))
     return organization.remove(db, id=id)
 
 
+def get_similar_organizations(db: Session, *, db_obj: Organization, limit: int = 20) -> List[Dict[str, Any]]:
+    return find_similar_organizations(db, db_obj.name, db_obj.address, exclude_id=db_obj.id, limit=limit)
+
+
 def get_organizations_by_type(db: Session, *, organization_type: str, skip: int = 0, limit: int = 100) -> List[Organization]:
     return organization.get_organizations_by_type(db, organization_type=organization_type, skip=skip, limit=limit) 
\ No newline at end of file
@@ -1,9 +1,13 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
+from sqlalchemy import and_, or_
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
 
 from app.crud.base import CRUDBase
 from app.models.red_flag import RedFlag, RedFlagRule
 from app.schemas.red_flag import RedFlagCreate, RedFlagUpdate, RedFlagRuleCreate, RedFlagRuleUpdate
+from app.services.rule_set import rule_set_registry, shadow_rule_set_registry
 
 
 class CRUDRedFlag(CRUDBase[RedFlag, RedFlagCreate, RedFlagUpdate]):
@@ -21,6 +25,99 @@ class CRUDRedFlag(CRUDBase[RedFlag, RedFlagCreate, RedFlagUpdate]):
         """Get active red flags"""
         return db.query(RedFlag).filter(RedFlag.is_active == True).all()
 
+    def upsert_detected(
+        self, db: Session, *, objs_in: List[Dict[str, Any]], chunk_size: int = 500, commit: bool = True
+    ) -> int:
+        """
+        Bulk insert detected red flags, one INSERT per chunk. Flags already
+        stored for the same (rule_id, entity_type, entity_id, rule_version)
+        are refreshed and re-activated instead of duplicated.
+        """
+        # The same key twice in one statement is rejected by ON CONFLICT
+        rows = list({
+            (obj["rule_id"], obj["entity_type"], obj["entity_id"], obj["rule_version"]): obj
+            for obj in objs_in
+        }.values())
+        dialect = db.get_bind().dialect.name
+
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            if dialect in ("sqlite", "postgresql"):
+                insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+                stmt = insert(RedFlag).values(chunk)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["rule_id", "entity_type", "entity_id", "rule_version"],
+                    set_={
+                        "severity": stmt.excluded.severity,
+                        "confidence_score": stmt.excluded.confidence_score,
+                        "is_active": True,
+                        "updated_at": func.now(),
+                    }
+                )
+                db.execute(stmt)
+            else:
+                self._upsert_portable(db, chunk)
+        if commit:
+            db.commit()
+        return len(rows)
+
+    def deactivate_for_rule(self, db: Session, *, rule_id: int, entity_type: str) -> int:
+        """Deactivate every active flag a rule produced for an entity type, without committing"""
+        return db.query(RedFlag).filter(
+            RedFlag.rule_id == rule_id,
+            RedFlag.entity_type == entity_type,
+            RedFlag.is_active == True
+        ).update({RedFlag.is_active: False}, synchronize_session=False)
+
+    def deactivate_stale_for_rule(
+        self,
+        db: Session,
+        *,
+        rule_id: int,
+        rule_version: Optional[str],
+        exclude_entity_types: List[str]
+    ) -> int:
+        """
+        Deactivate the rule's active flags from revisions other than
+        rule_version (all of them when None) on entity types outside
+        exclude_entity_types, without committing
+        """
+        query = db.query(RedFlag).filter(
+            RedFlag.rule_id == rule_id,
+            RedFlag.entity_type.notin_(exclude_entity_types),
+            RedFlag.is_active == True
+        )
+        if rule_version is not None:
+            query = query.filter(RedFlag.rule_version.is_distinct_from(rule_version))
+        return query.update({RedFlag.is_active: False}, synchronize_session=False)
+
+    def _upsert_portable(self, db: Session, rows: List[Dict[str, Any]]) -> None:
+        """Upsert for dialects without ON CONFLICT: update known keys, bulk insert the rest"""
+        key_filter = or_(*[
+            and_(
+                RedFlag.rule_id == row["rule_id"],
+                RedFlag.entity_type == row["entity_type"],
+                RedFlag.entity_id == row["entity_id"],
+                RedFlag.rule_version == row["rule_version"],
+            )
+            for row in rows
+        ])
+        existing = {
+            (flag.rule_id, flag.entity_type, flag.entity_id, flag.rule_version): flag
+            for flag in db.query(RedFlag).filter(key_filter)
+        }
+        new_rows = []
+        for row in rows:
+            flag = existing.get((row["rule_id"], row["entity_type"], row["entity_id"], row["rule_version"]))
+            if flag is None:
+                new_rows.append(row)
+            else:
+                flag.severity = row["severity"]
+                flag.confidence_score = row["confidence_score"]
+                flag.is_active = True
+        if new_rows:
+            db.execute(RedFlag.__table__.insert(), new_rows)
+
 
 class CRUDRedFlagRule(CRUDBase[RedFlagRule, RedFlagRuleCreate, RedFlagRuleUpdate]):
     """CRUD operations for RedFlagRule model"""
@@ -30,8 +127,18 @@ class CRUDRedFlagRule(CRUDBase[RedFlagRule, RedFlagRuleCreate, RedFlagRuleUpdate
         return db.query(RedFlagRule).filter(RedFlagRule.rule_type == rule_type).all()
 
     def get_active(self, db: Session) -> List[RedFlagRule]:
-        """Get active red flag rules"""
-        return db.query(RedFlagRule).filter(RedFlagRule.is_active == True).all()
+        """Get active red flag rules, excluding shadow rules"""
+        return db.query(RedFlagRule).filter(
+            RedFlagRule.is_active == True,
+            RedFlagRule.shadow.isnot(True)
+        ).all()
+
+    def get_shadow(self, db: Session) -> List[RedFlagRule]:
+        """Get active shadow rules"""
+        return db.query(RedFlagRule).filter(
+            RedFlagRule.is_active == True,
+            RedFlagRule.shadow == True
+        ).all()
 
 
 # Create CRUD instances
@@ -71,6 +178,26 @@ def get_active_red_flags(db: Session) -> List[RedFlag]:
     return red_flag.get_active(db)
 
 
+def upsert_detected_red_flags(db: Session, *, objs_in: List[Dict[str, Any]], commit: bool = True) -> int:
+    return red_flag.upsert_detected(db, objs_in=objs_in, commit=commit)
+
+
+def deactivate_red_flags_for_rule(db: Session, *, rule_id: int, entity_type: str) -> int:
+    return red_flag.deactivate_for_rule(db, rule_id=rule_id, entity_type=entity_type)
+
+
+def deactivate_stale_red_flags_for_rule(
+    db: Session,
+    *,
+    rule_id: int,
+    rule_version: Optional[str],
+    exclude_entity_types: List[str]
+) -> int:
+    return red_flag.deactivate_stale_for_rule(
+        db, rule_id=rule_id, rule_version=rule_version, exclude_entity_types=exclude_entity_types
+    )
+
+
 # Convenience functions for RedFlagRule
 def get_red_flag_rule(db: Session, id: int) -> Optional[RedFlagRule]:
     return red_flag_rule.get(db, id=id)
@@ -81,15 +208,24 @@ def get_red_flag_rules(db: Session, skip: int = 0, limit: int = 100):
 
 
 def create_red_flag_rule(db: Session, *, obj_in: RedFlagRuleCreate) -> RedFlagRule:
-    return red_flag_rule.create(db, obj_in=obj_in)
+    rule = red_flag_rule.create(db, obj_in=obj_in)
+    rule_set_registry.invalidate()
+    shadow_rule_set_registry.invalidate()
+    return rule
 
 
 def update_red_flag_rule(db: Session, *, db_obj: RedFlagRule, obj_in: RedFlagRuleUpdate) -> RedFlagRule:
-    return red_flag_rule.update(db, db_obj=db_obj, obj_in=obj_in)
+    rule = red_flag_rule.update(db, db_obj=db_obj, obj_in=obj_in)
+    rule_set_registry.invalidate()
+    shadow_rule_set_registry.invalidate()
+    return rule
 
 
 def delete_red_flag_rule(db: Session, *, id: int) -> RedFlagRule:
-    return red_flag_rule.remove(db, id=id)
+    rule = red_flag_rule.remove(db, id=id)
+    rule_set_registry.invalidate()
+    shadow_rule_set_registry.invalidate()
+    return rule
 
 
 def get_red_flag_rules_by_type(db: Session, *, rule_type: str) -> List[RedFlagRule]:
@@ -97,4 +233,8 @@ def get_red_flag_rules_by_type(db: Session, *, rule_type: str) -> List[RedFlagRu
 
 
 def get_active_red_flag_rules(db: Session) -> List[RedFlagRule]:
-    return red_flag_rule.get_active(db) 
\ No newline at end of file
+    return red_flag_rule.get_active(db)
+
+
+def get_shadow_red_flag_rules(db: Session) -> List[RedFlagRule]:
+    return red_flag_rule.get_shadow(db)
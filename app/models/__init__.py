@@ -2,7 +2,7 @@
 
 # Import all models to ensure they are registered with SQLAlchemy
 from .user import User
-from .red_flag import RedFlag, RedFlagRule
+from .red_flag import RedFlag, RedFlagRule, DetectionJob
 from .ocds import OCDSContract, OCDSParty, OCDSTender
 from .organization import Organization
 from .contracting_process import ContractingProcess
@@ -27,7 +27,9 @@ from .implementation import (
     ImplementationStatus
 )
 from .risk_analytics import (
-    RiskProfile, PolicyRule, AnalyticsEvent, AuditLog, RiskAssessment
+    RiskProfile, PolicyRule, AnalyticsEvent, AuditLog, RiskAssessment, PeerGroupStatistic,
+    DetectorState, TenderCompetition, BuyerSupplierTotal, BuyerConcentration, ValueDistributionScore,
+    OrganizationLshBucket, CoBiddingTender, SupplierCoBid
 )
 
 # Export all models
@@ -36,7 +38,7 @@ __all__ = [
     "User", "Organization", "ContractingProcess",
     
     # Red flag models
-    "RedFlag", "RedFlagRule",
+    "RedFlag", "RedFlagRule", "DetectionJob",
     
     # OCDS models
     "OCDSContract", "OCDSParty", "OCDSTender",
@@ -57,7 +59,9 @@ __all__ = [
     "ImplementationItem", "ImplementationDeliverable", "ImplementationIssue", "ImplementationResource",
     
     # Risk and analytics models
-    "RiskProfile", "PolicyRule", "AnalyticsEvent", "AuditLog", "RiskAssessment",
+    "RiskProfile", "PolicyRule", "AnalyticsEvent", "AuditLog", "RiskAssessment", "PeerGroupStatistic",
+    "DetectorState", "TenderCompetition", "BuyerSupplierTotal", "BuyerConcentration", "ValueDistributionScore",
+    "OrganizationLshBucket", "CoBiddingTender", "SupplierCoBid",
     
     # Enums
     "PlanningStatus", "TenderStatus", "AwardStatus", "ContractStatus", "ImplementationStatus", 
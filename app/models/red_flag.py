@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Float, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, Float, Boolean, ForeignKey, UniqueConstraint, JSON, Index
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
 
@@ -6,6 +7,11 @@ from app.core.database import Base
 class RedFlag(Base):
     """Red Flag model"""
     __tablename__ = "red_flags"
+    __table_args__ = (
+        # One flag per rule revision and flagged entity, so re-scans upsert
+        UniqueConstraint("rule_id", "entity_type", "entity_id", "rule_version",
+                         name="uq_red_flags_detection"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
@@ -14,10 +20,18 @@ class RedFlag(Base):
     confidence_score = Column(Float, nullable=False)
     category = Column(String, nullable=False)
     source = Column(String, nullable=False)
+    rule_id = Column(Integer, ForeignKey("red_flag_rules.id"), index=True)
+    rule_version = Column(String)
+    entity_type = Column(String)  # e.g. ocds_contracts, contracting_processes
+    entity_id = Column(String)
+    contracting_process_id = Column(String, ForeignKey("contracting_processes.id"))
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # Relationships
+    contracting_process = relationship("ContractingProcess", back_populates="red_flags")
+
 
 class RedFlagRule(Base):
     """Red Flag Rule model"""
@@ -29,5 +43,37 @@ class RedFlagRule(Base):
     rule_type = Column(String, nullable=False)  # pattern, threshold, anomaly
     parameters = Column(Text, nullable=False)  # JSON string
     is_active = Column(Boolean, default=True)
+    shadow = Column(Boolean, default=False)  # evaluated on sampled traffic only, never reported
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+class DetectionJob(Base):
+    """Queued red flag detection job"""
+    __tablename__ = "detection_jobs"
+    __table_args__ = (
+        # Workers claim the highest priority, oldest queued job first
+        Index("ix_detection_jobs_queue", "status", "priority", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String, nullable=False, default="queued")  # queued, running, completed, failed, cancelled
+    priority = Column(Integer, nullable=False, default=0)  # higher runs first
+    target = Column(String)  # stored table to scan, when no records were submitted
+    rescan_rule_id = Column(Integer)  # rule whose flags the job re-scans, instead of detecting
+    records = Column(JSON)  # submitted records
+    persist = Column(Boolean, default=False)
+    entity_type = Column(String)
+    id_field = Column(String, default="id")
+    total = Column(Integer)
+    processed = Column(Integer, default=0)
+    flagged = Column(Integer, default=0)
+    results = Column(JSON)  # flags of every flagged record
+    error = Column(Text)
+    cancel_requested = Column(Boolean, default=False)
+    worker = Column(String)
+    created_by = Column(String)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now()) 
\ No newline at end of file
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, JSON
+from sqlalchemy import BigInteger, Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, JSON, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -81,4 +81,134 @@ class RiskAssessment(Base):
     overall_risk_level = Column(String)  # LOW, MEDIUM, HIGH, CRITICAL
     notes = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now()) 
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+class PeerGroupStatistic(Base):
+    """Running statistics of a field within a peer group, for statistical red flag rules"""
+    __tablename__ = "peer_group_statistics"
+    __table_args__ = (
+        UniqueConstraint("field", "group_by", "group_value", name="uq_peer_group_statistics_group"),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    field = Column(String, nullable=False)
+    group_by = Column(String, nullable=False)  # empty string for the global group
+    group_value = Column(String, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    mean = Column(Float, nullable=False, default=0.0)
+    m2 = Column(Float, nullable=False, default=0.0)  # Welford sum of squared deviations
+    median_sketch = Column(JSON)  # P-square estimator state for the median
+    deviation_sketch = Column(JSON)  # P-square estimator state for the median absolute deviation
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class DetectorState(Base):
+    """Progress of an incremental red flag detector"""
+    __tablename__ = "detector_states"
+    
+    detector = Column(String, primary_key=True)
+    watermark = Column(DateTime(timezone=True))  # rows created or updated before this were processed
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class TenderCompetition(Base):
+    """Number of bids per tender, maintained by the single bidder detector"""
+    __tablename__ = "tender_competition"
+    
+    tender_item_id = Column(String, ForeignKey("tender_items.id"), primary_key=True)
+    buyer_id = Column(String, index=True)
+    procurement_method = Column(String)
+    status = Column(String)
+    submission_deadline = Column(DateTime)
+    bids = Column(Integer, nullable=False, default=0)
+
+
+class BuyerSupplierTotal(Base):
+    """Running sum of a buyer's award values per supplier, for supplier concentration"""
+    __tablename__ = "buyer_supplier_totals"
+    __table_args__ = (
+        UniqueConstraint("buyer_id", "procurement_method", "supplier_id", name="uq_buyer_supplier_totals"),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    buyer_id = Column(String, nullable=False)
+    procurement_method = Column(String, nullable=False)  # empty string for all methods
+    supplier_id = Column(String, nullable=False)
+    total = Column(Float, nullable=False, default=0.0)
+    awards = Column(Integer, nullable=False, default=0)
+
+
+class BuyerConcentration(Base):
+    """Herfindahl-Hirschman index of a buyer's awards over its suppliers"""
+    __tablename__ = "buyer_concentration"
+    __table_args__ = (
+        UniqueConstraint("buyer_id", "procurement_method", name="uq_buyer_concentration"),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    buyer_id = Column(String, nullable=False)
+    procurement_method = Column(String, nullable=False)  # empty string for all methods
+    total = Column(Float, nullable=False, default=0.0)
+    sum_squares = Column(Float, nullable=False, default=0.0)  # sum of squared supplier totals
+    awards = Column(Integer, nullable=False, default=0)
+    suppliers = Column(Integer, nullable=False, default=0)
+    top_supplier_id = Column(String)
+    top_supplier_total = Column(Float, nullable=False, default=0.0)
+    hhi = Column(Float, nullable=False, default=0.0)  # 0 to 10,000
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class ValueDistributionScore(Base):
+    """Benford and round-number screens of the values awarded by or to one entity"""
+    __tablename__ = "value_distribution_scores"
+    __table_args__ = (
+        UniqueConstraint("source", "group_by", "entity_id", name="uq_value_distribution_scores_entity"),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    source = Column(String, nullable=False)  # table the values come from
+    group_by = Column(String, nullable=False)  # empty string for all values
+    entity_id = Column(String, nullable=False)
+    value_count = Column(Integer, nullable=False, default=0)
+    benford_count = Column(Integer, nullable=False, default=0)  # values of 10 or more, tested against Benford
+    first_digit_chi2 = Column(Float)
+    first_digit_mad = Column(Float)
+    first_two_chi2 = Column(Float)
+    first_two_mad = Column(Float)
+    round_share = Column(Float)
+    below_threshold_share = Column(Float)  # of values near an approval threshold, the share just below it
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class OrganizationLshBucket(Base):
+    """MinHash band bucket of an organization's name and address, for near-duplicate lookups"""
+    __tablename__ = "organization_lsh_buckets"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    organization_id = Column(String, ForeignKey("organizations.id"), nullable=False, index=True)
+    bucket = Column(BigInteger, nullable=False, index=True)  # hash of one band of the MinHash signature
+
+
+class CoBiddingTender(Base):
+    """Suppliers and winners of a tender as last counted into the co-bidding graph"""
+    __tablename__ = "co_bidding_tenders"
+    
+    tender_item_id = Column(String, ForeignKey("tender_items.id"), primary_key=True)
+    suppliers = Column(JSON, nullable=False)  # sorted supplier IDs
+    winners = Column(JSON, nullable=False)  # sorted supplier IDs with an award
+
+
+class SupplierCoBid(Base):
+    """Edge of the supplier co-bidding graph: tenders two suppliers both bid on, and who won them"""
+    __tablename__ = "supplier_co_bids"
+    __table_args__ = (
+        UniqueConstraint("supplier_id", "partner_id", name="uq_supplier_co_bids_pair"),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    supplier_id = Column(String, nullable=False)  # the lower of the two IDs
+    partner_id = Column(String, nullable=False, index=True)
+    tenders = Column(Integer, nullable=False, default=0)
+    supplier_wins = Column(Integer, nullable=False, default=0)
+    partner_wins = Column(Integer, nullable=False, default=0)
@@ -6,7 +6,8 @@ from .user import (
 )
 from .red_flag import (
     RedFlagBase, RedFlagCreate, RedFlagUpdate, RedFlagInDB, RedFlag,
-    RedFlagRuleBase, RedFlagRuleCreate, RedFlagRuleUpdate, RedFlagRuleInDB, RedFlagRule
+    RedFlagRuleBase, RedFlagRuleCreate, RedFlagRuleUpdate, RedFlagRuleInDB, RedFlagRule,
+    RedFlagBatchDetectRequest, DetectionJobCreate, DetectionJob
 )
 from .ocds import (
     OCDSContractBase, OCDSContractCreate, OCDSContractUpdate, OCDSContractInDB, OCDSContract,
@@ -70,6 +71,7 @@ __all__ = [
     # Red flag schemas
     "RedFlagBase", "RedFlagCreate", "RedFlagUpdate", "RedFlagInDB", "RedFlag",
     "RedFlagRuleBase", "RedFlagRuleCreate", "RedFlagRuleUpdate", "RedFlagRuleInDB", "RedFlagRule",
+    "RedFlagBatchDetectRequest", "DetectionJobCreate", "DetectionJob",
     
     # OCDS schemas
     "OCDSContractBase", "OCDSContractCreate", "OCDSContractUpdate", "OCDSContractInDB", "OCDSContract",
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
 
@@ -11,6 +11,11 @@ class RedFlagBase(BaseModel):
     confidence_score: float
     category: str
     source: str
+    rule_id: Optional[int] = None
+    rule_version: Optional[str] = None
+    entity_type: Optional[str] = None
+    entity_id: Optional[str] = None
+    contracting_process_id: Optional[str] = None
     is_active: bool = True
 
 
@@ -57,6 +62,7 @@ class RedFlagRuleBase(BaseModel):
     rule_type: str  # pattern, threshold, anomaly
     parameters: str  # JSON string
     is_active: bool = True
+    shadow: bool = False
 
 
 class RedFlagRuleCreate(RedFlagRuleBase):
@@ -71,6 +77,7 @@ class RedFlagRuleUpdate(BaseModel):
     rule_type: Optional[str] = None
     parameters: Optional[str] = None
     is_active: Optional[bool] = None
+    shadow: Optional[bool] = None
 
 
 class RedFlagRuleInDB(RedFlagRuleBase):
@@ -90,4 +97,45 @@ class RedFlagRule(RedFlagRuleBase):
     updated_at: Optional[datetime] = None
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+
+class RedFlagBatchDetectRequest(BaseModel):
+    """Schema for batch red flag detection"""
+    records: List[Dict[str, Any]]
+    persist: bool = False
+    entity_type: Optional[str] = None
+    id_field: str = "id"  # record field holding the entity ID when persisting
+
+
+class DetectionJobCreate(BaseModel):
+    """Schema for submitting a detection job over records or a stored table"""
+    records: Optional[List[Dict[str, Any]]] = None
+    target: Optional[str] = None  # stored table to scan instead of records
+    persist: bool = False
+    entity_type: Optional[str] = None
+    id_field: str = "id"
+    priority: int = 0
+
+
+class DetectionJob(BaseModel):
+    """Schema for detection job status"""
+    id: int
+    status: str
+    priority: int
+    target: Optional[str] = None
+    rescan_rule_id: Optional[int] = None
+    persist: bool
+    entity_type: Optional[str] = None
+    total: Optional[int] = None
+    processed: int
+    flagged: int
+    results: Optional[List[Dict[str, Any]]] = None
+    error: Optional[str] = None
+    cancel_requested: bool
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
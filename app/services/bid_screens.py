@@ -0,0 +1,167 @@
+from typing import Any, Dict, Iterator, List, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import numpy as np
+
+from app.core.config import settings
+from app.models.tender import TenderResponse
+from app.services.dataset_rules import DatasetRule, load_dataset_rules, replace_dataset_flags
+from app.services.rule_set import THRESHOLD_OPERATORS
+
+# Screens computed per tender from its bid prices
+BID_STATISTICS = ("bids", "cv", "relative_distance", "spread", "skewness", "kurtosis")
+
+# Flags of bid rigging rules are attached to tender items
+BID_ENTITY_TYPE = "tender_items"
+
+
+def iter_bid_groups(
+    db: Session,
+    chunk_size: int = settings.DETECT_STREAM_CHUNK_SIZE
+) -> Iterator[Tuple[List[str], np.ndarray, np.ndarray]]:
+    """
+    Stream bid prices grouped per tender and currency with one ordered query.
+
+    Yields (tender IDs, bid counts, prices) for many complete tenders at a
+    time, prices sorted ascending within each tender. Withdrawn responses and
+    missing or non-positive prices are left out.
+    """
+    stmt = (
+        select(TenderResponse.tender_item_id, TenderResponse.currency_code, TenderResponse.price)
+        .where(
+            TenderResponse.tender_item_id.isnot(None),
+            TenderResponse.price > 0,
+            TenderResponse.status.is_distinct_from("WITHDRAWN")
+        )
+        .order_by(TenderResponse.tender_item_id, TenderResponse.currency_code, TenderResponse.price)
+        .execution_options(yield_per=chunk_size)
+    )
+    tender_ids: List[str] = []
+    counts: List[int] = []
+    prices: List[float] = []
+    last_key = None
+    for rows in db.execute(stmt).partitions(chunk_size):
+        for tender_id, currency, price in rows:
+            if (tender_id, currency) != last_key:
+                # A new group: everything before it is complete
+                if len(prices) >= chunk_size:
+                    yield tender_ids, np.array(counts), np.array(prices, dtype=float)
+                    tender_ids, counts, prices = [], [], []
+                last_key = (tender_id, currency)
+                tender_ids.append(tender_id)
+                counts.append(0)
+            counts[-1] += 1
+            prices.append(price)
+    if prices:
+        yield tender_ids, np.array(counts), np.array(prices, dtype=float)
+
+
+def bid_statistics(counts: np.ndarray, prices: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Collusion screens of every tender at once, from bid counts and prices
+    sorted ascending within each tender. NaN where a tender has too few bids.
+
+    - ``cv``: coefficient of variation (sample std / mean); low when bids
+      are suspiciously close together
+    - ``relative_distance``: gap between the two lowest bids divided by the
+      std of the losing bids; high when cover bids cluster above the winner
+    - ``spread``: (highest - lowest) / lowest
+    - ``skewness`` and ``kurtosis`` (excess) of the bid distribution
+    """
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    ends = starts + counts - 1
+    n = counts.astype(float)
+    mean = np.add.reduceat(prices, starts) / n
+    deviations = prices - np.repeat(mean, counts)
+    m2 = np.add.reduceat(deviations ** 2, starts) / n
+    m3 = np.add.reduceat(deviations ** 3, starts) / n
+    m4 = np.add.reduceat(deviations ** 4, starts) / n
+    lowest = prices[starts]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        std = np.where(n >= 2, np.sqrt(m2 * n / (n - 1)), np.nan)
+        # Losing bids are all but the lowest; their deviations sum to minus the lowest's
+        low_deviation = deviations[starts]
+        losing_m2 = m2 * n - low_deviation ** 2 - low_deviation ** 2 / (n - 1)
+        losing_std = np.where(n >= 3, np.sqrt(np.maximum(losing_m2, 0) / (n - 2)), np.nan)
+        second = prices[np.minimum(starts + 1, ends)]
+        return {
+            "bids": n,
+            "cv": std / mean,
+            "relative_distance": np.where(n >= 3, (second - lowest) / losing_std, np.nan),
+            "spread": np.where(n >= 2, (prices[ends] - lowest) / lowest, np.nan),
+            "skewness": np.where(n >= 3, m3 / m2 ** 1.5, np.nan),
+            "kurtosis": np.where(n >= 4, m4 / m2 ** 2 - 3, np.nan),
+        }
+
+
+class BidRiggingScreen:
+    """
+    A ``bid_rigging`` rule: flags tenders whose ``statistic`` (one of
+    BID_STATISTICS) compares to ``threshold`` with ``operator``, among
+    tenders with at least ``min_bids`` bids. Confidence grows from
+    ``base_confidence`` with the distance past the threshold, reaching 1 at
+    twice the threshold's magnitude.
+    """
+
+    def __init__(self, rule: DatasetRule):
+        self.rule = rule
+        params = rule.params
+        self.statistic = params.get("statistic", "cv")
+        if self.statistic not in BID_STATISTICS:
+            raise ValueError(f"Unknown bid statistic: {self.statistic}")
+        self.operator = params.get("operator", "<")
+        self.compare = THRESHOLD_OPERATORS.get(self.operator)
+        if self.compare is None:
+            raise ValueError(f"Unknown operator: {self.operator}")
+        self.threshold = float(params["threshold"])
+        self.min_bids = int(params.get("min_bids", 3))
+
+    def evaluate(self, statistics: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """Indexes of the flagged tenders and their confidence scores"""
+        values = statistics[self.statistic]
+        with np.errstate(invalid="ignore"):
+            flagged = np.flatnonzero(
+                np.isfinite(values) & (statistics["bids"] >= self.min_bids) & self.compare(values, self.threshold)
+            )
+        excess = np.abs(values[flagged] - self.threshold) / max(abs(self.threshold), 1e-9)
+        return flagged, self.rule.confidence(excess)
+
+
+def run_bid_rigging_screens(
+    db: Session,
+    chunk_size: int = settings.DETECT_STREAM_CHUNK_SIZE
+) -> Dict[str, Any]:
+    """
+    Evaluate the active ``bid_rigging`` rules over all tender responses and
+    store their flags on tender items, retiring flags of tenders that no
+    longer match. Prices are streamed once for all rules.
+    """
+    rules, errors = load_dataset_rules(db, "bid_rigging")
+    screens = []
+    for rule in rules:
+        try:
+            screens.append(BidRiggingScreen(rule))
+        except (KeyError, ValueError, TypeError) as e:
+            errors[rule.id] = str(e)
+
+    summary: Dict[str, Any] = {"tenders": 0, "bids": 0, "invalid_rules": errors}
+
+    def flag_chunks() -> Iterator[List[Dict[str, Any]]]:
+        for tender_ids, counts, prices in iter_bid_groups(db, chunk_size):
+            summary["tenders"] += len(tender_ids)
+            summary["bids"] += len(prices)
+            statistics = bid_statistics(counts, prices)
+            rows = []
+            for screen in screens:
+                flagged, confidence = screen.evaluate(statistics)
+                rows.extend(
+                    screen.rule.flag_row(BID_ENTITY_TYPE, tender_ids[index], score)
+                    for index, score in zip(flagged, confidence)
+                )
+            yield rows
+
+    flagged = replace_dataset_flags(db, [screen.rule for screen in screens], BID_ENTITY_TYPE, flag_chunks())
+    summary["flagged"] = flagged
+    return summary
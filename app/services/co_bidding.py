@@ -0,0 +1,364 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from collections import defaultdict
+from datetime import datetime
+from itertools import combinations
+import threading
+
+from sqlalchemy import delete, or_, select, union
+from sqlalchemy.orm import Session
+
+import numpy as np
+
+from app.core.config import settings
+from app.models.award import AwardItem, AwardStatus
+from app.models.risk_analytics import CoBiddingTender, DetectorState, SupplierCoBid
+from app.models.tender import TenderResponse
+from app.services.dataset_rules import (
+    DatasetRule, database_now, get_watermark, load_dataset_rules, replace_dataset_flags, set_watermark
+)
+
+DETECTOR = "co_bidding"
+# Awards in these states do not make their supplier a winner
+LOST_AWARD_STATUSES = (AwardStatus.CANCELLED, AwardStatus.UNSUCCESSFUL)
+
+# Flags of bid rotation rules are attached to both suppliers of a pair
+ROTATION_ENTITY_TYPE = "organizations"
+
+# (tenders, supplier wins, partner wins) added to the edge of a supplier pair
+EdgeDeltas = Dict[Tuple[str, str], List[int]]
+
+
+def tender_contributions(suppliers: Iterable[str], winners: Iterable[str], deltas: EdgeDeltas, sign: int = 1) -> None:
+    """
+    Add what one tender contributes to the co-bidding graph: one shared
+    tender and the wins of each supplier pair. Tenders with more than
+    ``CO_BIDDING_MAX_BIDDERS`` bidders contribute nothing.
+    """
+    suppliers = sorted(set(suppliers))
+    if len(suppliers) > settings.CO_BIDDING_MAX_BIDDERS:
+        return
+    winners = set(winners)
+    for supplier_id, partner_id in combinations(suppliers, 2):
+        edge = deltas[(supplier_id, partner_id)]
+        edge[0] += sign
+        edge[1] += sign * (supplier_id in winners)
+        edge[2] += sign * (partner_id in winners)
+
+
+def _apply_edge_deltas(db: Session, deltas: EdgeDeltas) -> None:
+    """Add deltas to the stored edges, creating new ones and dropping those no tender is left on"""
+    deltas = {pair: delta for pair, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    existing = {}
+    suppliers = sorted({supplier_id for supplier_id, _ in deltas})
+    for start in range(0, len(suppliers), settings.DETECT_STREAM_CHUNK_SIZE):
+        for edge in db.query(SupplierCoBid).filter(
+            SupplierCoBid.supplier_id.in_(suppliers[start:start + settings.DETECT_STREAM_CHUNK_SIZE])
+        ):
+            if (edge.supplier_id, edge.partner_id) in deltas:
+                existing[(edge.supplier_id, edge.partner_id)] = edge
+
+    new_edges = []
+    for (supplier_id, partner_id), (tenders, supplier_wins, partner_wins) in deltas.items():
+        edge = existing.get((supplier_id, partner_id))
+        if edge is None:
+            if tenders > 0:
+                new_edges.append({
+                    "supplier_id": supplier_id, "partner_id": partner_id, "tenders": tenders,
+                    "supplier_wins": supplier_wins, "partner_wins": partner_wins,
+                })
+        elif edge.tenders + tenders <= 0:
+            db.delete(edge)
+        else:
+            edge.tenders += tenders
+            edge.supplier_wins += supplier_wins
+            edge.partner_wins += partner_wins
+    if new_edges:
+        db.execute(SupplierCoBid.__table__.insert(), new_edges)
+    db.flush()
+
+
+def refresh_co_bidding(
+    db: Session,
+    full: bool = False,
+    chunk_size: int = settings.DETECT_STREAM_CHUNK_SIZE
+) -> int:
+    """
+    Bring the co-bidding graph in ``supplier_co_bids`` up to date.
+
+    Only tenders with responses created, or awards created or updated, since
+    the last run's watermark are re-read. Each tender's suppliers and
+    winners are kept in ``co_bidding_tenders``, so its old contribution to
+    the edges is subtracted before the new one is added and re-reading a
+    tender never counts it twice. ``full`` rebuilds the graph from all
+    tenders, which also picks up withdrawn or deleted responses. Does not
+    commit. Returns the number of tenders counted.
+    """
+    started = database_now(db)
+    since = None if full else get_watermark(db, DETECTOR)
+
+    responses = (
+        select(TenderResponse.tender_item_id, TenderResponse.supplier_id)
+        .where(
+            TenderResponse.tender_item_id.isnot(None),
+            TenderResponse.supplier_id.isnot(None),
+            TenderResponse.status.is_distinct_from("WITHDRAWN")
+        )
+        .distinct()
+        .order_by(TenderResponse.tender_item_id)
+    )
+    if since is not None:
+        touched = union(
+            select(TenderResponse.tender_item_id).where(TenderResponse.created_at >= since),
+            select(AwardItem.tender_id).where(or_(AwardItem.created_at >= since, AwardItem.updated_at >= since)),
+        )
+        responses = responses.where(TenderResponse.tender_item_id.in_(select(touched.subquery().c[0])))
+    else:
+        db.execute(delete(SupplierCoBid))
+        db.execute(delete(CoBiddingTender))
+
+    counted = 0
+    bidders: Dict[str, List[str]] = {}
+
+    def flush() -> None:
+        winners: Dict[str, List[str]] = defaultdict(list)
+        for tender_id, supplier_id in db.execute(
+            select(AwardItem.tender_id, AwardItem.supplier_id)
+            .where(
+                AwardItem.tender_id.in_(list(bidders)),
+                AwardItem.supplier_id.isnot(None),
+                or_(AwardItem.status.is_(None), AwardItem.status.notin_(LOST_AWARD_STATUSES))
+            )
+            .distinct()
+        ):
+            winners[tender_id].append(supplier_id)
+
+        deltas: EdgeDeltas = defaultdict(lambda: [0, 0, 0])
+        if since is not None:
+            previous = db.query(CoBiddingTender).filter(CoBiddingTender.tender_item_id.in_(list(bidders))).all()
+            for tender in previous:
+                tender_contributions(tender.suppliers, tender.winners, deltas, sign=-1)
+            db.execute(delete(CoBiddingTender).where(CoBiddingTender.tender_item_id.in_(list(bidders))))
+        snapshots = []
+        for tender_id, suppliers in bidders.items():
+            tender_winners = sorted(set(winners[tender_id]))
+            tender_contributions(suppliers, tender_winners, deltas)
+            snapshots.append({"tender_item_id": tender_id, "suppliers": sorted(suppliers), "winners": tender_winners})
+        db.execute(CoBiddingTender.__table__.insert(), snapshots)
+        _apply_edge_deltas(db, deltas)
+
+    for rows in db.execute(responses.execution_options(yield_per=chunk_size)).partitions(chunk_size):
+        for tender_id, supplier_id in rows:
+            if tender_id not in bidders and len(bidders) >= chunk_size:
+                # Responses are ordered by tender, so every tender read so far is complete
+                flush()
+                counted += len(bidders)
+                bidders = {}
+            bidders.setdefault(tender_id, []).append(supplier_id)
+    if bidders:
+        flush()
+        counted += len(bidders)
+
+    set_watermark(db, DETECTOR, started)
+    return counted
+
+
+class CoBiddingGraph:
+    """
+    The supplier co-bidding graph in compressed sparse row form: the
+    neighbours of supplier ``i`` are ``indices[indptr[i]:indptr[i + 1]]``,
+    with the matching shared tender counts and wins in ``tenders``,
+    ``wins`` (of ``i``) and ``partner_wins``. Every edge is stored in both
+    directions.
+    """
+
+    def __init__(
+        self,
+        suppliers: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        tenders: np.ndarray,
+        left_wins: np.ndarray,
+        right_wins: np.ndarray
+    ):
+        self.suppliers = suppliers
+        self.index = {supplier_id: position for position, supplier_id in enumerate(suppliers)}
+        self.edges = len(left)
+        self.left, self.right = left, right
+        self.edge_tenders = tenders
+
+        rows = np.concatenate((left, right))
+        order = np.argsort(rows, kind="stable")
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=len(suppliers)))))
+        self.indices = np.concatenate((right, left))[order]
+        self.tenders = np.concatenate((tenders, tenders))[order]
+        self.wins = np.concatenate((left_wins, right_wins))[order]
+        self.partner_wins = np.concatenate((right_wins, left_wins))[order]
+
+    @classmethod
+    def load(cls, db: Session, chunk_size: int = settings.DETECT_STREAM_CHUNK_SIZE) -> "CoBiddingGraph":
+        """Read all stored edges into arrays"""
+        stmt = select(
+            SupplierCoBid.supplier_id, SupplierCoBid.partner_id, SupplierCoBid.tenders,
+            SupplierCoBid.supplier_wins, SupplierCoBid.partner_wins
+        ).execution_options(yield_per=chunk_size)
+        columns: List[List[Any]] = [[], [], [], [], []]
+        for rows in db.execute(stmt).partitions(chunk_size):
+            for column, values in zip(columns, zip(*rows)):
+                column.extend(values)
+        suppliers, ids = np.unique(np.array(columns[0] + columns[1], dtype=object), return_inverse=True)
+        edges = len(columns[0])
+        counts = [np.array(column, dtype=np.int64) for column in columns[2:]]
+        return cls(suppliers, ids[:edges], ids[edges:], *counts)
+
+    @staticmethod
+    def rotation(tenders: np.ndarray, wins: np.ndarray, partner_wins: np.ndarray) -> np.ndarray:
+        """
+        Bid rotation score of supplier pairs: twice the wins of the pair's
+        less successful supplier over their shared tenders. 1 when the two
+        win every tender they share and take equal turns, 0 when one of
+        them never wins.
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(tenders > 0, 2 * np.minimum(wins, partner_wins) / tenders, 0.0)
+
+    def neighbours(self, supplier_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Co-bidders of a supplier, most shared tenders first; None for an unknown supplier"""
+        position = self.index.get(supplier_id)
+        if position is None:
+            return None
+        edges = slice(self.indptr[position], self.indptr[position + 1])
+        rotation = self.rotation(self.tenders[edges], self.wins[edges], self.partner_wins[edges])
+        neighbours = [
+            {
+                "partner_id": self.suppliers[partner],
+                "tenders": int(tenders),
+                "wins": int(wins),
+                "partner_wins": int(partner_wins),
+                "rotation": float(score),
+            }
+            for partner, tenders, wins, partner_wins, score in zip(
+                self.indices[edges], self.tenders[edges], self.wins[edges], self.partner_wins[edges], rotation
+            )
+        ]
+        neighbours.sort(key=lambda neighbour: neighbour["tenders"], reverse=True)
+        return neighbours
+
+    def clusters(self, min_tenders: int = settings.CO_BIDDING_MIN_TENDERS, min_size: int = 2) -> List[List[str]]:
+        """
+        Groups of suppliers connected by edges of at least ``min_tenders``
+        shared tenders, found with union-find, largest first
+        """
+        parent = np.arange(len(self.suppliers))
+
+        def find(node: int) -> int:
+            while parent[node] != node:
+                # Path halving keeps the trees flat
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        strong = self.edge_tenders >= min_tenders
+        for left, right in zip(self.left[strong].tolist(), self.right[strong].tolist()):
+            left_root, right_root = find(left), find(right)
+            if left_root != right_root:
+                parent[max(left_root, right_root)] = min(left_root, right_root)
+
+        roots = np.array([find(node) for node in range(len(self.suppliers))], dtype=np.int64)
+        order = np.argsort(roots, kind="stable")
+        groups = np.split(order, np.flatnonzero(np.diff(roots[order])) + 1) if len(order) else []
+        clusters = [sorted(self.suppliers[group].tolist()) for group in groups if len(group) >= min_size]
+        clusters.sort(key=len, reverse=True)
+        return clusters
+
+
+class CoBiddingGraphCache:
+    """
+    The co-bidding graph of this process, reloaded from the stored edges
+    only when a refresh has moved the detector's watermark since it was read
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._graph: Optional[CoBiddingGraph] = None
+        self._version: Optional[datetime] = None
+
+    def get(self, db: Session) -> CoBiddingGraph:
+        state = db.get(DetectorState, DETECTOR)
+        version = state.watermark if state is not None else None
+        with self._lock:
+            if self._graph is None or version != self._version:
+                self._graph = CoBiddingGraph.load(db)
+                self._version = version
+            return self._graph
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._graph = None
+
+
+class BidRotationRule:
+    """
+    A ``bid_rotation`` rule: flags both suppliers of every pair that shared
+    at least ``min_tenders`` tenders with a rotation score above
+    ``threshold``. Confidence grows from ``base_confidence`` to 1 as the
+    score goes from the threshold to 1.
+    """
+
+    def __init__(self, rule: DatasetRule):
+        self.rule = rule
+        self.min_tenders = int(rule.params.get("min_tenders", settings.CO_BIDDING_MIN_TENDERS))
+        self.threshold = float(rule.params.get("threshold", 0.5))
+
+    def flag_rows(self, graph: CoBiddingGraph) -> List[Dict[str, Any]]:
+        """Flags of the suppliers of matching pairs, with the highest score of each supplier"""
+        rotation = graph.rotation(graph.tenders, graph.wins, graph.partner_wins)
+        matching = (graph.tenders >= self.min_tenders) & (rotation > self.threshold)
+        best = np.zeros(len(graph.suppliers))
+        rows = np.repeat(np.arange(len(graph.suppliers)), np.diff(graph.indptr))
+        np.maximum.at(best, rows[matching], rotation[matching])
+        flagged = np.flatnonzero(best)
+        confidence = self.rule.confidence((best[flagged] - self.threshold) / max(1 - self.threshold, 1e-9))
+        return [
+            self.rule.flag_row(ROTATION_ENTITY_TYPE, graph.suppliers[index], score)
+            for index, score in zip(flagged, confidence)
+        ]
+
+
+def run_bid_rotation_detector(db: Session, full: bool = False) -> Dict[str, Any]:
+    """
+    Refresh the co-bidding graph incrementally, then evaluate the active
+    ``bid_rotation`` rules on it, retiring flags that no longer match
+    """
+    rules, errors = load_dataset_rules(db, "bid_rotation")
+    detectors = []
+    for rule in rules:
+        try:
+            detectors.append(BidRotationRule(rule))
+        except (ValueError, TypeError) as e:
+            errors[rule.id] = str(e)
+
+    try:
+        counted = refresh_co_bidding(db, full=full)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    graph = co_bidding_graph_cache.get(db)
+    flagged = replace_dataset_flags(
+        db, [detector.rule for detector in detectors], ROTATION_ENTITY_TYPE,
+        (detector.flag_rows(graph) for detector in detectors)
+    )
+    return {
+        "counted_tenders": counted,
+        "suppliers": len(graph.suppliers),
+        "edges": graph.edges,
+        "invalid_rules": errors,
+        "flagged": flagged,
+    }
+
+
+# Global graph cache
+co_bidding_graph_cache = CoBiddingGraphCache()
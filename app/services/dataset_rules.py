@@ -0,0 +1,117 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+import json
+
+import numpy as np
+
+from app.core.config import settings
+from app.crud.red_flag import (
+    deactivate_red_flags_for_rule, get_active_red_flag_rules, upsert_detected_red_flags
+)
+from app.models.risk_analytics import DetectorState
+from app.services.red_flag_engine import red_flag_row
+from app.services.rule_set import rule_version
+
+
+class DatasetRule:
+    """An active rule of one of the DATASET_RULE_TYPES, with its parameters parsed"""
+
+    def __init__(self, rule: Any):
+        self.id = rule.id
+        self.name = rule.name
+        self.description = rule.description
+        self.rule_type = rule.rule_type
+        self.params: Dict[str, Any] = json.loads(rule.parameters)
+        if not isinstance(self.params, dict):
+            raise ValueError("rule parameters must be a JSON object")
+        self.version = rule_version(rule.rule_type, rule.parameters)
+        self.category = self.params.get("category", "general")
+        self.severity = self.params.get("severity", "medium")
+        self.base_confidence = float(self.params.get("base_confidence", 0.5))
+
+    def flag_row(self, entity_type: str, entity_id: Any, confidence: float) -> Dict[str, Any]:
+        """RedFlag column values for an entity this rule flagged"""
+        return red_flag_row({
+            "rule_id": self.id,
+            "rule_name": self.name,
+            "rule_description": self.description,
+            "severity": self.severity,
+            "confidence_score": float(confidence),
+            "category": self.category,
+            "source": self.rule_type,
+        }, self.version, entity_type, entity_id)
+
+    def confidence(self, excess: np.ndarray) -> np.ndarray:
+        """
+        Confidence scores rising from ``base_confidence`` to 1 as ``excess``,
+        how far past its threshold a statistic is, goes from 0 to 1
+        """
+        return self.base_confidence + (1 - self.base_confidence) * np.clip(excess, 0.0, 1.0)
+
+
+def load_dataset_rules(db: Session, rule_type: str) -> Tuple[List[DatasetRule], Dict[int, str]]:
+    """Parse the active rules of a dataset rule type, returning them and the errors of invalid ones"""
+    rules, errors = [], {}
+    for rule in get_active_red_flag_rules(db):
+        if rule.rule_type != rule_type:
+            continue
+        try:
+            rules.append(DatasetRule(rule))
+        except (json.JSONDecodeError, ValueError, TypeError) as e:
+            errors[rule.id] = str(e)
+    return rules, errors
+
+
+def replace_dataset_flags(
+    db: Session,
+    rules: List[DatasetRule],
+    entity_type: str,
+    row_chunks: Iterable[List[Dict[str, Any]]]
+) -> Dict[int, int]:
+    """
+    Store the flags of a full detector run in one transaction: every active
+    flag the rules produced for the entity type is deactivated and the new
+    ones are upserted, so entities that no longer match are retired.
+    Returns the number of flags stored per rule.
+    """
+    stored = {rule.id: 0 for rule in rules}
+    try:
+        for rule in rules:
+            deactivate_red_flags_for_rule(db, rule_id=rule.id, entity_type=entity_type)
+        for rows in row_chunks:
+            upsert_detected_red_flags(db, objs_in=rows, commit=False)
+            for row in rows:
+                stored[row["rule_id"]] += 1
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return stored
+
+
+def database_now(db: Session) -> datetime:
+    """Current time of the database server, the clock created_at columns are set by"""
+    return db.execute(select(func.now())).scalar()
+
+
+def get_watermark(db: Session, detector: str) -> Optional[datetime]:
+    """
+    Time from which an incremental detector has to re-read rows, including
+    an overlap for transactions that committed late; None before its first run
+    """
+    state = db.get(DetectorState, detector)
+    if state is None or state.watermark is None:
+        return None
+    return state.watermark - timedelta(seconds=settings.DETECTOR_WATERMARK_OVERLAP_SECONDS)
+
+
+def set_watermark(db: Session, detector: str, watermark: Optional[datetime]) -> None:
+    """Record how far a detector got, without committing"""
+    state = db.get(DetectorState, detector)
+    if state is None:
+        state = DetectorState(detector=detector)
+        db.add(state)
+    state.watermark = watermark
@@ -0,0 +1,97 @@
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+import time
+
+from app.core.config import settings
+
+
+def record_digest(record: Dict[str, Any]) -> str:
+    """Canonical content hash of a record, independent of key order"""
+    canonical = json.dumps(record, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class DetectionCache:
+    """
+    LRU cache of detection results with a TTL, keyed by record digest.
+
+    Entries belong to one rule set version. The first lookup or store under a
+    new version drops everything cached for the previous one, so rule edits
+    invalidate the cache without explicit calls.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = settings.DETECTION_CACHE_MAX_ENTRIES,
+        ttl_seconds: int = settings.DETECTION_CACHE_TTL_SECONDS
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, version: str, digest: str) -> Optional[List[Dict[str, Any]]]:
+        """Cached flags for a record digest, or None on a miss"""
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(digest)
+            if entry is None or self._expired(entry[0]):
+                if entry is not None:
+                    del self._entries[digest]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return [dict(flag) for flag in entry[1]]
+
+    def put(self, version: str, digest: str, flags: List[Dict[str, Any]]) -> None:
+        """Store the flags detected for a record digest"""
+        with self._lock:
+            self._check_version(version)
+            self._entries[digest] = (time.monotonic(), [dict(flag) for flag in flags])
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "ruleset_version": self._version,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _check_version(self, version: str) -> None:
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.monotonic() - stored_at > self.ttl_seconds
+
+
+detection_cache = DetectionCache()
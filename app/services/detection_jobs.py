@@ -0,0 +1,194 @@
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+import logging
+import os
+import threading
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.crud.detection_job import claim_detection_job, requeue_stale_detection_jobs
+from app.models.red_flag import DetectionJob
+from app.services.parallel_scanner import iter_chunks, iter_table_records
+from app.services.red_flag_engine import RedFlagEngine
+from app.services.rule_pushdown import PUSHDOWN_TARGETS
+from app.services.rule_rescan import rescan_rule
+
+logger = logging.getLogger(__name__)
+
+
+def run_detection_job(
+    db: Session,
+    read_db: Session,
+    job: DetectionJob,
+    chunk_size: int = settings.DETECT_STREAM_CHUNK_SIZE
+) -> DetectionJob:
+    """
+    Run a claimed job to completion: a rule re-scan, or detection over
+    submitted records or a stored table with the batch detection path.
+
+    The job always ends up finished: if its outcome cannot be stored, it is
+    marked failed with the error instead.
+    """
+    job_id = job.id
+    try:
+        if job.rescan_rule_id is not None:
+            _run_rescan(db, job, chunk_size)
+        else:
+            _run_detection(db, read_db, job, chunk_size)
+    except Exception as e:
+        db.rollback()
+        job.status = "failed"
+        job.error = str(e)
+
+    job.finished_at = func.now()
+    try:
+        db.commit()
+    except Exception as e:
+        logger.exception("Could not store the outcome of detection job %s", job_id)
+        db.rollback()
+        db.query(DetectionJob).filter(DetectionJob.id == job_id).update({
+            DetectionJob.status: "failed",
+            DetectionJob.error: str(e),
+            DetectionJob.finished_at: func.now(),
+        }, synchronize_session=False)
+        db.commit()
+    db.refresh(job)
+    return job
+
+
+def _run_rescan(db: Session, job: DetectionJob, chunk_size: int) -> None:
+    """Re-scan the stored tables with the job's rule, in the single transaction of rescan_rule"""
+    summary = rescan_rule(db, job.rescan_rule_id, chunk_size=chunk_size)
+    job.total = job.processed = len(summary["targets"])
+    job.flagged = sum(counts["flagged"] for counts in summary["targets"].values())
+    job.status = "completed"
+    job.results = [summary]
+
+
+def _run_detection(db: Session, read_db: Session, job: DetectionJob, chunk_size: int) -> None:
+    """
+    Detect red flags over the job's records or table. Progress is committed
+    after every chunk, which is also when a requested cancellation is
+    noticed. Stored tables are paged through ``read_db``.
+    """
+    engine = RedFlagEngine(db)
+    # Job attributes are read once: every commit expires them and
+    # reloading would fetch the submitted records again
+    persist, entity_type, id_field = job.persist, job.entity_type, job.id_field or "id"
+    if job.target:
+        table = PUSHDOWN_TARGETS[job.target].__table__
+        id_field = list(table.primary_key.columns)[0].name
+        job.total = read_db.execute(select(func.count()).select_from(table)).scalar()
+        records: Iterator[Dict[str, Any]] = iter_table_records(read_db, job.target, chunk_size)
+    else:
+        records = iter(job.records or [])
+
+    results: List[Dict[str, Any]] = []
+    processed = 0
+    status = "completed"
+    for chunk in iter_chunks(records, chunk_size):
+        flags_per_record = engine.detect_red_flags_batch(chunk)
+        for offset, (record, flags) in enumerate(zip(chunk, flags_per_record)):
+            if flags:
+                results.append({"index": processed + offset, "id": record.get(id_field), "red_flags": flags})
+        if persist:
+            engine.persist_red_flags(entity_type, [
+                (record[id_field], flags)
+                for record, flags in zip(chunk, flags_per_record) if flags
+            ])
+        processed += len(chunk)
+        job.processed = processed
+        job.flagged = len(results)
+        db.commit()
+
+        db.refresh(job, ["cancel_requested"])
+        if job.cancel_requested:
+            status = "cancelled"
+            break
+    job.status = status
+    job.results = results
+
+
+class DetectionJobWorkerPool:
+    """
+    Background threads draining the detection job queue.
+
+    Workers poll the queue every ``DETECTION_JOB_POLL_SECONDS`` and are woken
+    up early by ``notify()`` when a job is submitted. On start, running jobs
+    that stopped making progress are put back in the queue.
+    """
+
+    def __init__(
+        self,
+        workers: int = settings.DETECTION_JOB_WORKERS,
+        poll_seconds: float = settings.DETECTION_JOB_POLL_SECONDS,
+        session_factory: Callable[[], Session] = SessionLocal
+    ):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.session_factory = session_factory
+        self._threads: List[threading.Thread] = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def ensure_started(self) -> None:
+        """Start the worker threads unless already running"""
+        with self._lock:
+            if self._threads or self.workers <= 0:
+                return
+            db = self.session_factory()
+            try:
+                requeue_stale_detection_jobs(db, stale_seconds=settings.DETECTION_JOB_STALE_SECONDS)
+            finally:
+                db.close()
+            self._stopping.clear()
+            for number in range(self.workers):
+                thread = threading.Thread(
+                    target=self.work, args=(f"{os.getpid()}-{number}",),
+                    name=f"detection-job-worker-{number}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def notify(self) -> None:
+        """Wake idle workers, e.g. after queueing a job"""
+        self._wakeup.set()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the workers once their current job is done"""
+        with self._lock:
+            self._stopping.set()
+            self._wakeup.set()
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+
+    def run_once(self, worker: str) -> Optional[DetectionJob]:
+        """Claim and run one queued job, returning it, or None if the queue is empty"""
+        db = self.session_factory()
+        read_db = self.session_factory()
+        try:
+            job = claim_detection_job(db, worker=worker)
+            if job is None:
+                return None
+            return run_detection_job(db, read_db, job)
+        finally:
+            read_db.close()
+            db.close()
+
+    def work(self, worker: str) -> None:
+        """Run queued jobs until stopped"""
+        while not self._stopping.is_set():
+            try:
+                job = self.run_once(worker)
+            except Exception:
+                logger.exception("Detection job worker %s failed to claim a job", worker)
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_seconds)
+                self._wakeup.clear()
+
+
+detection_job_pool = DetectionJobWorkerPool()
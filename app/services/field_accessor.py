@@ -0,0 +1,64 @@
+from typing import Any, Callable, List, Union
+from functools import lru_cache
+import re
+
+FieldAccessor = Callable[[Any], Any]
+
+# One path step: a key, optionally followed by list indexes, e.g. awards[0][1]
+_STEP = re.compile(r"^([^\[\]]*)((?:\[-?\d+\])*)$")
+_INDEX = re.compile(r"\[(-?\d+)\]")
+
+
+def parse_field_path(field_path: str) -> List[Union[str, int]]:
+    """
+    Split a dotted field path into dictionary keys and list indexes.
+
+    ``awards[0].value.amount`` becomes ``["awards", 0, "value", "amount"]``.
+    Raises ValueError for malformed paths.
+    """
+    steps: List[Union[str, int]] = []
+    for part in field_path.split('.'):
+        match = _STEP.match(part)
+        if match is None:
+            raise ValueError(f"invalid field path: {field_path!r}")
+        key, indexes = match.groups()
+        if key or not indexes:
+            steps.append(key)
+        steps.extend(int(index) for index in _INDEX.findall(indexes))
+    return steps
+
+
+@lru_cache(maxsize=None)
+def compile_field_path(field_path: str) -> FieldAccessor:
+    """
+    Compile a field path into a callable returning the value at that path, or
+    None when any step is missing. Accessors are cached, so rules reading the
+    same path share one callable.
+    """
+    steps = tuple(parse_field_path(field_path))
+
+    if len(steps) == 1 and isinstance(steps[0], str):
+        key = steps[0]
+
+        def get_key(data: Any) -> Any:
+            if isinstance(data, dict):
+                return data.get(key)
+            return None
+        return get_key
+
+    def get_path(data: Any) -> Any:
+        current = data
+        for step in steps:
+            if isinstance(step, int):
+                if not isinstance(current, (list, tuple)):
+                    return None
+                try:
+                    current = current[step]
+                except IndexError:
+                    return None
+            elif isinstance(current, dict) and step in current:
+                current = current[step]
+            else:
+                return None
+        return current
+    return get_path
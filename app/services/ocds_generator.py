@@ -0,0 +1,196 @@
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import json
+import math
+import random
+
+PROCUREMENT_METHODS = ("open", "selective", "limited", "direct")
+# Relative frequency of each procurement method
+PROCUREMENT_METHOD_WEIGHTS = (0.6, 0.2, 0.12, 0.08)
+CONTRACT_STATUSES = ("pending", "active", "cancelled", "terminated")
+CATEGORIES = ("goods", "works", "services")
+CURRENCIES = ("USD", "EUR", "GBP")
+
+_NAME_PARTS = (
+    "Global", "United", "National", "Metro", "Prime", "Apex", "Delta", "Summit", "Harbor", "Northern",
+    "Atlas", "Vertex", "Pioneer", "Horizon", "Crescent", "Liberty", "Sterling", "Evergreen",
+)
+_NAME_TRADES = (
+    "Construction", "Medical Supplies", "Consulting", "Logistics", "Engineering", "Trading",
+    "Technologies", "Services", "Infrastructure", "Pharma", "Security", "Catering",
+)
+_NAME_SUFFIXES = ("Ltd", "LLC", "Inc", "GmbH", "Holding", "Group", "SA", "")
+_SUBJECTS = {
+    "goods": ("office supplies", "medical equipment", "laptops", "vehicles", "school furniture", "vaccines"),
+    "works": ("road rehabilitation", "bridge repair", "school construction", "water network extension"),
+    "services": ("IT consulting", "cleaning services", "security services", "audit services", "training"),
+}
+_TITLE_PREFIXES = ("Supply of", "Provision of", "Framework agreement for", "Emergency procurement of", "")
+_START = datetime(2020, 1, 1)
+
+
+class OCDSGenerator:
+    """
+    Seeded generator of synthetic OCDS parties, tenders and contracts.
+
+    Values follow a log-normal distribution per category, a few buyers
+    account for most tenders and tenders attract a skewed number of bids,
+    so rule match rates resemble those on real procurement data. The same
+    seed always produces the same records.
+    """
+
+    def __init__(self, seed: int = 0, buyers: int = 50, suppliers: int = 500):
+        self.random = random.Random(seed)
+        self.buyers = [self.party(f"buyer-{number}", "buyer") for number in range(buyers)]
+        self.suppliers = [self.party(f"supplier-{number}", "supplier") for number in range(suppliers)]
+        self._suppliers_by_id = {supplier["party_id"]: supplier for supplier in self.suppliers}
+        self._tenders = 0
+        self._contracts = 0
+
+    def party(self, party_id: str, party_type: str) -> Dict[str, Any]:
+        """A buyer or supplier organisation"""
+        rnd = self.random
+        name = " ".join(part for part in (
+            rnd.choice(_NAME_PARTS), rnd.choice(_NAME_TRADES), rnd.choice(_NAME_SUFFIXES)
+        ) if part)
+        return {
+            "party_id": party_id,
+            "name": name,
+            "party_type": party_type,
+            "address": {"countryName": rnd.choice(("Kenya", "Uganda", "Tanzania", "Rwanda"))},
+            "contact_point": {"email": f"procurement@{party_id}.example"},
+            "identifier": {"scheme": "TAX", "id": f"{rnd.randrange(10, 99)}-{rnd.randrange(10 ** 6, 10 ** 7)}"},
+        }
+
+    def tender(self) -> Dict[str, Any]:
+        """A tender with its buyer, tender period and bids"""
+        rnd = self.random
+        self._tenders += 1
+        category = rnd.choice(CATEGORIES)
+        method = rnd.choices(PROCUREMENT_METHODS, PROCUREMENT_METHOD_WEIGHTS)[0]
+        # Pareto-distributed index: a few buyers publish most tenders
+        buyer = self.buyers[min(int(rnd.paretovariate(1.2)) - 1, len(self.buyers) - 1)]
+        value = round(rnd.lognormvariate({"goods": 10.5, "works": 12.5, "services": 11.0}[category], 1.4), 2)
+        published = _START + timedelta(days=rnd.uniform(0, 1460))
+        period_days = max(1, int(rnd.gauss({"open": 30, "selective": 21}.get(method, 7), 6)))
+        bidders = 1 if method == "direct" else max(1, min(int(rnd.expovariate(1 / 3)) + 1, 20))
+        bids = [
+            {
+                "tenderer": rnd.choice(self.suppliers)["party_id"],
+                "value": {"amount": round(value * rnd.uniform(0.8, 1.15), 2)},
+            }
+            for _ in range(bidders)
+        ]
+        title = " ".join(part for part in (
+            rnd.choice(_TITLE_PREFIXES), rnd.choice(_SUBJECTS[category])
+        ) if part)
+        return {
+            "tender_id": f"tender-{self._tenders}",
+            "title": title.capitalize(),
+            "description": f"{title} for {buyer['name']}",
+            "value_amount": value,
+            "value_currency": rnd.choice(CURRENCIES),
+            "procurement_method": method,
+            "status": "complete",
+            "tender_data": {
+                "mainProcurementCategory": category,
+                "buyer": {"id": buyer["party_id"], "name": buyer["name"]},
+                "tenderPeriod": {
+                    "startDate": published.isoformat(),
+                    "endDate": (published + timedelta(days=period_days)).isoformat(),
+                },
+                "numberOfTenderers": bidders,
+                "bids": bids,
+            },
+        }
+
+    def contract(self, tender: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """A contract awarded on the given tender, or on a new one"""
+        rnd = self.random
+        tender = tender or self.tender()
+        self._contracts += 1
+        bids = tender["tender_data"]["bids"]
+        winner = min(bids, key=lambda bid: bid["value"]["amount"])
+        supplier = self._suppliers_by_id[winner["tenderer"]]
+        signed = datetime.fromisoformat(tender["tender_data"]["tenderPeriod"]["endDate"]) + \
+            timedelta(days=rnd.randrange(5, 60))
+        amount = winner["value"]["amount"]
+        if rnd.random() < 0.05:
+            # Amended upwards after award
+            amount = round(amount * rnd.uniform(1.1, 2.0), 2)
+        elif rnd.random() < 0.1:
+            amount = float(round(amount, -int(math.log10(max(amount, 10)))))
+        return {
+            "contract_id": f"contract-{self._contracts}",
+            "title": tender["title"],
+            "description": tender["description"],
+            "value_amount": amount,
+            "value_currency": tender["value_currency"],
+            "procurement_method": tender["procurement_method"],
+            "status": rnd.choices(CONTRACT_STATUSES, (0.1, 0.8, 0.05, 0.05))[0],
+            "contract_data": {
+                "dateSigned": signed.isoformat(),
+                "buyer": tender["tender_data"]["buyer"],
+                "supplier": {"id": supplier["party_id"], "name": supplier["name"], "identifier": supplier["identifier"]},
+                "tender": tender["tender_data"],
+            },
+        }
+
+    def contracts(self, count: int) -> Iterator[Dict[str, Any]]:
+        """Yield count contracts, each awarded on its own tender"""
+        for _ in range(count):
+            yield self.contract()
+
+
+RULE_KINDS = ("threshold", "pattern", "anomaly", "regex", "composite")
+_RULE_KIND_WEIGHTS = (0.4, 0.3, 0.1, 0.1, 0.1)
+
+
+def generate_rules(count: int, seed: int = 0, kinds: Sequence[str] = RULE_KINDS) -> List[SimpleNamespace]:
+    """
+    A seeded catalogue of count rules over generated contracts, in the form
+    of stored rules: mostly thresholds and patterns, with anomaly, regex and
+    composite rules mixed in. ``kinds`` limits the catalogue to some of
+    RULE_KINDS.
+    """
+    rnd = random.Random(seed)
+    numeric_fields = ("value_amount", "contract_data.tender.numberOfTenderers", "contract_data.tender.bids[0].value.amount")
+    text_fields = ("title", "description", "contract_data.supplier.name", "procurement_method")
+    words = [word.lower() for word in _NAME_PARTS + _NAME_TRADES] + \
+        [subject for subjects in _SUBJECTS.values() for subject in subjects] + list(PROCUREMENT_METHODS)
+    rules = []
+    for rule_id in range(1, count + 1):
+        kind = rnd.choices(RULE_KINDS, _RULE_KIND_WEIGHTS)[0]
+        if kind not in kinds:
+            kind = rnd.choice(kinds)
+        if kind == "composite" and rule_id <= 2:
+            kind = "threshold"
+        if kind == "threshold":
+            field = rnd.choice(numeric_fields)
+            if "numberOfTenderers" in field:
+                params = {"field": field, **rnd.choice(({"threshold": 1, "operator": "<="}, {"threshold": 10, "operator": ">"}))}
+            else:
+                params = {"field": field, "threshold": round(rnd.lognormvariate(14, 1)), "operator": rnd.choice((">", ">="))}
+        elif kind == "pattern":
+            params = {"field": rnd.choice(text_fields), "pattern": rnd.choice(words)}
+        elif kind == "anomaly":
+            low = round(rnd.lognormvariate(8, 1))
+            params = {"field": "value_amount", "min_value": low, "max_value": low * rnd.randrange(100, 10000)}
+        elif kind == "regex":
+            params = {"field": rnd.choice(text_fields), "ignore_case": True, "pattern": rnd.choice((
+                rf"\b{rnd.choice(words)}\b", r"\b(ltd|llc|inc)\b", r"^emergency", r"\d{2}-\d{7}", r"holding\s+group",
+            ))}
+        else:
+            first, second = rnd.sample(range(1, rule_id), 2)
+            params = {"condition": {rnd.choice(("all", "any")): [{"rule": first}, {"not": {"rule": second}}]}}
+        params["severity"] = rnd.choice(("low", "medium", "high"))
+        rules.append(SimpleNamespace(
+            id=rule_id,
+            name=f"{kind}-{rule_id}",
+            description=f"Generated {kind} rule {rule_id}",
+            rule_type=kind,
+            parameters=json.dumps(params),
+            is_active=True,
+        ))
+    return rules
@@ -0,0 +1,286 @@
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from difflib import SequenceMatcher
+import hashlib
+import re
+import unicodedata
+import zlib
+
+from sqlalchemy import and_, delete, func, select
+from sqlalchemy.orm import Session, aliased
+
+import numpy as np
+
+from app.core.config import settings
+from app.models.organization import Organization
+from app.models.risk_analytics import OrganizationLshBucket
+from app.models.tender import TenderResponse
+from app.services.dataset_rules import DatasetRule, load_dataset_rules, replace_dataset_flags
+
+# Legal forms and filler words dropped from names before comparing them
+NAME_STOPWORDS = {
+    "the", "and", "of", "co", "company", "corp", "corporation", "inc", "incorporated", "llc", "ltd", "limited",
+    "plc", "gmbh", "ag", "sa", "sas", "sarl", "srl", "spa", "bv", "nv", "pty", "pvt", "group", "holding", "holdings",
+}
+
+# Mersenne prime modulus of the MinHash permutations; a * x + b stays within 64 bits
+MINHASH_PRIME = (1 << 31) - 1
+
+# Flags of related suppliers rules are attached to the tenders they bid on together
+RELATED_ENTITY_TYPE = "tender_items"
+
+
+def normalize_text(text: Optional[str], stopwords: Set[str] = frozenset()) -> str:
+    """Lowercase ASCII words of a name or address, without punctuation, accents or stopwords"""
+    if not text:
+        return ""
+    ascii_text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    words = re.findall(r"[a-z0-9]+", ascii_text.lower())
+    return " ".join(word for word in words if word not in stopwords)
+
+
+def organization_keys(name: Optional[str], address: Optional[str]) -> Tuple[str, str]:
+    """Normalized name and address of an organization"""
+    return normalize_text(name, NAME_STOPWORDS), normalize_text(address)
+
+
+def shingles(name_key: str, address_key: str, size: int = 3) -> Set[str]:
+    """Character shingles of the normalized name and, marked apart, of the address"""
+    found = {name_key[i:i + size] for i in range(max(len(name_key) - size + 1, 1))} if name_key else set()
+    if address_key:
+        found.update("@" + address_key[i:i + size] for i in range(max(len(address_key) - size + 1, 1)))
+    return found
+
+
+class MinHasher:
+    """MinHash signatures of shingle sets, cut into LSH bands of ``rows`` values"""
+
+    def __init__(self, bands: int = settings.ORG_MINHASH_BANDS, rows: int = settings.ORG_MINHASH_ROWS):
+        self.bands = bands
+        self.rows = rows
+        # Seeded so that signatures, and the buckets stored from them, are the same in every process
+        permutations = np.random.default_rng(20240101)
+        self.a = permutations.integers(1, MINHASH_PRIME, bands * rows, dtype=np.uint64)
+        self.b = permutations.integers(0, MINHASH_PRIME, bands * rows, dtype=np.uint64)
+
+    def signature(self, shingle_set: Set[str]) -> np.ndarray:
+        """Smallest hash of the shingles under each permutation"""
+        hashes = np.array(
+            [zlib.crc32(shingle.encode("utf-8")) % MINHASH_PRIME for shingle in shingle_set], dtype=np.uint64
+        )
+        return ((self.a[:, None] * hashes[None, :] + self.b[:, None]) % np.uint64(MINHASH_PRIME)).min(axis=1)
+
+    def buckets(self, shingle_set: Set[str]) -> List[int]:
+        """One bucket per band; organizations sharing any bucket are candidate duplicates"""
+        if not shingle_set:
+            return []
+        signature = self.signature(shingle_set)
+        buckets = []
+        for band in range(self.bands):
+            rows = signature[band * self.rows:(band + 1) * self.rows]
+            digest = hashlib.blake2b(band.to_bytes(2, "little") + rows.tobytes(), digest_size=8).digest()
+            buckets.append(int.from_bytes(digest, "little", signed=True))
+        return buckets
+
+
+def similarity(left: Tuple[str, str], right: Tuple[str, str], min_similarity: float = 0.0) -> float:
+    """
+    String similarity (0-1) of two normalized (name, address) keys: the
+    names' similarity ratio, weighted 4:1 with the addresses' when both
+    organizations have one. Pairs that cannot reach ``min_similarity`` by
+    the cheap upper bounds of the ratios score 0.
+    """
+    matchers = [SequenceMatcher(None, left[0], right[0])]
+    weights = [1.0]
+    if left[1] and right[1]:
+        matchers.append(SequenceMatcher(None, left[1], right[1]))
+        weights = [0.8, 0.2]
+    for bound in ("real_quick_ratio", "quick_ratio"):
+        if sum(weight * getattr(matcher, bound)() for weight, matcher in zip(weights, matchers)) < min_similarity:
+            return 0.0
+    return sum(weight * matcher.ratio() for weight, matcher in zip(weights, matchers))
+
+
+def index_organization(db: Session, organization: Organization, minhasher: Optional[MinHasher] = None) -> int:
+    """Replace the LSH buckets of one organization, without committing. Returns the number of buckets."""
+    minhasher = minhasher or MinHasher()
+    db.execute(delete(OrganizationLshBucket).where(OrganizationLshBucket.organization_id == organization.id))
+    buckets = minhasher.buckets(shingles(*organization_keys(organization.name, organization.address)))
+    if buckets:
+        db.execute(OrganizationLshBucket.__table__.insert(), [
+            {"organization_id": organization.id, "bucket": bucket} for bucket in buckets
+        ])
+    return len(buckets)
+
+
+def rebuild_organization_index(db: Session, chunk_size: int = settings.DETECT_STREAM_CHUNK_SIZE) -> int:
+    """
+    Recompute the LSH buckets of every organization, e.g. after a bulk
+    import or a change of the MinHash settings. Returns the number of
+    organizations indexed.
+    """
+    minhasher = MinHasher()
+    indexed = 0
+    try:
+        db.execute(delete(OrganizationLshBucket))
+        stmt = select(Organization.id, Organization.name, Organization.address).execution_options(yield_per=chunk_size)
+        for rows in db.execute(stmt).partitions(chunk_size):
+            buckets = [
+                {"organization_id": organization_id, "bucket": bucket}
+                for organization_id, name, address in rows
+                for bucket in minhasher.buckets(shingles(*organization_keys(name, address)))
+            ]
+            if buckets:
+                db.execute(OrganizationLshBucket.__table__.insert(), buckets)
+            indexed += len(rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return indexed
+
+
+def find_similar_organizations(
+    db: Session,
+    name: str,
+    address: Optional[str] = None,
+    min_similarity: float = settings.ORG_DUPLICATE_SIMILARITY,
+    exclude_id: Optional[str] = None,
+    limit: int = 20
+) -> List[Dict[str, Any]]:
+    """
+    Organizations similar to a name and address: candidates sharing an LSH
+    bucket are read from the index and verified with the string similarity
+    """
+    keys = organization_keys(name, address)
+    buckets = MinHasher().buckets(shingles(*keys))
+    if not buckets:
+        return []
+    candidates = db.query(Organization).filter(Organization.id.in_(
+        select(OrganizationLshBucket.organization_id).where(OrganizationLshBucket.bucket.in_(buckets)).distinct()
+    ))
+    if exclude_id is not None:
+        candidates = candidates.filter(Organization.id != exclude_id)
+    matches = []
+    for candidate in candidates:
+        score = similarity(keys, organization_keys(candidate.name, candidate.address), min_similarity)
+        if score >= min_similarity:
+            matches.append({"organization_id": candidate.id, "name": candidate.name, "similarity": score})
+    matches.sort(key=lambda match: match["similarity"], reverse=True)
+    return matches[:limit]
+
+
+def iter_duplicate_pairs(
+    db: Session,
+    min_similarity: float = settings.ORG_DUPLICATE_SIMILARITY,
+    chunk_size: int = settings.DETECT_STREAM_CHUNK_SIZE
+) -> Iterator[Tuple[str, str, float]]:
+    """
+    Stream pairs of near-duplicate organizations as (ID, ID, similarity).
+
+    Candidate pairs come from a self-join of the LSH buckets, so only
+    organizations sharing a bucket are ever compared; buckets larger than
+    ``ORG_LSH_MAX_BUCKET_SIZE`` are skipped. Each candidate is verified with
+    the string similarity.
+    """
+    left, right = aliased(OrganizationLshBucket), aliased(OrganizationLshBucket)
+    shared = (
+        select(OrganizationLshBucket.bucket)
+        .group_by(OrganizationLshBucket.bucket)
+        .having(func.count() > 1, func.count() <= settings.ORG_LSH_MAX_BUCKET_SIZE)
+    )
+    stmt = (
+        select(left.organization_id, right.organization_id)
+        .join(right, and_(left.bucket == right.bucket, left.organization_id < right.organization_id))
+        .where(left.bucket.in_(shared))
+        .distinct()
+        .execution_options(yield_per=chunk_size)
+    )
+    for rows in db.execute(stmt).partitions(chunk_size):
+        ids = {organization_id for row in rows for organization_id in row}
+        keys = {
+            organization_id: organization_keys(name, address)
+            for organization_id, name, address in db.execute(
+                select(Organization.id, Organization.name, Organization.address).where(Organization.id.in_(ids))
+            )
+        }
+        for left_id, right_id in rows:
+            score = similarity(keys[left_id], keys[right_id], min_similarity)
+            if score >= min_similarity:
+                yield left_id, right_id, score
+
+
+class RelatedSuppliersRule:
+    """
+    A ``related_suppliers`` rule: flags tenders that received bids from two
+    different suppliers whose names and addresses are at least
+    ``min_similarity`` alike, a sign of the same company bidding under
+    several names. Confidence grows from ``base_confidence`` to 1 as the
+    similarity goes from ``min_similarity`` to 1.
+    """
+
+    def __init__(self, rule: DatasetRule):
+        self.rule = rule
+        self.min_similarity = float(rule.params.get("min_similarity", settings.ORG_DUPLICATE_SIMILARITY))
+
+
+def run_related_suppliers_detector(
+    db: Session,
+    chunk_size: int = settings.DETECT_STREAM_CHUNK_SIZE
+) -> Dict[str, Any]:
+    """
+    Find near-duplicate supplier pairs once for all active
+    ``related_suppliers`` rules, then flag the tenders both suppliers of a
+    pair bid on, retiring flags of tenders that no longer match
+    """
+    rules, errors = load_dataset_rules(db, "related_suppliers")
+    detectors = []
+    for rule in rules:
+        try:
+            detectors.append(RelatedSuppliersRule(rule))
+        except (ValueError, TypeError) as e:
+            errors[rule.id] = str(e)
+    if not detectors:
+        return {"duplicate_pairs": 0, "invalid_rules": errors, "flagged": {}}
+
+    lowest = min(detector.min_similarity for detector in detectors)
+    # Keyed in Python's order, which may differ from the database collation the pairs were ordered by
+    pairs = {tuple(sorted(pair[:2])): pair[2] for pair in iter_duplicate_pairs(db, lowest, chunk_size)}
+    members = sorted({organization_id for pair in pairs for organization_id in pair})
+
+    # Tenders each supplier of a pair bid on, read for a chunk of suppliers at a time
+    bidders: Dict[str, Set[str]] = {}
+    for start in range(0, len(members), chunk_size):
+        for tender_id, supplier_id in db.execute(
+            select(TenderResponse.tender_item_id, TenderResponse.supplier_id)
+            .where(
+                TenderResponse.supplier_id.in_(members[start:start + chunk_size]),
+                TenderResponse.tender_item_id.isnot(None),
+                TenderResponse.status.is_distinct_from("WITHDRAWN")
+            )
+            .distinct()
+        ):
+            bidders.setdefault(tender_id, set()).add(supplier_id)
+
+    # Most similar pair of suppliers bidding on each tender
+    best: Dict[str, float] = {}
+    for tender_id, suppliers in bidders.items():
+        ordered = sorted(suppliers)
+        scores = [
+            pairs[(left, right)]
+            for index, left in enumerate(ordered) for right in ordered[index + 1:]
+            if (left, right) in pairs
+        ]
+        if scores:
+            best[tender_id] = max(scores)
+
+    rows = [
+        detector.rule.flag_row(
+            RELATED_ENTITY_TYPE, tender_id,
+            detector.rule.confidence((score - detector.min_similarity) / max(1 - detector.min_similarity, 1e-9))
+        )
+        for detector in detectors
+        for tender_id, score in best.items()
+        if score >= detector.min_similarity
+    ]
+    flagged = replace_dataset_flags(db, [detector.rule for detector in detectors], RELATED_ENTITY_TYPE, [rows])
+    return {"duplicate_pairs": len(pairs), "invalid_rules": errors, "flagged": flagged}
@@ -0,0 +1,147 @@
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from types import SimpleNamespace
+import json
+import os
+
+from app.core.config import settings
+from app.models.red_flag import RedFlagRule
+from app.services.peer_statistics import peer_statistics
+from app.services.red_flag_engine import RedFlagEngine
+from app.services.rule_pushdown import PUSHDOWN_TARGETS
+from app.services.rule_set import CompiledRuleSet
+
+ProgressCallback = Callable[[int], None]
+
+# Engine of the current worker process, built once by _init_worker
+_worker_engine: Optional[RedFlagEngine] = None
+
+
+def rule_definitions(rules: Iterable[RedFlagRule]) -> List[Dict[str, Any]]:
+    """Plain, picklable copies of stored rules for shipping to workers"""
+    return [
+        {
+            "id": rule.id,
+            "name": rule.name,
+            "description": rule.description,
+            "rule_type": rule.rule_type,
+            "parameters": rule.parameters,
+        }
+        for rule in rules
+    ]
+
+
+def _init_worker(definitions: List[Dict[str, Any]], statistics: Dict[Any, Dict[str, Any]]) -> None:
+    """Compile the rule set and restore the peer statistics once per worker process"""
+    global _worker_engine
+    peer_statistics.restore(statistics)
+    rule_set = CompiledRuleSet([SimpleNamespace(**definition) for definition in definitions])
+    _worker_engine = RedFlagEngine(db=None, cache=None, rule_set=rule_set)
+
+
+def _detect_chunk(records: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    return _worker_engine.detect_red_flags_batch(records)
+
+
+def iter_chunks(records: Iterable[Dict[str, Any]], chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Split a record stream into lists of at most chunk_size records"""
+    iterator = iter(records)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_file_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Read records from a JSON Lines file, or a JSON file holding a list of records"""
+    if path.endswith((".jsonl", ".ndjson")):
+        with open(path, encoding="utf-8") as handle:
+            for line in handle:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    with open(path, encoding="utf-8") as handle:
+        data = json.load(handle)
+    if isinstance(data, dict):
+        # OCDS release/record packages wrap their entries
+        data = data.get("releases") or data.get("records") or [data]
+    yield from data
+
+
+def iter_table_records(db: Session, target: str, chunk_size: int) -> Iterator[Dict[str, Any]]:
+    """
+    Stream the rows of a stored table (one of PUSHDOWN_TARGETS) as plain dicts.
+
+    Rows are read in pages of ``chunk_size`` by primary key, each fetched in
+    full, so no cursor is open while the caller handles them: on SQLite an
+    open cursor holds the read lock and makes every write in between fail.
+    """
+    if target not in PUSHDOWN_TARGETS:
+        raise ValueError(f"Unknown detection target: {target}")
+    table = PUSHDOWN_TARGETS[target].__table__
+    id_column = list(table.primary_key.columns)[0]
+    stmt = select(table).order_by(id_column).limit(chunk_size)
+    page = db.execute(stmt).mappings().all()
+    while page:
+        for row in page:
+            yield dict(row)
+        if len(page) < chunk_size:
+            return
+        page = db.execute(stmt.where(id_column > page[-1][id_column.name])).mappings().all()
+
+
+class ParallelScanner:
+    """
+    Shards records across a process pool and evaluates each shard with the
+    batch detection path.
+
+    Every worker compiles the rule set once at start-up and restores the peer
+    group statistics as they were when the scanner was created. Results are
+    yielded in input order while at most ``2 * workers`` chunks are in
+    flight, so the input stream is never fully materialised.
+    """
+
+    def __init__(
+        self,
+        rules: Iterable[RedFlagRule],
+        workers: Optional[int] = settings.SCAN_WORKERS,
+        chunk_size: int = settings.DETECT_STREAM_CHUNK_SIZE,
+        progress: Optional[ProgressCallback] = None
+    ):
+        self.definitions = rule_definitions(rules)
+        self.statistics = peer_statistics.snapshot()
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.progress = progress
+
+    def scan(self, records: Iterable[Dict[str, Any]]) -> Iterator[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+        """Yield (record, flags) for every input record, in input order"""
+        processed = 0
+        pending: "deque[Tuple[List[Dict[str, Any]], Future]]" = deque()
+        max_pending = self.workers * 2
+
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.definitions, self.statistics)
+        ) as executor:
+            for chunk in iter_chunks(records, self.chunk_size):
+                pending.append((chunk, executor.submit(_detect_chunk, chunk)))
+                if len(pending) >= max_pending:
+                    processed = yield from self._drain_one(pending, processed)
+            while pending:
+                processed = yield from self._drain_one(pending, processed)
+
+    def _drain_one(self, pending, processed: int):
+        chunk, future = pending.popleft()
+        yield from zip(chunk, future.result())
+        processed += len(chunk)
+        if self.progress is not None:
+            self.progress(processed)
+        return processed
@@ -0,0 +1,75 @@
+from typing import Dict, Hashable, Iterable, List, Set, Tuple
+from collections import deque
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton matching many keywords in a single pass over a text.
+
+    Each keyword carries one or more payloads (e.g. rule positions); ``search``
+    returns the payloads of every keyword occurring in the text.
+    """
+
+    def __init__(self, keywords: Iterable[Tuple[str, Hashable]] = ()):
+        # Node 0 is the root; each node has transitions, a failure link and outputs
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Hashable]] = [[]]
+        self._built = False
+        for keyword, payload in keywords:
+            self.add(keyword, payload)
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+    def add(self, keyword: str, payload: Hashable) -> None:
+        """Add a keyword to the automaton"""
+        if not keyword:
+            return
+        node = 0
+        for char in keyword:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append(payload)
+        self._built = False
+
+    def build(self) -> None:
+        """Compute failure links breadth-first and merge outputs along them"""
+        queue = deque(self._goto[0].values())
+        for node in queue:
+            self._fail[node] = 0
+
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail_target = self._goto[fail].get(char, 0)
+                self._fail[child] = fail_target if fail_target != child else 0
+                if self._output[self._fail[child]]:
+                    self._output[child] = self._output[child] + self._output[self._fail[child]]
+        self._built = True
+
+    def search(self, text: str) -> Set[Hashable]:
+        """Return the payloads of all keywords found in the text"""
+        if not self._built:
+            self.build()
+        goto, fail, output = self._goto, self._fail, self._output
+
+        found: Set[Hashable] = set()
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found.update(output[node])
+        return found
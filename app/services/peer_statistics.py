@@ -0,0 +1,286 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from sqlalchemy.orm import Session
+import math
+import threading
+import time
+
+from app.core.config import settings
+from app.models.risk_analytics import PeerGroupStatistic
+from app.services.field_accessor import compile_field_path
+
+# (field, group_by, group_value); group_by is "" for the global group
+GroupKey = Tuple[str, str, str]
+
+
+class P2Quantile:
+    """
+    P-square streaming quantile estimator (Jain & Chlamtac, 1985).
+
+    Tracks one quantile with five markers in constant memory; exact while
+    fewer than five values have been seen.
+    """
+
+    def __init__(self, quantile: float = 0.5, state: Optional[Dict[str, Any]] = None):
+        self.quantile = quantile
+        self.count = 0
+        self.heights: List[float] = []
+        self.positions: List[int] = []
+        self.desired: List[float] = []
+        if state:
+            self.quantile = state["quantile"]
+            self.count = state["count"]
+            self.heights = list(state["heights"])
+            self.positions = list(state["positions"])
+            self.desired = list(state["desired"])
+
+    def to_state(self) -> Dict[str, Any]:
+        return {
+            "quantile": self.quantile,
+            "count": self.count,
+            "heights": self.heights,
+            "positions": self.positions,
+            "desired": self.desired,
+        }
+
+    def add(self, value: float) -> None:
+        p = self.quantile
+        self.count += 1
+        if self.count <= 5:
+            self.heights.append(value)
+            self.heights.sort()
+            if self.count == 5:
+                self.positions = [1, 2, 3, 4, 5]
+                self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+            return
+
+        q, n = self.heights, self.positions
+        if value < q[0]:
+            q[0] = value
+            cell = 0
+        elif value >= q[4]:
+            q[4] = value
+            cell = 3
+        else:
+            cell = next(i for i in range(1, 5) if value < q[i]) - 1
+
+        for i in range(cell + 1, 5):
+            n[i] += 1
+        for i, increment in enumerate((0, p / 2, p, (1 + p) / 2, 1)):
+            self.desired[i] += increment
+
+        for i in range(1, 4):
+            offset = self.desired[i] - n[i]
+            if (offset >= 1 and n[i + 1] - n[i] > 1) or (offset <= -1 and n[i - 1] - n[i] < -1):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(i, step)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+                q[i] = height
+                n[i] += step
+
+    def _parabolic(self, i: int, step: int) -> float:
+        q, n = self.heights, self.positions
+        return q[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self) -> Optional[float]:
+        """Current estimate of the quantile"""
+        if self.count == 0:
+            return None
+        if self.count < 5:
+            ordered = sorted(self.heights)
+            index = self.quantile * (len(ordered) - 1)
+            lower = math.floor(index)
+            upper = math.ceil(index)
+            return ordered[lower] + (ordered[upper] - ordered[lower]) * (index - lower)
+        return self.heights[2]
+
+
+class PeerGroupStats:
+    """Welford mean/variance plus streaming median and MAD of one peer group"""
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0,
+                 median_sketch: Optional[Dict[str, Any]] = None,
+                 deviation_sketch: Optional[Dict[str, Any]] = None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.median = P2Quantile(0.5, median_sketch)
+        self.deviation = P2Quantile(0.5, deviation_sketch)
+
+    @classmethod
+    def from_row(cls, row: PeerGroupStatistic) -> "PeerGroupStats":
+        return cls(row.count, row.mean, row.m2, row.median_sketch, row.deviation_sketch)
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        median = self.median.value()
+        self.median.add(value)
+        # Deviations are taken from the median estimate before this value
+        self.deviation.add(abs(value - (median if median is not None else value)))
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    @property
+    def mad(self) -> float:
+        return self.deviation.value() or 0.0
+
+
+def record_observations(
+    specs: Iterable[Tuple[str, str]],
+    records: Iterable[Dict[str, Any]]
+) -> Iterator[Tuple[GroupKey, float]]:
+    """Numeric (group key, value) observations of the given (field, group_by) pairs in records"""
+    specs = list(specs)
+    for record in records:
+        for field, group_by in specs:
+            value = compile_field_path(field)(record)
+            group_value = compile_field_path(group_by)(record) if group_by else ""
+            if value is None or group_value is None or isinstance(value, bool):
+                continue
+            try:
+                value = float(value)
+            except (ValueError, TypeError, OverflowError):
+                continue
+            if math.isfinite(value):
+                yield (field, group_by, str(group_value)), value
+
+
+class PeerStatisticsStore:
+    """
+    Process-wide cache of peer group statistics backed by the
+    peer_group_statistics table.
+
+    Detection reads the in-memory copy, reloaded at most every
+    ``RULESET_REFRESH_SECONDS``. Ingestion merges observations into the stored
+    rows under a row lock, so several workers can update the same group.
+
+    ``generation``, part of the detection cache key, changes when the
+    statistics are loaded or replaced. Observed values change it at most
+    once every ``refresh_seconds``, so ingestion doesn't invalidate cached
+    results on every record: those may lag the statistics by that long,
+    as other processes' copies do.
+    """
+
+    def __init__(self, refresh_seconds: int = settings.RULESET_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._groups: Dict[GroupKey, PeerGroupStats] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._published_at = time.monotonic()
+        self._observed = False
+
+    @property
+    def generation(self) -> int:
+        if self._observed and time.monotonic() - self._published_at >= self.refresh_seconds:
+            self._publish()
+        return self._generation
+
+    def _publish(self) -> None:
+        self._generation += 1
+        self._published_at = time.monotonic()
+        self._observed = False
+
+    def get(self, key: GroupKey) -> Optional[PeerGroupStats]:
+        return self._groups.get(key)
+
+    def ensure_loaded(self, db: Session) -> None:
+        """Load the stored statistics if never loaded or stale"""
+        loaded_at = self._loaded_at
+        if loaded_at is not None and (
+            self.refresh_seconds <= 0 or time.monotonic() - loaded_at <= self.refresh_seconds
+        ):
+            return
+        with self._lock:
+            groups = {
+                (row.field, row.group_by, row.group_value): PeerGroupStats.from_row(row)
+                for row in db.query(PeerGroupStatistic)
+            }
+            self._groups = groups
+            self._loaded_at = time.monotonic()
+            self._publish()
+
+    def invalidate(self) -> None:
+        """Reload the stored statistics on next use"""
+        self._loaded_at = None
+
+    def snapshot(self) -> Dict[GroupKey, Dict[str, Any]]:
+        """Picklable copy of the statistics, e.g. to warm worker processes"""
+        return {
+            key: {
+                "count": stats.count, "mean": stats.mean, "m2": stats.m2,
+                "median_sketch": stats.median.to_state(),
+                "deviation_sketch": stats.deviation.to_state(),
+            }
+            for key, stats in self._groups.items()
+        }
+
+    def restore(self, snapshot: Dict[GroupKey, Dict[str, Any]]) -> None:
+        """Replace the statistics with a snapshot taken by ``snapshot``"""
+        with self._lock:
+            self._groups = {key: PeerGroupStats(**state) for key, state in snapshot.items()}
+            self._loaded_at = time.monotonic()
+            self._publish()
+
+    def observe(self, db: Session, observations: Iterable[Tuple[GroupKey, float]], commit: bool = True) -> int:
+        """Merge observed values into their peer groups and store the result"""
+        rows: Dict[GroupKey, Tuple[PeerGroupStatistic, PeerGroupStats]] = {}
+        observed = 0
+        for key, value in observations:
+            if key not in rows:
+                rows[key] = self._lock_row(db, key)
+            rows[key][1].add(value)
+            observed += 1
+
+        for key, (row, stats) in rows.items():
+            row.count = stats.count
+            row.mean = stats.mean
+            row.m2 = stats.m2
+            row.median_sketch = stats.median.to_state()
+            row.deviation_sketch = stats.deviation.to_state()
+            self._groups[key] = stats
+        if rows:
+            self._observed = True
+
+        if commit:
+            db.commit()
+        return observed
+
+    @staticmethod
+    def _lock_row(db: Session, key: GroupKey) -> Tuple[PeerGroupStatistic, PeerGroupStats]:
+        field, group_by, group_value = key
+        row = db.query(PeerGroupStatistic).filter(
+            PeerGroupStatistic.field == field,
+            PeerGroupStatistic.group_by == group_by,
+            PeerGroupStatistic.group_value == group_value
+        ).with_for_update().first()
+        if row is None:
+            row = PeerGroupStatistic(field=field, group_by=group_by, group_value=group_value)
+            db.add(row)
+            return row, PeerGroupStats()
+        return row, PeerGroupStats.from_row(row)
+
+    def reset(self, db: Session, field: str, group_by: str) -> None:
+        """Delete the stored statistics of one (field, group_by) pair, without committing"""
+        db.query(PeerGroupStatistic).filter(
+            PeerGroupStatistic.field == field,
+            PeerGroupStatistic.group_by == group_by
+        ).delete(synchronize_session=False)
+        with self._lock:
+            self._groups = {
+                key: stats for key, stats in self._groups.items()
+                if key[:2] != (field, group_by)
+            }
+            self._publish()
+
+
+peer_statistics = PeerStatisticsStore()
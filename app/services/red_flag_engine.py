@@ -1,174 +1,363 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Optional, Set, Tuple
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-import json
+from time import perf_counter
 
-from app.crud.red_flag import get_active_red_flag_rules
-from app.models.red_flag import RedFlagRule
+import numpy as np
+
+from app.core.config import settings
+from app.crud.red_flag import upsert_detected_red_flags
+from app.services.detection_cache import DetectionCache, detection_cache, record_digest
+from app.services.peer_statistics import peer_statistics, record_observations
+from app.services.rule_expression import BatchContext, RecordContext
+from app.services.rule_profiler import RuleProfiler, rule_profiler
+from app.services.rule_pushdown import PUSHDOWN_TARGETS, applicable_rules, iter_table_matches
+from app.services.rule_set import CompiledRuleSet, rule_set_registry
+
+
+def red_flag_row(flag: Dict[str, Any], rule_version: str, entity_type: str, entity_id: Any) -> Dict[str, Any]:
+    """Column values of the RedFlag row storing one detected flag"""
+    return {
+        "title": flag["rule_name"],
+        "description": flag["rule_description"],
+        "severity": flag["severity"],
+        "confidence_score": flag["confidence_score"],
+        "category": flag["category"],
+        "source": flag["source"],
+        "rule_id": flag["rule_id"],
+        "rule_version": rule_version,
+        "entity_type": entity_type,
+        "entity_id": str(entity_id),
+        "contracting_process_id": str(entity_id) if entity_type == "contracting_processes" else None,
+        "is_active": True,
+    }
+
+
+def observe_peer_statistics(db: Session, records: Iterable[Dict[str, Any]]) -> int:
+    """Fold ingested records into the peer group statistics read by active statistical rules"""
+    specs = rule_set_registry.get(db).peer_group_specs
+    if not specs:
+        return 0
+    return peer_statistics.observe(db, record_observations(specs, records))
+
+
+def rebuild_peer_statistics(
+    db: Session,
+    target: str,
+    chunk_size: int = settings.DETECT_STREAM_CHUNK_SIZE
+) -> int:
+    """
+    Recompute the peer group statistics of the active statistical rules from
+    a stored table (one of PUSHDOWN_TARGETS), e.g. after adding such a rule.
+    Returns the number of values observed.
+    """
+    if target not in PUSHDOWN_TARGETS:
+        raise ValueError(f"Unknown detection target: {target}")
+    specs = rule_set_registry.get(db).peer_group_specs
+    table = PUSHDOWN_TARGETS[target].__table__
+
+    try:
+        for field, group_by in specs:
+            peer_statistics.reset(db, field, group_by)
+        result = db.execute(select(table).execution_options(yield_per=chunk_size))
+        rows = (dict(row) for row in result.mappings())
+        observed = peer_statistics.observe(db, record_observations(specs, rows), commit=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        peer_statistics.invalidate()
+        raise
+    return observed
 
 
 class RedFlagEngine:
     """Red flag detection engine"""
-    
-    def __init__(self, db: Session):
+
+    def __init__(
+        self,
+        db: Session,
+        cache: Optional[DetectionCache] = detection_cache,
+        rule_set: Optional[CompiledRuleSet] = None,
+        profiler: Optional[RuleProfiler] = rule_profiler
+    ):
         self.db = db
-        self.rules = self._load_rules()
-    
-    def _load_rules(self) -> List[RedFlagRule]:
-        """Load active red flag rules from database"""
-        return get_active_red_flag_rules(self.db)
-    
+        self.rule_set = rule_set if rule_set is not None else self._load_rules()
+        self.rules = self.rule_set.rules
+        self.cache = cache if cache is not None and cache.enabled else None
+        self.profiler = profiler if profiler is not None and profiler.enabled else None
+        if self.rule_set.peer_group_specs and db is not None:
+            peer_statistics.ensure_loaded(db)
+
+    def _load_rules(self) -> CompiledRuleSet:
+        """Load the shared compiled rule set"""
+        return rule_set_registry.get(self.db)
+
+    @property
+    def ruleset_version(self) -> str:
+        """Version of the rule set this engine evaluates"""
+        return self.rule_set.version
+
+    @property
+    def cache_version(self) -> str:
+        """Key under which results are cached; statistical rules also depend on the peer statistics"""
+        if self.rule_set.peer_group_specs:
+            return f"{self.rule_set.version}:{peer_statistics.generation}"
+        return self.rule_set.version
+
     def detect_red_flags(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Detect red flags in the given data"""
+        """Detect red flags in the given data, reusing cached results for unchanged records"""
+        if self.cache is None:
+            return self._detect(data)
+
+        digest = record_digest(data)
+        flags = self.cache.get(self.cache_version, digest)
+        if flags is None:
+            flags = self._detect(data)
+            self.cache.put(self.cache_version, digest, flags)
+        return flags
+
+    def _detect(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Evaluate the rules on one record, recording per-rule timings when profiled"""
+        rule_set = self.rule_set
+        values = rule_set.resolve_fields(data)
+        matched: Set[int] = set()
+        errors: Dict[int, int] = {}
+        timed = self.profiler is not None and self.profiler.sample()
+        seconds: Dict[int, float] = {}
+        started = 0.0
+
+        for field, matcher in rule_set.pattern_matchers.items():
+            if timed:
+                started = perf_counter()
+            value = values[field]
+            if isinstance(value, str):
+                matched.update(matcher.search(value.lower()))
+            if timed:
+                self._share_time(seconds, rule_set.pattern_positions[field], perf_counter() - started)
+
+        for field, scanner in rule_set.regex_scanners.items():
+            if timed:
+                started = perf_counter()
+            value = values[field]
+            if isinstance(value, str):
+                matched.update(scanner.search(value))
+            if timed:
+                self._share_time(seconds, rule_set.regex_positions[field], perf_counter() - started)
+
+        for field, index in rule_set.threshold_indexes.items():
+            if timed:
+                started = perf_counter()
+            value = values[field]
+            if value is not None:
+                matched.update(index.match(value))
+            if timed:
+                self._share_time(seconds, index.positions, perf_counter() - started)
+
+        for position in rule_set.scan_positions:
+            if timed:
+                started = perf_counter()
+            if self._scan_match(position, values, errors):
+                matched.add(position)
+            if timed:
+                seconds[position] = perf_counter() - started
+
+        if rule_set.composite_positions:
+            context = RecordContext(matched, values)
+            for position in rule_set.composite_positions:
+                if timed:
+                    started = perf_counter()
+                if self.rules[position].expression.evaluate(context):
+                    matched.add(position)
+                if timed:
+                    seconds[position] = perf_counter() - started
+
+        if timed:
+            self.profiler.record(rule_set, 1, seconds, dict.fromkeys(matched, 1), errors)
+
         detected_flags = []
-        
-        for rule in self.rules:
-            try:
-                rule_params = json.loads(rule.parameters)
-                if self._evaluate_rule(data, rule.rule_type, rule_params):
-                    detected_flags.append({
-                        "rule_id": rule.id,
-                        "rule_name": rule.name,
-                        "rule_description": rule.description,
-                        "rule_type": rule.rule_type,
-                        "confidence_score": self._calculate_confidence(data, rule_params),
-                        "severity": self._determine_severity(data, rule_params),
-                        "category": rule_params.get("category", "general"),
-                        "source": "rule_engine"
-                    })
-            except (json.JSONDecodeError, KeyError) as e:
-                # Log error and continue with next rule
-                print(f"Error processing rule {rule.id}: {e}")
-                continue
-        
+        for position in sorted(matched):
+            rule = self.rules[position]
+            detected_flags.append(rule.to_flag(values[rule.field] if rule.field else None))
+
         return detected_flags
-    
-    def _evaluate_rule(self, data: Dict[str, Any], rule_type: str, params: Dict[str, Any]) -> bool:
-        """Evaluate if a rule matches the data"""
-        if rule_type == "pattern":
-            return self._evaluate_pattern_rule(data, params)
-        elif rule_type == "threshold":
-            return self._evaluate_threshold_rule(data, params)
-        elif rule_type == "anomaly":
-            return self._evaluate_anomaly_rule(data, params)
-        else:
-            return False
-    
-    def _evaluate_pattern_rule(self, data: Dict[str, Any], params: Dict[str, Any]) -> bool:
-        """Evaluate pattern-based rules"""
-        field = params.get("field")
-        pattern = params.get("pattern")
-        
-        if not field or not pattern:
-            return False
-        
-        value = self._get_nested_value(data, field)
-        if value is None:
-            return False
-        
-        # Simple string pattern matching
-        if isinstance(value, str) and pattern.lower() in value.lower():
-            return True
-        
-        return False
-    
-    def _evaluate_threshold_rule(self, data: Dict[str, Any], params: Dict[str, Any]) -> bool:
-        """Evaluate threshold-based rules"""
-        field = params.get("field")
-        threshold = params.get("threshold")
-        operator = params.get("operator", ">")
-        
-        if not field or threshold is None:
-            return False
-        
-        value = self._get_nested_value(data, field)
-        if value is None:
-            return False
-        
-        try:
-            value = float(value)
-            threshold = float(threshold)
-        except (ValueError, TypeError):
-            return False
-        
-        if operator == ">":
-            return value > threshold
-        elif operator == ">=":
-            return value >= threshold
-        elif operator == "<":
-            return value < threshold
-        elif operator == "<=":
-            return value <= threshold
-        elif operator == "==":
-            return value == threshold
-        else:
-            return False
-    
-    def _evaluate_anomaly_rule(self, data: Dict[str, Any], params: Dict[str, Any]) -> bool:
-        """Evaluate anomaly-based rules"""
-        # This is a simplified implementation
-        # In a real system, you might use statistical methods or ML models
-        field = params.get("field")
-        if not field:
-            return False
-        
-        value = self._get_nested_value(data, field)
-        if value is None:
-            return False
-        
-        # Simple anomaly detection based on value ranges
+
+    def detect_red_flags_batch(self, records: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """
+        Detect red flags in many records at once. Records found in the
+        detection cache are skipped; the rest are evaluated together.
+        """
+        if self.cache is None:
+            return self._detect_batch(records)
+
+        digests = [record_digest(record) for record in records]
+        results = [self.cache.get(self.cache_version, digest) for digest in digests]
+        missing = [index for index, flags in enumerate(results) if flags is None]
+        if missing:
+            evaluated = self._detect_batch([records[index] for index in missing])
+            for index, flags in zip(missing, evaluated):
+                results[index] = flags
+                self.cache.put(self.cache_version, digests[index], flags)
+        return results
+
+    def _detect_batch(self, records: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """
+        Evaluate the rules on many records at once.
+
+        Every field the rules read is resolved once per record. Threshold and
+        anomaly rules are evaluated as NumPy comparisons over a float column
+        per field, pattern and regex rules with one scan per field and record,
+        composite rules as boolean operations over whole columns, and any
+        other rule record by record. Results are identical to calling
+        ``detect_red_flags`` on each record.
+        """
+        if not records or not self.rules:
+            return [[] for _ in records]
+
+        raw_values: Dict[str, List[Any]] = {
+            field: [accessor(record) for record in records]
+            for field, accessor in self.rule_set.accessors.items()
+        }
+        matches = np.zeros((len(self.rules), len(records)), dtype=bool)
+        errors: Dict[int, int] = {}
+        timed = self.profiler is not None and self.profiler.sample()
+        seconds: Dict[int, float] = {}
+        started = 0.0
+
+        for field, matcher in self.rule_set.pattern_matchers.items():
+            if timed:
+                started = perf_counter()
+            for index, value in enumerate(raw_values[field]):
+                if isinstance(value, str):
+                    for position in matcher.search(value.lower()):
+                        matches[position, index] = True
+            if timed:
+                self._share_time(seconds, self.rule_set.pattern_positions[field], perf_counter() - started)
+
+        for field, scanner in self.rule_set.regex_scanners.items():
+            if timed:
+                started = perf_counter()
+            for index, value in enumerate(raw_values[field]):
+                if isinstance(value, str):
+                    for position in scanner.search(value):
+                        matches[position, index] = True
+            if timed:
+                self._share_time(seconds, self.rule_set.regex_positions[field], perf_counter() - started)
+
+        for field, threshold_index in self.rule_set.threshold_indexes.items():
+            if timed:
+                started = perf_counter()
+            column = self._to_float_column(raw_values[field])
+            if timed:
+                self._share_time(seconds, threshold_index.positions, perf_counter() - started)
+            for position in threshold_index.positions:
+                if timed:
+                    started = perf_counter()
+                matches[position] = self.rules[position].matches_column(column)
+                if timed:
+                    seconds[position] += perf_counter() - started
+
+        for position in self.rule_set.scan_positions:
+            if timed:
+                started = perf_counter()
+            rule = self.rules[position]
+            columns = [raw_values[field] for field in rule.fields]
+            matches[position] = [
+                self._scan_match(position, dict(zip(rule.fields, row)), errors) for row in zip(*columns)
+            ]
+            if timed:
+                seconds[position] = perf_counter() - started
+
+        if self.rule_set.composite_positions:
+            context = BatchContext(matches, raw_values, len(records), self._to_float_column)
+            for position in self.rule_set.composite_positions:
+                if timed:
+                    started = perf_counter()
+                matches[position] = self.rules[position].expression.evaluate_column(context)
+                if timed:
+                    seconds[position] = perf_counter() - started
+
+        if timed:
+            counts = matches.sum(axis=1)
+            self.profiler.record(
+                self.rule_set, len(records), seconds,
+                {position: int(counts[position]) for position in seconds}, errors
+            )
+
+        results: List[List[Dict[str, Any]]] = [[] for _ in records]
+        # nonzero over the transposed matrix yields hits ordered by record, then rule
+        for index, position in zip(*np.nonzero(matches.T)):
+            rule = self.rules[position]
+            results[index].append(rule.to_flag(raw_values[rule.field][index] if rule.field else None))
+
+        return results
+
+    def detect_in_table(
+        self,
+        target: str,
+        persist: bool = False,
+        chunk_size: int = settings.DETECT_STREAM_CHUNK_SIZE
+    ) -> Dict[int, List[Any]]:
+        """
+        Evaluate the rules against a stored table (one of PUSHDOWN_TARGETS),
+        returning the matching row IDs per rule ID. Threshold and anomaly rules
+        over numeric columns run as SQL; other rules stream the rows. With
+        ``persist`` the flags are stored once the scan has finished, since
+        committing would close the cursors still being read.
+        """
+        if target not in PUSHDOWN_TARGETS:
+            raise ValueError(f"Unknown detection target: {target}")
+        table = PUSHDOWN_TARGETS[target].__table__
+
+        matches: Dict[int, List[Any]] = {rule.id: [] for rule in applicable_rules(self.rules, table)}
+        detections = []
+        for rule, entity_id, value in iter_table_matches(self.db, self.rules, table, chunk_size):
+            matches[rule.id].append(entity_id)
+            if persist:
+                detections.append((entity_id, [rule.to_flag(value)]))
+        if persist:
+            self.persist_red_flags(target, detections)
+        return matches
+
+    def persist_red_flags(self, entity_type: str, detections: Iterable[Tuple[Any, List[Dict[str, Any]]]]) -> int:
+        """
+        Store detection output as RedFlag rows, given (entity_id, flags) pairs.
+        Re-detecting the same rule revision on the same entity updates the
+        existing row. Returns the number of flags written.
+        """
+        rules_by_id = {rule.id: rule for rule in self.rules}
+        rows = [
+            red_flag_row(flag, rules_by_id[flag["rule_id"]].version, entity_type, entity_id)
+            for entity_id, flags in detections
+            for flag in flags
+        ]
+        if not rows:
+            return 0
+        return upsert_detected_red_flags(self.db, objs_in=rows)
+
+    def _scan_match(self, position: int, values: Dict[str, Any], errors: Dict[int, int]) -> bool:
+        """Evaluate an individually scanned rule, counting a failing evaluation as an error"""
         try:
-            value = float(value)
-            min_val = params.get("min_value", float('-inf'))
-            max_val = params.get("max_value", float('inf'))
-            
-            return value < min_val or value > max_val
-        except (ValueError, TypeError):
+            return self.rules[position].matches_resolved(values)
+        except Exception:
+            errors[position] = errors.get(position, 0) + 1
             return False
-    
-    def _get_nested_value(self, data: Dict[str, Any], field_path: str) -> Any:
-        """Get value from nested dictionary using dot notation"""
-        keys = field_path.split('.')
-        current = data
-        
-        for key in keys:
-            if isinstance(current, dict) and key in current:
-                current = current[key]
-            else:
-                return None
-        
-        return current
-    
-    def _calculate_confidence(self, data: Dict[str, Any], params: Dict[str, Any]) -> float:
-        """Calculate confidence score for detected red flag"""
-        # This is a simplified implementation
-        # In a real system, you might use more sophisticated methods
-        base_confidence = params.get("base_confidence", 0.5)
-        
-        # Adjust confidence based on data quality
-        field = params.get("field")
-        if field:
-            value = self._get_nested_value(data, field)
-            if value is not None:
-                base_confidence += 0.2
-        
-        return min(base_confidence, 1.0)
-    
-    def _determine_severity(self, data: Dict[str, Any], params: Dict[str, Any]) -> str:
-        """Determine severity level for detected red flag"""
-        # This is a simplified implementation
-        # In a real system, you might use more sophisticated methods
-        base_severity = params.get("severity", "medium")
-        
-        # Adjust severity based on data characteristics
-        field = params.get("field")
-        if field:
-            value = self._get_nested_value(data, field)
-            if isinstance(value, (int, float)):
-                if value > 1000000:  # High value threshold
-                    return "high"
-                elif value > 100000:  # Medium value threshold
-                    return "medium"
-                else:
-                    return "low"
-        
-        return base_severity 
\ No newline at end of file
+
+    @staticmethod
+    def _share_time(seconds: Dict[int, float], positions: List[int], elapsed: float) -> None:
+        """Split the time of an evaluator shared by several rules evenly between them"""
+        share = elapsed / len(positions)
+        for position in positions:
+            seconds[position] = seconds.get(position, 0.0) + share
+
+    @staticmethod
+    def _to_float_column(values: List[Any]) -> np.ndarray:
+        """Convert raw field values to floats, using NaN for missing or non-numeric values"""
+        column = np.full(len(values), np.nan)
+        for index, value in enumerate(values):
+            if value is None:
+                continue
+            try:
+                column[index] = float(value)
+            except (ValueError, TypeError, OverflowError):
+                continue
+        return column
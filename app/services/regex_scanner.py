@@ -0,0 +1,153 @@
+from typing import Any, Hashable, List, Set, Tuple
+import re
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+from app.core.config import settings
+from app.services.pattern_matcher import AhoCorasick
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+if hasattr(sre_constants, "POSSESSIVE_REPEAT"):
+    _REPEATS.add(sre_constants.POSSESSIVE_REPEAT)
+
+
+def compile_regex(pattern: str, ignore_case: bool = False) -> "re.Pattern[str]":
+    """
+    Validate and compile a rule pattern. Python's re has no match timeout,
+    so patterns that can backtrack catastrophically are rejected up front:
+    nested unbounded quantifiers such as ``(a+)+`` and backreferences.
+    """
+    if not isinstance(pattern, str) or not pattern:
+        raise ValueError("regex rules need a non-empty pattern")
+    try:
+        parsed = sre_parse.parse(pattern)
+        regex = re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+    except re.error as e:
+        raise ValueError(f"Invalid regular expression: {e}")
+    try:
+        re.compile(f"(?:{pattern})")
+    except re.error:
+        raise ValueError("Global inline flags are not supported in regex rules, use ignore_case")
+    _check_backtracking(parsed, inside_unbounded=False)
+    return regex
+
+
+def _check_backtracking(items: Any, inside_unbounded: bool) -> None:
+    for op, av in items:
+        if op in _REPEATS:
+            low, high, sub = av
+            unbounded = high == sre_constants.MAXREPEAT
+            if unbounded and inside_unbounded:
+                raise ValueError("Nested unbounded quantifiers can backtrack catastrophically")
+            _check_backtracking(sub, inside_unbounded or unbounded)
+        elif op in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+            raise ValueError("Backreferences are not supported in regex rules")
+        elif op == sre_constants.SUBPATTERN:
+            _check_backtracking(av[-1], inside_unbounded)
+        elif op == sre_constants.BRANCH:
+            # Overlapping alternatives such as (a|aa)+ split a run in exponentially many ways
+            if inside_unbounded:
+                raise ValueError("Alternation inside unbounded quantifiers can backtrack catastrophically")
+            for branch in av[1]:
+                _check_backtracking(branch, inside_unbounded)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            _check_backtracking(av[1], inside_unbounded)
+        elif op == getattr(sre_constants, "ATOMIC_GROUP", None):
+            _check_backtracking(av, inside_unbounded)
+
+
+# Non-ASCII characters matching an ASCII letter under re.IGNORECASE, mapped
+# to it so folded text contains every literal a pattern can match
+_ASCII_FOLD = str.maketrans({"\u0130": "i", "\u0131": "i", "\u017f": "s", "\u212a": "k"})
+
+
+def fold_text(text: str) -> str:
+    """Lower-case text for literal prefiltering, keeping every ASCII case-insensitive match"""
+    return text.translate(_ASCII_FOLD).lower()
+
+
+def required_literal(pattern: str) -> str:
+    """
+    The longest run of ASCII characters that every match of the pattern
+    contains, folded with fold_text, or "" when there is none. Only
+    sequences that must match are considered: alternatives, optional parts
+    and character classes end a run.
+    """
+    return max(_literal_runs(sre_parse.parse(pattern)), key=len, default="")
+
+
+def _literal_runs(items: Any) -> List[str]:
+    runs = [""]
+    for op, av in items:
+        if op == sre_constants.LITERAL and av < 128:
+            runs[-1] += chr(av).lower()
+            continue
+        runs.append("")
+        if op == sre_constants.SUBPATTERN:
+            runs.extend(_literal_runs(av[-1]))
+        elif op in _REPEATS and av[0] >= 1:
+            runs.extend(_literal_runs(av[2]))
+        elif op == getattr(sre_constants, "ATOMIC_GROUP", None):
+            runs.extend(_literal_runs(av))
+    return runs
+
+
+class RegexScanner:
+    """
+    All regex patterns over one field, searched together.
+
+    Each pattern's required literal goes into one Aho-Corasick automaton,
+    so a single pass over the folded text finds the patterns that can
+    match; only those, and patterns without a literal, are then searched
+    with their own compiled regex. Results are those of separate
+    ``re.search`` calls. Text beyond ``REGEX_MAX_INPUT_LENGTH`` characters
+    is not scanned.
+    """
+
+    def __init__(self, max_length: int = settings.REGEX_MAX_INPUT_LENGTH):
+        self.max_length = max_length
+        self._patterns: List[Tuple[str, bool, Hashable]] = []
+        self._regexes: List[Tuple["re.Pattern[str]", Hashable]] = []
+        self._literals = AhoCorasick()
+        self._unfiltered: List[int] = []
+        self._built = False
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def add(self, pattern: str, ignore_case: bool, payload: Hashable) -> None:
+        """Add a pattern validated by compile_regex, reported as payload"""
+        self._patterns.append((pattern, ignore_case, payload))
+        self._built = False
+
+    def build(self) -> None:
+        self._regexes = []
+        self._literals = AhoCorasick()
+        self._unfiltered = []
+        for number, (pattern, ignore_case, payload) in enumerate(self._patterns):
+            self._regexes.append((re.compile(pattern, re.IGNORECASE if ignore_case else 0), payload))
+            literal = required_literal(pattern)
+            if literal:
+                self._literals.add(literal, number)
+            else:
+                self._unfiltered.append(number)
+        self._literals.build()
+        self._built = True
+
+    def search(self, text: str) -> Set[Hashable]:
+        """Payloads of all patterns found in the text"""
+        if not self._built:
+            self.build()
+        text = text[:self.max_length]
+        candidates = self._literals.search(fold_text(text))
+        candidates.update(self._unfiltered)
+        found: Set[Hashable] = set()
+        for number in candidates:
+            regex, payload = self._regexes[number]
+            if regex.search(text) is not None:
+                found.add(payload)
+        return found
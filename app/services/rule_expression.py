@@ -0,0 +1,273 @@
+from typing import Any, Callable, Dict, List, Set, Tuple
+import json
+
+import numpy as np
+
+# Parent evaluations between two re-orderings of its children
+REORDER_INTERVAL = 256
+
+
+class RecordContext:
+    """State of evaluating expressions on one record"""
+
+    def __init__(self, matched: Set[int], values: Dict[str, Any]):
+        self.matched = matched
+        self.values = values
+        self.memo: Dict[int, bool] = {}
+
+
+class BatchContext:
+    """State of evaluating expressions on a batch of records"""
+
+    def __init__(
+        self,
+        matches: np.ndarray,
+        raw_values: Dict[str, List[Any]],
+        size: int,
+        to_float_column: Callable[[List[Any]], np.ndarray]
+    ):
+        self.matches = matches
+        self.raw_values = raw_values
+        self.size = size
+        self.to_float_column = to_float_column
+        self.memo: Dict[int, np.ndarray] = {}
+        self._float_columns: Dict[str, np.ndarray] = {}
+
+    def float_column(self, field: str) -> np.ndarray:
+        if field not in self._float_columns:
+            self._float_columns[field] = self.to_float_column(self.raw_values[field])
+        return self._float_columns[field]
+
+
+class ExpressionNode:
+    """
+    Node of a compiled condition DAG.
+
+    Nodes with several parents are shared: their result is memoised per
+    record or batch, so they are evaluated once. Every node counts how often
+    it held, which parents use to run their most decisive children first.
+    """
+
+    def __init__(self, cost: float):
+        self.id = 0
+        self.cost = cost
+        # Parents, and composite rules using the node as their condition
+        self.references = 0
+        self.evaluations = 0
+        self.true_count = 0
+
+    @property
+    def shared(self) -> bool:
+        return self.references > 1
+
+    @property
+    def true_rate(self) -> float:
+        # Laplace smoothing keeps untried nodes at an even chance
+        return (self.true_count + 1) / (self.evaluations + 2)
+
+    def evaluate(self, context: RecordContext) -> bool:
+        if self.shared and self.id in context.memo:
+            return context.memo[self.id]
+        result = self._evaluate(context)
+        self.evaluations += 1
+        self.true_count += result
+        if self.shared:
+            context.memo[self.id] = result
+        return result
+
+    def evaluate_column(self, context: BatchContext) -> np.ndarray:
+        if self.shared and self.id in context.memo:
+            return context.memo[self.id]
+        result = self._evaluate_column(context)
+        if self.shared:
+            context.memo[self.id] = result
+        return result
+
+    def _evaluate(self, context: RecordContext) -> bool:
+        raise NotImplementedError
+
+    def _evaluate_column(self, context: BatchContext) -> np.ndarray:
+        raise NotImplementedError
+
+
+class RuleReference(ExpressionNode):
+    """Result of another rule of the rule set, already computed for the record"""
+
+    def __init__(self, position: int):
+        super().__init__(cost=0.0)
+        self.position = position
+
+    def _evaluate(self, context: RecordContext) -> bool:
+        return self.position in context.matched
+
+    def _evaluate_column(self, context: BatchContext) -> np.ndarray:
+        return context.matches[self.position]
+
+
+class Predicate(ExpressionNode):
+    """Inline single-condition rule, such as a threshold or pattern"""
+
+    def __init__(self, rule: Any):
+        super().__init__(cost=rule.cost)
+        self.rule = rule
+
+    def _evaluate(self, context: RecordContext) -> bool:
+        return self.rule.matches_resolved(context.values)
+
+    def _evaluate_column(self, context: BatchContext) -> np.ndarray:
+        if self.rule.vectorized:
+            return self.rule.matches_column(context.float_column(self.rule.field))
+        fields = self.rule.fields
+        rows = zip(*[context.raw_values[field] for field in fields])
+        return np.fromiter(
+            (self.rule.matches_resolved(dict(zip(fields, row))) for row in rows),
+            dtype=bool, count=context.size
+        )
+
+
+class Not(ExpressionNode):
+    def __init__(self, child: ExpressionNode):
+        super().__init__(cost=child.cost)
+        self.child = child
+
+    def _evaluate(self, context: RecordContext) -> bool:
+        return not self.child.evaluate(context)
+
+    def _evaluate_column(self, context: BatchContext) -> np.ndarray:
+        return ~self.child.evaluate_column(context)
+
+
+class Junction(ExpressionNode):
+    """AND (``all``) or OR (``any``) over children, short-circuiting per record"""
+
+    def __init__(self, children: List[ExpressionNode], conjunction: bool):
+        super().__init__(cost=sum(child.cost for child in children))
+        self.conjunction = conjunction
+        self.children = tuple(children)
+        self._since_reorder = 0
+        self._reorder()
+
+    def _reorder(self) -> None:
+        """
+        Run cheap children likely to decide the result first: those likely
+        false for AND, likely true for OR. Rebinding the tuple keeps
+        concurrent evaluations consistent.
+        """
+        def expected_cost(child: ExpressionNode) -> float:
+            decisive = 1 - child.true_rate if self.conjunction else child.true_rate
+            return child.cost / max(decisive, 0.01)
+
+        self.children = tuple(sorted(self.children, key=expected_cost))
+        self._since_reorder = 0
+
+    def _evaluate(self, context: RecordContext) -> bool:
+        self._since_reorder += 1
+        if self._since_reorder >= REORDER_INTERVAL:
+            self._reorder()
+        decisive = not self.conjunction
+        for child in self.children:
+            if child.evaluate(context) == decisive:
+                return decisive
+        return not decisive
+
+    def _evaluate_column(self, context: BatchContext) -> np.ndarray:
+        combine = np.logical_and if self.conjunction else np.logical_or
+        result = np.full(context.size, self.conjunction)
+        for child in self.children:
+            result = combine(result, child.evaluate_column(context))
+        return result
+
+
+class ExpressionBuilder:
+    """
+    Compiles condition objects into one DAG for the whole rule set.
+    Structurally equal sub-expressions, in any composite rule, become one
+    shared node.
+    """
+
+    def __init__(
+        self,
+        rule_positions: Dict[int, int],
+        compile_predicate: Callable[[Dict[str, Any]], Any]
+    ):
+        self.rule_positions = rule_positions
+        self.compile_predicate = compile_predicate
+        self.nodes: Dict[Any, ExpressionNode] = {}
+        self.predicates: List[Any] = []
+
+    def build(self, condition: Dict[str, Any]) -> ExpressionNode:
+        key, node = self._build(condition)
+        return node
+
+    def _build(self, condition: Any) -> Tuple[Any, ExpressionNode]:
+        key = self._key(condition)
+        node = self.nodes.get(key)
+        if node is None:
+            # Children are only built, and referenced, by a new node
+            node = self._make(condition)
+            node.id = len(self.nodes)
+            self.nodes[key] = node
+        node.references += 1
+        return key, node
+
+    def _key(self, condition: Any) -> Any:
+        """Structural key of a condition, equal for conditions that always agree"""
+        if not isinstance(condition, dict):
+            raise ValueError("conditions must be JSON objects")
+        if "rule" in condition:
+            return ("rule", self.rule_positions[condition["rule"]])
+        if "not" in condition:
+            return ("not", self._key(condition["not"]))
+        for operator in ("all", "any"):
+            if operator in condition:
+                operands = condition[operator]
+                if not isinstance(operands, list) or not operands:
+                    raise ValueError(f"'{operator}' needs a non-empty list of conditions")
+                if len(operands) == 1:
+                    return self._key(operands[0])
+                # Operands commute, so their order does not change the key
+                return (operator, tuple(sorted({self._key(operand) for operand in operands}, key=repr)))
+        return ("predicate", json.dumps(condition, sort_keys=True))
+
+    def _make(self, condition: Dict[str, Any]) -> ExpressionNode:
+        if "rule" in condition:
+            return RuleReference(self.rule_positions[condition["rule"]])
+        if "not" in condition:
+            return Not(self._build(condition["not"])[1])
+        for operator in ("all", "any"):
+            if operator in condition:
+                operands = condition[operator]
+                if len(operands) == 1:
+                    return self._make(operands[0])
+                children: Dict[Any, ExpressionNode] = {}
+                for operand in operands:
+                    key = self._key(operand)
+                    if key not in children:
+                        children[key] = self._build(operand)[1]
+                return Junction(list(children.values()), conjunction=operator == "all")
+        predicate = self.compile_predicate(condition)
+        self.predicates.append(predicate)
+        return Predicate(predicate)
+
+
+def condition_leaves(condition: Any) -> Tuple[Set[int], List[Dict[str, Any]]]:
+    """Validate a condition, returning the rule IDs it refers to and its inline predicates"""
+    if not isinstance(condition, dict):
+        raise ValueError("conditions must be JSON objects")
+    if "rule" in condition:
+        return {condition["rule"]}, []
+    if "not" in condition:
+        return condition_leaves(condition["not"])
+    for operator in ("all", "any"):
+        if operator in condition:
+            operands = condition[operator]
+            if not isinstance(operands, list) or not operands:
+                raise ValueError(f"'{operator}' needs a non-empty list of conditions")
+            references: Set[int] = set()
+            predicates: List[Dict[str, Any]] = []
+            for operand in operands:
+                operand_references, operand_predicates = condition_leaves(operand)
+                references |= operand_references
+                predicates += operand_predicates
+            return references, predicates
+    return set(), [condition]
@@ -0,0 +1,187 @@
+from typing import Any, Dict, List, Optional, Tuple
+from collections import deque
+import logging
+import random
+import threading
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Report columns that rules can be ordered by
+PROFILE_SORT_KEYS = (
+    "total_ms", "mean_ms", "p99_ms", "evaluations", "matches", "match_rate", "errors", "slow_evaluations"
+)
+
+
+class RuleStats:
+    """Evaluation counters of one revision of a rule"""
+
+    def __init__(self, rule: Any, window: int):
+        self.rule_id = rule.id
+        self.rule_name = rule.name
+        self.rule_type = rule.rule_type
+        self.version = rule.version
+        self.evaluations = 0
+        self.matches = 0
+        self.errors = 0
+        self.slow_evaluations = 0
+        self.total_seconds = 0.0
+        # Recent single-record evaluation times, for percentiles
+        self.durations: "deque[float]" = deque(maxlen=window)
+
+    def merge(self, other: "RuleStats") -> None:
+        """Add the counters of another RuleStats of the same revision"""
+        self.evaluations += other.evaluations
+        self.matches += other.matches
+        self.errors += other.errors
+        self.slow_evaluations += other.slow_evaluations
+        self.total_seconds += other.total_seconds
+        self.durations.extend(other.durations)
+
+    def to_dict(self) -> Dict[str, Any]:
+        evaluations = self.evaluations
+        return {
+            "rule_id": self.rule_id,
+            "rule_name": self.rule_name,
+            "rule_type": self.rule_type,
+            "rule_version": self.version,
+            "evaluations": evaluations,
+            "matches": self.matches,
+            "match_rate": self.matches / evaluations if evaluations else 0.0,
+            "errors": self.errors,
+            "slow_evaluations": self.slow_evaluations,
+            "total_ms": self.total_seconds * 1000,
+            "mean_ms": self.total_seconds * 1000 / evaluations if evaluations else 0.0,
+            "p99_ms": float(np.percentile(self.durations, 99)) * 1000 if self.durations else None,
+        }
+
+
+# One recorded evaluation: rule set, record count, and seconds, matches and errors per rule position
+Sample = Tuple[Any, int, Dict[int, float], Dict[int, int], Dict[int, int]]
+
+
+class RuleProfiler:
+    """
+    Per-rule evaluation counters collected by the detection engine.
+
+    Profiling is off unless enabled, and then only ``sample_rate`` of the
+    detection calls are timed and counted; the others run without any
+    timing. Recorded evaluations are buffered and folded into the counters
+    every ``flush_every`` samples and before reporting, outside the lock,
+    which guards only the buffer and the merge of the folded totals.
+
+    Rules sharing a pattern automaton or threshold index on one field are
+    evaluated together, so that evaluator's time is split evenly between
+    them. Percentiles are over single-record evaluations: batch evaluations
+    time whole columns and only add to the totals. Counters restart when a
+    rule's definition changes.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = settings.RULE_PROFILING_ENABLED,
+        slow_rule_ms: Optional[float] = settings.SLOW_RULE_LOG_MS,
+        window: int = settings.RULE_PROFILE_WINDOW,
+        sample_rate: float = settings.RULE_PROFILE_SAMPLE_RATE,
+        flush_every: int = 100
+    ):
+        self.enabled = enabled
+        self.slow_rule_ms = slow_rule_ms
+        self.window = window
+        self.sample_rate = sample_rate
+        self.flush_every = flush_every
+        self._stats: Dict[int, RuleStats] = {}
+        self._pending: List[Sample] = []
+        self._lock = threading.Lock()
+
+    def sample(self) -> bool:
+        """Whether to time the next detection call"""
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def record(
+        self,
+        rule_set: Any,
+        records: int,
+        seconds: Dict[int, float],
+        matches: Dict[int, int],
+        errors: Dict[int, int]
+    ) -> None:
+        """
+        Add one evaluation over ``records`` records, given the seconds spent,
+        matches and errors per rule position in the rule set
+        """
+        with self._lock:
+            self._pending.append((rule_set, records, seconds, matches, errors))
+            if len(self._pending) < self.flush_every:
+                return
+            pending, self._pending = self._pending, []
+        self._merge(pending)
+
+    def flush(self) -> None:
+        """Fold buffered evaluations into the counters"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if pending:
+            self._merge(pending)
+
+    def _merge(self, pending: List[Sample]) -> None:
+        folded: Dict[int, RuleStats] = {}
+        slow = []
+        for rule_set, records, seconds, matches, errors in pending:
+            for position, elapsed in seconds.items():
+                rule = rule_set.rules[position]
+                stats = folded.get(rule.id)
+                if stats is None or stats.version != rule.version:
+                    stats = folded[rule.id] = RuleStats(rule, self.window)
+
+                per_record = elapsed / records
+                stats.evaluations += records
+                stats.matches += matches.get(position, 0)
+                stats.errors += errors.get(position, 0)
+                stats.total_seconds += elapsed
+                if records == 1:
+                    stats.durations.append(elapsed)
+                if self.slow_rule_ms is not None and per_record * 1000 > self.slow_rule_ms:
+                    stats.slow_evaluations += records
+                    slow.append((rule, per_record))
+
+        with self._lock:
+            for rule_id, stats in folded.items():
+                current = self._stats.get(rule_id)
+                if current is None or current.version != stats.version:
+                    self._stats[rule_id] = stats
+                else:
+                    current.merge(stats)
+
+        for rule, per_record in slow:
+            logger.warning(
+                "Slow red flag rule %s (%s, %s): %.3f ms per record",
+                rule.id, rule.name, rule.rule_type, per_record * 1000
+            )
+
+    def report(self, sort_by: str = "total_ms", limit: Optional[int] = None) -> Dict[str, Any]:
+        """Per-rule counters, hottest first"""
+        if sort_by not in PROFILE_SORT_KEYS:
+            raise ValueError(f"Unknown sort key: {sort_by}")
+        self.flush()
+        with self._lock:
+            rules = [stats.to_dict() for stats in self._stats.values()]
+        # Rules without single-record evaluations have no p99
+        rules.sort(key=lambda row: row[sort_by] or 0.0, reverse=True)
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "slow_rule_ms": self.slow_rule_ms,
+            "rules": rules[:limit] if limit else rules,
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._pending = []
+
+
+rule_profiler = RuleProfiler()
@@ -0,0 +1,102 @@
+from typing import Any, Iterator, List, Optional, Tuple
+from sqlalchemy import Table, false, or_, select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.types import Integer, Numeric
+
+from app.models.award import AwardItem
+from app.models.contracting_process import ContractingProcess
+from app.models.ocds import OCDSContract
+from app.services.field_accessor import parse_field_path
+from app.services.rule_set import AnomalyRule, CompiledRule, CompositeRule, ThresholdRule
+
+# Stored tables that rules can be evaluated against
+PUSHDOWN_TARGETS = {
+    "ocds_contracts": OCDSContract,
+    "contracting_processes": ContractingProcess,
+    "award_items": AwardItem,
+}
+
+
+def rule_to_clause(rule: CompiledRule, table: Table) -> Optional[ColumnElement]:
+    """
+    Translate a rule into a WHERE clause over one numeric column of the table.
+    Returns None when the rule cannot be expressed in SQL.
+    """
+    if not rule.field or rule.field not in table.c:
+        return None
+    column = table.c[rule.field]
+    if not isinstance(column.type, (Numeric, Integer)):
+        return None
+
+    if isinstance(rule, ThresholdRule):
+        if rule.threshold is None or rule.compare is None:
+            return false()
+        return rule.compare(column, rule.threshold)
+
+    if isinstance(rule, AnomalyRule):
+        conditions = []
+        if rule.min_value != float('-inf'):
+            conditions.append(column < rule.min_value)
+        if rule.max_value != float('inf'):
+            conditions.append(column > rule.max_value)
+        return or_(*conditions) if conditions else false()
+
+    return None
+
+
+def reads_table(rule: CompiledRule, table: Table) -> bool:
+    """
+    Whether the rule's field starts at a column of the table. Composite
+    rules never do: their field only supplies the reported value, and the
+    rules they combine are not evaluated per row here.
+    """
+    if not rule.field or isinstance(rule, CompositeRule):
+        return False
+    first_step = parse_field_path(rule.field)[0]
+    return isinstance(first_step, str) and first_step in table.c
+
+
+def applicable_rules(rules: List[CompiledRule], table: Table) -> List[CompiledRule]:
+    """Rules that can be evaluated against rows of the table"""
+    return [
+        rule for rule in rules
+        if rule_to_clause(rule, table) is not None or reads_table(rule, table)
+    ]
+
+
+def iter_table_matches(
+    db: Session,
+    rules: List[CompiledRule],
+    table: Table,
+    chunk_size: int = 1000
+) -> Iterator[Tuple[CompiledRule, Any, Any]]:
+    """
+    Evaluate rules against every row of a stored table, yielding
+    (rule, row ID, field value) for each match.
+
+    Rules that translate to SQL are answered by the database directly. The
+    remaining rules reading the table are evaluated in Python over a streamed
+    cursor of plain row mappings, ``chunk_size`` rows at a time; no ORM
+    objects are loaded either way.
+    """
+    id_column = list(table.primary_key.columns)[0]
+    fallback_rules: List[CompiledRule] = []
+
+    for rule in rules:
+        clause = rule_to_clause(rule, table)
+        if clause is not None:
+            stmt = select(id_column, table.c[rule.field]).where(clause)
+            for entity_id, value in db.execute(stmt.execution_options(yield_per=chunk_size)):
+                yield rule, entity_id, value
+        elif reads_table(rule, table):
+            fallback_rules.append(rule)
+
+    if fallback_rules:
+        result = db.execute(select(table).execution_options(yield_per=chunk_size))
+        for rows in result.mappings().partitions(chunk_size):
+            for row in rows:
+                record = dict(row)
+                for rule in fallback_rules:
+                    if rule.matches(record):
+                        yield rule, record[id_column.name], rule.get_value(record)
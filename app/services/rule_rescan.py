@@ -0,0 +1,85 @@
+from typing import Any, Dict, List, Optional
+from sqlalchemy.orm import Session
+import json
+
+from app.core.config import settings
+from app.crud.red_flag import (
+    get_red_flag_rule, deactivate_red_flags_for_rule, deactivate_stale_red_flags_for_rule,
+    upsert_detected_red_flags
+)
+from app.services.peer_statistics import peer_statistics
+from app.services.red_flag_engine import red_flag_row
+from app.services.rule_pushdown import PUSHDOWN_TARGETS, iter_table_matches
+from app.services.rule_set import DATASET_RULE_TYPES, StatisticalRule, compile_rule
+
+
+def rescan_rule(
+    db: Session,
+    rule_id: int,
+    targets: Optional[List[str]] = None,
+    chunk_size: int = settings.DETECT_STREAM_CHUNK_SIZE
+) -> Dict[str, Any]:
+    """
+    Re-evaluate a single rule over the stored tables after it changed.
+
+    Only this rule is evaluated, through SQL pushdown where possible. Within
+    one transaction, every active flag the rule produced for a table is
+    deactivated and the current matches are upserted under the rule's new
+    version, so flags that no longer match are retired and matching ones are
+    (re-)activated. A deleted, inactive or shadow rule only retires its flags.
+    Composite rules depend on the results of other rules and are rejected,
+    as are rules evaluated by dataset detectors.
+
+    Flags stored for entity types that are not stored tables, e.g. through
+    ``/detect/``, cannot be re-evaluated: those from other revisions of the
+    rule are retired, and those of the current revision are kept.
+    """
+    targets = targets or list(PUSHDOWN_TARGETS)
+    for target in targets:
+        if target not in PUSHDOWN_TARGETS:
+            raise ValueError(f"Unknown detection target: {target}")
+
+    rule = get_red_flag_rule(db, id=rule_id)
+    if rule is not None and rule.rule_type in DATASET_RULE_TYPES:
+        raise ValueError(f"Rule {rule_id} is evaluated by the {rule.rule_type} detector, not by re-scans")
+    if rule is not None and rule.rule_type == "composite":
+        raise ValueError(f"Rule {rule_id} combines other rules and is re-evaluated by detection jobs, not by re-scans")
+    compiled = None
+    if rule is not None and rule.is_active and not rule.shadow:
+        try:
+            compiled = compile_rule(rule)
+        except (json.JSONDecodeError, ValueError, TypeError) as e:
+            raise ValueError(f"Rule {rule_id} cannot be compiled: {e}")
+    if isinstance(compiled, StatisticalRule):
+        # Job workers never build an engine, which is what loads the statistics otherwise
+        peer_statistics.ensure_loaded(db)
+
+    summary: Dict[str, Any] = {
+        "rule_id": rule_id,
+        "rule_version": compiled.version if compiled else None,
+        "targets": {},
+    }
+    try:
+        for target in targets:
+            previously_flagged = deactivate_red_flags_for_rule(db, rule_id=rule_id, entity_type=target)
+            rows = []
+            if compiled is not None:
+                table = PUSHDOWN_TARGETS[target].__table__
+                for _, entity_id, value in iter_table_matches(db, [compiled], table, chunk_size):
+                    rows.append(red_flag_row(compiled.to_flag(value), compiled.version, target, entity_id))
+            upsert_detected_red_flags(db, objs_in=rows, commit=False)
+            summary["targets"][target] = {
+                "previously_flagged": previously_flagged,
+                "flagged": len(rows),
+            }
+        summary["other_entity_types"] = {
+            "retired": deactivate_stale_red_flags_for_rule(
+                db, rule_id=rule_id, rule_version=summary["rule_version"],
+                exclude_entity_types=list(PUSHDOWN_TARGETS)
+            ),
+        }
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return summary
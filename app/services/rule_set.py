@@ -0,0 +1,521 @@
+from typing import List, Dict, Any, Optional, Callable, Set, Tuple
+from sqlalchemy.orm import Session
+from types import SimpleNamespace
+import hashlib
+import json
+import logging
+import operator
+import threading
+import time
+
+import numpy as np
+
+from app.core.config import settings
+from app.models.red_flag import RedFlagRule
+from app.services.field_accessor import FieldAccessor, compile_field_path
+from app.services.pattern_matcher import AhoCorasick
+from app.services.peer_statistics import peer_statistics
+from app.services.regex_scanner import RegexScanner, compile_regex
+from app.services.rule_expression import ExpressionBuilder, ExpressionNode, condition_leaves
+from app.services.threshold_index import ThresholdIndex
+
+logger = logging.getLogger(__name__)
+
+
+# Comparison operators supported by threshold rules
+THRESHOLD_OPERATORS: Dict[str, Callable[[float, float], bool]] = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+}
+
+
+class CompiledRule:
+    """A red flag rule with its parameters parsed and constants resolved"""
+
+    # Relative cost of one evaluation, used to order composite conditions
+    cost = 1.0
+    # Whether matches_column is implemented
+    vectorized = False
+
+    def __init__(self, rule: RedFlagRule, params: Dict[str, Any]):
+        self.id = rule.id
+        self.name = rule.name
+        self.description = rule.description
+        self.params = params
+        self.field: Optional[str] = params.get("field")
+        self.accessor: Optional[FieldAccessor] = compile_field_path(self.field) if self.field else None
+        # Every field the rule reads; the rule field comes first
+        self.fields: List[str] = [self.field] if self.field else []
+        self.category = params.get("category", "general")
+        self.severity = params.get("severity", "medium")
+        self.base_confidence = float(params.get("base_confidence", 0.5))
+        self.version = rule_version(rule.rule_type, rule.parameters)
+        # The rule type is kept as stored so flags report it unchanged
+        self.rule_type = rule.rule_type
+        self.shadow = bool(getattr(rule, "shadow", False))
+
+    def get_value(self, data: Dict[str, Any]) -> Any:
+        """Get the rule field value from a record"""
+        if self.accessor is None:
+            return None
+        return self.accessor(data)
+
+    def matches(self, data: Dict[str, Any]) -> bool:
+        """Evaluate if the rule matches the data"""
+        if not self.field:
+            return False
+        return self.matches_resolved({field: compile_field_path(field)(data) for field in self.fields})
+
+    def matches_resolved(self, values: Dict[str, Any]) -> bool:
+        """Evaluate the rule against already resolved values of its fields"""
+        value = values[self.field]
+        return value is not None and self.matches_value(value)
+
+    def matches_value(self, value: Any) -> bool:
+        """Evaluate the rule against an already resolved field value"""
+        return False
+
+    def matches_column(self, column: np.ndarray) -> np.ndarray:
+        """
+        Evaluate the rule over a float column of field values, NaN where the
+        value is missing or not numeric. Implemented by rules that set
+        ``vectorized``: threshold and anomaly rules.
+        """
+        raise NotImplementedError
+
+    def confidence(self, value: Any) -> float:
+        """Calculate confidence score for a detected red flag"""
+        confidence = self.base_confidence
+        if self.field and value is not None:
+            confidence += 0.2
+        return min(confidence, 1.0)
+
+    def determine_severity(self, value: Any) -> str:
+        """Determine severity level for a detected red flag"""
+        if self.field and isinstance(value, (int, float)):
+            if value > 1000000:  # High value threshold
+                return "high"
+            elif value > 100000:  # Medium value threshold
+                return "medium"
+            else:
+                return "low"
+        return self.severity
+
+    def to_flag(self, value: Any) -> Dict[str, Any]:
+        """Build the detection result for a matched record value"""
+        return {
+            "rule_id": self.id,
+            "rule_name": self.name,
+            "rule_description": self.description,
+            "rule_type": self.rule_type,
+            "confidence_score": self.confidence(value),
+            "severity": self.determine_severity(value),
+            "category": self.category,
+            "source": "rule_engine"
+        }
+
+
+class PatternRule(CompiledRule):
+    """Case-insensitive substring rule"""
+
+    cost = 2.0
+
+    def __init__(self, rule: RedFlagRule, params: Dict[str, Any]):
+        super().__init__(rule, params)
+        pattern = params.get("pattern")
+        self.pattern = pattern.lower() if pattern else None
+
+    def matches_value(self, value: Any) -> bool:
+        if not self.pattern:
+            return False
+        return isinstance(value, str) and self.pattern in value.lower()
+
+
+class RegexRule(CompiledRule):
+    """Regular expression searched anywhere in a text field"""
+
+    cost = 3.0
+
+    def __init__(self, rule: RedFlagRule, params: Dict[str, Any]):
+        super().__init__(rule, params)
+        self.pattern = params.get("pattern")
+        self.ignore_case = bool(params.get("ignore_case", False))
+        self.regex = compile_regex(self.pattern, self.ignore_case)
+
+    def matches_value(self, value: Any) -> bool:
+        if not isinstance(value, str):
+            return False
+        return self.regex.search(value[:settings.REGEX_MAX_INPUT_LENGTH]) is not None
+
+
+class ThresholdRule(CompiledRule):
+    """Numeric comparison of a field against a fixed threshold"""
+
+    vectorized = True
+
+    def __init__(self, rule: RedFlagRule, params: Dict[str, Any]):
+        super().__init__(rule, params)
+        self.operator = params.get("operator", ">")
+        self.compare = THRESHOLD_OPERATORS.get(self.operator)
+        try:
+            self.threshold = float(params.get("threshold"))
+        except (ValueError, TypeError):
+            self.threshold = None
+
+    def matches_value(self, value: Any) -> bool:
+        if self.threshold is None or self.compare is None:
+            return False
+        try:
+            return self.compare(float(value), self.threshold)
+        except (ValueError, TypeError, OverflowError):
+            return False
+
+    def matches_column(self, column: np.ndarray) -> np.ndarray:
+        if self.threshold is None or self.compare is None:
+            return np.zeros(len(column), dtype=bool)
+        return self.compare(column, self.threshold)
+
+
+class AnomalyRule(CompiledRule):
+    """Flags numeric values outside a fixed [min_value, max_value] range"""
+
+    vectorized = True
+
+    def __init__(self, rule: RedFlagRule, params: Dict[str, Any]):
+        super().__init__(rule, params)
+        self.min_value = float(params.get("min_value", float('-inf')))
+        self.max_value = float(params.get("max_value", float('inf')))
+
+    def matches_value(self, value: Any) -> bool:
+        try:
+            value = float(value)
+        except (ValueError, TypeError, OverflowError):
+            return False
+        return value < self.min_value or value > self.max_value
+
+    def matches_column(self, column: np.ndarray) -> np.ndarray:
+        return (column < self.min_value) | (column > self.max_value)
+
+
+class StatisticalRule(CompiledRule):
+    """
+    Flags numeric values more than ``k`` standard deviations (``zscore``) or
+    scaled median absolute deviations (``mad``) away from their peer group.
+
+    The peer group is the value of ``group_by`` (e.g. ``procurement_method``),
+    or every record when unset. Groups with fewer than ``min_samples``
+    observations are never flagged.
+    """
+
+    # Scales the MAD to a standard deviation for normally distributed values
+    MAD_SCALE = 1.4826
+    cost = 4.0
+
+    def __init__(self, rule: RedFlagRule, params: Dict[str, Any]):
+        super().__init__(rule, params)
+        self.group_by: Optional[str] = params.get("group_by")
+        self.method = params.get("method", "zscore")
+        if self.method not in ("zscore", "mad"):
+            raise ValueError(f"Unknown statistical method: {self.method}")
+        self.k = float(params.get("k", 3))
+        self.min_samples = int(params.get("min_samples", 30))
+        if self.group_by:
+            compile_field_path(self.group_by)
+            self.fields.append(self.group_by)
+
+    @property
+    def peer_group(self) -> Tuple[str, str]:
+        """(field, group_by) whose statistics the rule reads"""
+        return self.field, self.group_by or ""
+
+    def matches_resolved(self, values: Dict[str, Any]) -> bool:
+        group_value = values[self.group_by] if self.group_by else ""
+        if values[self.field] is None or group_value is None:
+            return False
+        try:
+            value = float(values[self.field])
+        except (ValueError, TypeError, OverflowError):
+            return False
+
+        stats = peer_statistics.get((self.field, self.group_by or "", str(group_value)))
+        if stats is None or stats.count < self.min_samples:
+            return False
+        if self.method == "zscore":
+            spread, centre = stats.std, stats.mean
+        else:
+            spread, centre = stats.mad * self.MAD_SCALE, stats.median.value()
+        return spread > 0 and abs(value - centre) > self.k * spread
+
+    def matches_value(self, value: Any) -> bool:
+        if self.group_by:
+            return False
+        return self.matches_resolved({self.field: value})
+
+
+class CompositeRule(CompiledRule):
+    """
+    Combines other active rules (``{"rule": id}``) and inline predicates
+    (``{"type": "threshold", "field": ...}``) with ``all``, ``any`` and
+    ``not``. The optional ``field`` only supplies the value reported with
+    the flag. The condition is evaluated by the rule set, which knows the
+    results of the referenced rules.
+    """
+
+    def __init__(self, rule: RedFlagRule, params: Dict[str, Any]):
+        super().__init__(rule, params)
+        self.condition = params.get("condition")
+        self.references, predicates = condition_leaves(self.condition)
+        for predicate in predicates:
+            compile_predicate(predicate)
+        # Bound by CompiledRuleSet once rule positions are known
+        self.expression: Optional[ExpressionNode] = None
+
+    def matches_resolved(self, values: Dict[str, Any]) -> bool:
+        return False
+
+
+# Compiled rule class per stored rule_type
+RULE_TYPES = {
+    "pattern": PatternRule,
+    "regex": RegexRule,
+    "threshold": ThresholdRule,
+    "anomaly": AnomalyRule,
+    "statistical": StatisticalRule,
+    "composite": CompositeRule,
+}
+
+# Rule types evaluated over whole tables by dedicated detectors, not per record
+DATASET_RULE_TYPES = {
+    "bid_rigging", "single_bidder", "value_distribution", "split_purchase", "related_suppliers", "bid_rotation",
+    "tender_timing",
+}
+
+
+def rule_version(rule_type: str, parameters: str) -> str:
+    """Content digest identifying one revision of a rule's definition"""
+    digest = hashlib.sha1(f"{rule_type}\n{parameters}".encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def compile_rule(rule: RedFlagRule) -> CompiledRule:
+    """Parse a stored rule into its compiled form"""
+    params = json.loads(rule.parameters)
+    if not isinstance(params, dict):
+        raise ValueError("rule parameters must be a JSON object")
+    rule_class = RULE_TYPES.get(rule.rule_type, CompiledRule)
+    return rule_class(rule, params)
+
+
+def compile_predicate(params: Dict[str, Any]) -> CompiledRule:
+    """Compile an inline predicate of a composite condition"""
+    rule_type = params.get("type")
+    rule_class = RULE_TYPES.get(rule_type)
+    if rule_class is None or rule_class is CompositeRule:
+        raise ValueError(f"Unknown predicate type: {rule_type}")
+    if not params.get("field"):
+        raise ValueError("predicates need a field")
+    parameters = json.dumps(params, sort_keys=True)
+    return rule_class(SimpleNamespace(id=None, name="", description="", rule_type=rule_type,
+                                      parameters=parameters), params)
+
+
+class CompiledRuleSet:
+    """Immutable snapshot of the active rules, compiled once and shared"""
+
+    def __init__(self, rules: List[RedFlagRule]):
+        self.rules: List[CompiledRule] = []
+        self.errors: Dict[int, str] = {}
+        for rule in rules:
+            if rule.rule_type in DATASET_RULE_TYPES:
+                continue
+            try:
+                self.rules.append(compile_rule(rule))
+            except (json.JSONDecodeError, ValueError, TypeError) as e:
+                self.errors[rule.id] = str(e)
+        self._composite_order = self._resolve_composites()
+
+        fingerprint = "\n".join(
+            f"{rule.id}:{rule.version}" for rule in sorted(self.rules, key=lambda r: r.id)
+        )
+        self.version = hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()[:12]
+        self.loaded_at = time.monotonic()
+        self._build_indexes()
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def _resolve_composites(self) -> List[int]:
+        """
+        Drop composite rules referring to missing rules or to themselves,
+        returning the IDs of the rest so that every composite comes after
+        the composites it refers to.
+        """
+        while True:
+            ids = {rule.id for rule in self.rules}
+            composites = {rule.id: rule for rule in self.rules if isinstance(rule, CompositeRule)}
+            dropped = {
+                rule.id: f"Composite rule refers to unknown or inactive rules {sorted(rule.references - ids)}"
+                for rule in composites.values() if not rule.references <= ids
+            }
+            if not dropped:
+                order: List[int] = []
+                pending = dict(composites)
+                while pending:
+                    ready = [rule_id for rule_id, rule in pending.items()
+                             if not rule.references & pending.keys()]
+                    if not ready:
+                        break
+                    order.extend(ready)
+                    for rule_id in ready:
+                        del pending[rule_id]
+                dropped = {rule_id: "Composite rule refers to itself" for rule_id in pending}
+                if not dropped:
+                    return order
+
+            self.errors.update(dropped)
+            self.rules = [rule for rule in self.rules if rule.id not in dropped]
+
+    def _build_indexes(self) -> None:
+        """
+        Group rules by how they are evaluated. Rules on the same field share
+        one evaluator keyed by rule position: an Aho-Corasick automaton for
+        pattern rules, a merged RegexScanner for regex rules and a sorted
+        ThresholdIndex for threshold and anomaly rules. Composite rules are compiled into one expression DAG over
+        the other rules' results. Any other rule that can match is scanned
+        individually.
+        """
+        self.pattern_matchers: Dict[str, AhoCorasick] = {}
+        self.pattern_positions: Dict[str, List[int]] = {}
+        self.regex_scanners: Dict[str, RegexScanner] = {}
+        self.regex_positions: Dict[str, List[int]] = {}
+        self.threshold_indexes: Dict[str, ThresholdIndex] = {}
+        self.scan_positions: List[int] = []
+        # Accessor for every field read by a rule that can match
+        self.accessors: Dict[str, FieldAccessor] = {}
+        # (field, group_by) pairs whose peer group statistics rules read
+        self.peer_group_specs: Set[Tuple[str, str]] = set()
+
+        for position, rule in enumerate(self.rules):
+            if not rule.field or isinstance(rule, CompositeRule):
+                continue
+            if isinstance(rule, PatternRule):
+                if not rule.pattern:
+                    continue
+                if rule.field not in self.pattern_matchers:
+                    self.pattern_matchers[rule.field] = AhoCorasick()
+                    self.pattern_positions[rule.field] = []
+                self.pattern_matchers[rule.field].add(rule.pattern, position)
+                self.pattern_positions[rule.field].append(position)
+            elif isinstance(rule, RegexRule):
+                if rule.field not in self.regex_scanners:
+                    self.regex_scanners[rule.field] = RegexScanner()
+                    self.regex_positions[rule.field] = []
+                self.regex_scanners[rule.field].add(rule.pattern, rule.ignore_case, position)
+                self.regex_positions[rule.field].append(position)
+            elif isinstance(rule, (ThresholdRule, AnomalyRule)):
+                if isinstance(rule, ThresholdRule) and (rule.threshold is None or rule.compare is None):
+                    continue
+                if rule.field not in self.threshold_indexes:
+                    self.threshold_indexes[rule.field] = ThresholdIndex()
+                index = self.threshold_indexes[rule.field]
+                if isinstance(rule, ThresholdRule):
+                    index.add_threshold(rule.operator, rule.threshold, position)
+                else:
+                    index.add_range(rule.min_value, rule.max_value, position)
+            elif type(rule) is not CompiledRule:
+                self.scan_positions.append(position)
+                if isinstance(rule, StatisticalRule):
+                    self.peer_group_specs.add(rule.peer_group)
+            else:
+                continue
+            for field in rule.fields:
+                self.accessors[field] = compile_field_path(field)
+
+        positions = {rule.id: position for position, rule in enumerate(self.rules)}
+        builder = ExpressionBuilder(positions, compile_predicate)
+        # Positions of composite rules, each after the composites it refers to
+        self.composite_positions: List[int] = [positions[rule_id] for rule_id in self._composite_order]
+        for position in self.composite_positions:
+            rule = self.rules[position]
+            rule.expression = builder.build(rule.condition)
+            if rule.field:
+                self.accessors[rule.field] = rule.accessor
+        for predicate in builder.predicates:
+            for field in predicate.fields:
+                self.accessors[field] = compile_field_path(field)
+            if isinstance(predicate, StatisticalRule):
+                self.peer_group_specs.add(predicate.peer_group)
+
+        for matcher in self.pattern_matchers.values():
+            matcher.build()
+        for scanner in self.regex_scanners.values():
+            scanner.build()
+        for index in self.threshold_indexes.values():
+            index.build()
+
+    def resolve_fields(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Resolve every field the rules read, once per record"""
+        return {field: accessor(data) for field, accessor in self.accessors.items()}
+
+
+class RuleSetRegistry:
+    """
+    Process-wide holder of the current compiled rule set.
+
+    The rule set is rebuilt lazily after ``invalidate()`` (called by the rule
+    CRUD functions) and at least every ``RULESET_REFRESH_SECONDS`` so that
+    edits made through other worker processes are picked up as well.
+    With ``include_shadow`` the shadow rules are compiled alongside the
+    active ones, so shadow composites can refer to production rules.
+    """
+
+    def __init__(self, refresh_seconds: int = settings.RULESET_REFRESH_SECONDS, include_shadow: bool = False):
+        self.refresh_seconds = refresh_seconds
+        self.include_shadow = include_shadow
+        self._rule_set: Optional[CompiledRuleSet] = None
+        # Compile errors already logged, so each is logged once
+        self._logged_errors: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, db: Session) -> CompiledRuleSet:
+        """Get the current rule set, compiling it if missing or stale"""
+        rule_set = self._rule_set
+        if rule_set is not None and not self._is_stale(rule_set):
+            return rule_set
+
+        with self._lock:
+            rule_set = self._rule_set
+            if rule_set is None or self._is_stale(rule_set):
+                # Imported here because the CRUD layer invalidates this registry
+                from app.crud.red_flag import get_active_red_flag_rules, get_shadow_red_flag_rules
+
+                rules = get_active_red_flag_rules(db)
+                if self.include_shadow:
+                    rules += get_shadow_red_flag_rules(db)
+                rule_set = CompiledRuleSet(rules)
+                self._rule_set = rule_set
+                self._log_errors(rule_set.errors)
+        return rule_set
+
+    def _log_errors(self, errors: Dict[int, str]) -> None:
+        for rule_id, error in errors.items():
+            if self._logged_errors.get(rule_id) != error:
+                logger.error("Red flag rule %s cannot be compiled and is skipped: %s", rule_id, error)
+        self._logged_errors = dict(errors)
+
+    def invalidate(self) -> None:
+        """Drop the current rule set so the next request recompiles it"""
+        with self._lock:
+            self._rule_set = None
+
+    def _is_stale(self, rule_set: CompiledRuleSet) -> bool:
+        if self.refresh_seconds <= 0:
+            return False
+        return time.monotonic() - rule_set.loaded_at > self.refresh_seconds
+
+
+rule_set_registry = RuleSetRegistry()
+shadow_rule_set_registry = RuleSetRegistry(include_shadow=True)
@@ -0,0 +1,186 @@
+from typing import Any, Callable, Dict, List, Optional
+from collections import deque
+from sqlalchemy.orm import Session
+import logging
+import queue
+import random
+import threading
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.services.detection_cache import record_digest
+from app.services.red_flag_engine import RedFlagEngine
+from app.services.rule_profiler import RuleProfiler
+from app.services.rule_set import RuleSetRegistry, shadow_rule_set_registry
+
+logger = logging.getLogger(__name__)
+
+
+class ShadowRuleStats:
+    """Hit counters of one revision of a shadow rule"""
+
+    def __init__(self, rule: Any, examples: int):
+        self.rule_id = rule.id
+        self.rule_name = rule.name
+        self.rule_type = rule.rule_type
+        self.version = rule.version
+        self.evaluations = 0
+        self.matches = 0
+        # Matches on records that production rules flagged as well
+        self.co_flagged = 0
+        self.examples: "deque[Any]" = deque(maxlen=examples)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "rule_id": self.rule_id,
+            "rule_name": self.rule_name,
+            "rule_type": self.rule_type,
+            "rule_version": self.version,
+            "evaluations": self.evaluations,
+            "matches": self.matches,
+            "match_rate": self.matches / self.evaluations if self.evaluations else 0.0,
+            "co_flagged": self.co_flagged,
+            "co_flagged_rate": self.co_flagged / self.matches if self.matches else 0.0,
+            "examples": list(self.examples),
+        }
+
+
+class ShadowRuleEvaluator:
+    """
+    Evaluates shadow rules on a sample of detection traffic, off the request path.
+
+    ``submit`` keeps each record with probability ``SHADOW_SAMPLE_RATE`` and
+    queues the sample without blocking; when ``SHADOW_QUEUE_SIZE`` batches are
+    already waiting the sample is dropped. A background thread evaluates the
+    queued records against the active and shadow rules together, so shadow
+    hits can be compared with production flags on the same records. Timings
+    come from a profiler of their own, separate from the production one.
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = settings.SHADOW_SAMPLE_RATE,
+        queue_size: int = settings.SHADOW_QUEUE_SIZE,
+        examples: int = settings.SHADOW_EXAMPLES,
+        session_factory: Callable[[], Session] = SessionLocal,
+        registry: RuleSetRegistry = shadow_rule_set_registry
+    ):
+        self.sample_rate = sample_rate
+        self.examples = examples
+        self.session_factory = session_factory
+        self.registry = registry
+        self.profiler = RuleProfiler(enabled=True, slow_rule_ms=None, sample_rate=1.0)
+        self.sampled = 0
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[List[Dict[str, Any]]]]" = queue.Queue(maxsize=queue_size)
+        self._stats: Dict[int, ShadowRuleStats] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, records: List[Dict[str, Any]]) -> int:
+        """Queue a sample of the records for shadow evaluation, returning its size"""
+        if self.sample_rate <= 0:
+            return 0
+        sample = [record for record in records if random.random() < self.sample_rate]
+        if not sample:
+            return 0
+        self.ensure_started()
+        try:
+            self._queue.put_nowait(sample)
+        except queue.Full:
+            with self._lock:
+                self.dropped += len(sample)
+            return 0
+        with self._lock:
+            self.sampled += len(sample)
+        return len(sample)
+
+    def ensure_started(self) -> None:
+        """Start the background thread unless already running"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.work, name="shadow-rule-evaluator", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the background thread once the queued samples are evaluated"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def work(self) -> None:
+        """Evaluate queued samples until stopped"""
+        while True:
+            records = self._queue.get()
+            if records is None:
+                return
+            try:
+                self.evaluate(records)
+            except Exception:
+                logger.exception("Shadow rule evaluation failed")
+
+    def evaluate(self, records: List[Dict[str, Any]]) -> None:
+        """Evaluate the records against the shadow rules and count their hits"""
+        db = self.session_factory()
+        try:
+            rule_set = self.registry.get(db)
+            shadow_rules = {rule.id: rule for rule in rule_set.rules if rule.shadow}
+            if not shadow_rules:
+                return
+            engine = RedFlagEngine(db, cache=None, rule_set=rule_set, profiler=self.profiler)
+            flags_per_record = engine.detect_red_flags_batch(records)
+        finally:
+            db.close()
+
+        with self._lock:
+            stats = {}
+            for rule_id, rule in shadow_rules.items():
+                stats[rule_id] = self._stats.get(rule_id)
+                if stats[rule_id] is None or stats[rule_id].version != rule.version:
+                    stats[rule_id] = self._stats[rule_id] = ShadowRuleStats(rule, self.examples)
+                stats[rule_id].evaluations += len(records)
+
+            for record, flags in zip(records, flags_per_record):
+                hits = [flag["rule_id"] for flag in flags if flag["rule_id"] in shadow_rules]
+                if not hits:
+                    continue
+                co_flagged = len(hits) < len(flags)
+                example = record.get("id")
+                if example is None:
+                    example = record_digest(record)
+                for rule_id in hits:
+                    stats[rule_id].matches += 1
+                    stats[rule_id].co_flagged += co_flagged
+                    stats[rule_id].examples.append(example)
+
+    def report(self) -> Dict[str, Any]:
+        """Hit counters and evaluation cost of every shadow rule seen so far"""
+        timings = {row["rule_id"]: row for row in self.profiler.report()["rules"]}
+        with self._lock:
+            rules = [stats.to_dict() for stats in self._stats.values()]
+            sampled, dropped = self.sampled, self.dropped
+        for row in rules:
+            timing = timings.get(row["rule_id"])
+            for key in ("errors", "total_ms", "mean_ms", "p99_ms"):
+                row[key] = timing[key] if timing and timing["rule_version"] == row["rule_version"] else 0
+        rules.sort(key=lambda row: row["rule_id"])
+        return {
+            "sample_rate": self.sample_rate,
+            "sampled": sampled,
+            "dropped": dropped,
+            "queued": self._queue.qsize(),
+            "rules": rules,
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self.sampled = 0
+            self.dropped = 0
+        self.profiler.reset()
+
+
+shadow_evaluator = ShadowRuleEvaluator()
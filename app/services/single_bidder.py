@@ -0,0 +1,180 @@
+from typing import Any, Dict, List
+from sqlalchemy import and_, case, delete, func, or_, select, union
+from sqlalchemy.orm import Session
+
+import numpy as np
+
+from app.core.config import settings
+from app.models.contracting_process import ContractingProcess
+from app.models.risk_analytics import TenderCompetition
+from app.models.tender import TenderItem, TenderResponse, TenderStatus
+from app.services.dataset_rules import (
+    DatasetRule, database_now, get_watermark, load_dataset_rules, replace_dataset_flags, set_watermark
+)
+
+DETECTOR = "single_bidder"
+# Tenders in these states are closed even before their submission deadline
+CLOSED_STATUSES = ("COMPLETE", "UNSUCCESSFUL")
+
+
+def refresh_tender_competition(
+    db: Session,
+    full: bool = False,
+    chunk_size: int = settings.DETECT_STREAM_CHUNK_SIZE
+) -> int:
+    """
+    Bring the per-tender bid counts in ``tender_competition`` up to date with
+    one grouped aggregate over tender responses, tender items and
+    contracting processes.
+
+    Only tenders created or updated, or with responses created, since the
+    last run's watermark are recounted; ``full`` recounts every tender, which
+    also picks up deleted or withdrawn responses. Does not commit.
+    Returns the number of tenders recounted.
+    """
+    started = database_now(db)
+    since = None if full else get_watermark(db, DETECTOR)
+
+    stmt = (
+        select(
+            TenderItem.id, ContractingProcess.buyer_id, ContractingProcess.procurement_method,
+            TenderItem.status, TenderItem.submission_deadline, func.count(TenderResponse.id)
+        )
+        .select_from(TenderItem)
+        .outerjoin(TenderResponse, and_(
+            TenderResponse.tender_item_id == TenderItem.id,
+            TenderResponse.status.is_distinct_from("WITHDRAWN")
+        ))
+        .outerjoin(ContractingProcess, TenderItem.contracting_process_id == ContractingProcess.id)
+        .group_by(
+            TenderItem.id, ContractingProcess.buyer_id, ContractingProcess.procurement_method,
+            TenderItem.status, TenderItem.submission_deadline
+        )
+    )
+    if since is not None:
+        touched = union(
+            select(TenderResponse.tender_item_id).where(TenderResponse.created_at >= since),
+            select(TenderItem.id).where(or_(TenderItem.created_at >= since, TenderItem.updated_at >= since)),
+        )
+        stmt = stmt.where(TenderItem.id.in_(select(touched.subquery().c[0])))
+    else:
+        db.execute(delete(TenderCompetition))
+
+    recounted = 0
+    for rows in db.execute(stmt.execution_options(yield_per=chunk_size)).partitions(chunk_size):
+        summaries = [
+            {
+                "tender_item_id": tender_id,
+                "buyer_id": buyer_id,
+                "procurement_method": method,
+                "status": status.value if isinstance(status, TenderStatus) else status,
+                "submission_deadline": deadline,
+                "bids": bids,
+            }
+            for tender_id, buyer_id, method, status, deadline, bids in rows
+        ]
+        if since is not None:
+            db.execute(delete(TenderCompetition).where(
+                TenderCompetition.tender_item_id.in_([row["tender_item_id"] for row in summaries])
+            ))
+        db.execute(TenderCompetition.__table__.insert(), summaries)
+        recounted += len(summaries)
+
+    set_watermark(db, DETECTOR, started)
+    return recounted
+
+
+class SingleBidderRule:
+    """
+    A ``single_bidder`` rule. At ``level`` "tender" it flags closed tenders
+    with at most ``max_bids`` bids; at ``level`` "buyer" it flags buyers with
+    at least ``min_tenders`` closed tenders whose share of such tenders is
+    above ``share``. ``procurement_methods`` restricts either to tenders of
+    those methods, e.g. to leave out direct awards.
+    """
+
+    def __init__(self, rule: DatasetRule):
+        self.rule = rule
+        params = rule.params
+        self.level = params.get("level", "tender")
+        if self.level not in ("tender", "buyer"):
+            raise ValueError(f"Unknown single bidder level: {self.level}")
+        self.max_bids = int(params.get("max_bids", 1))
+        self.share = float(params.get("share", 0.5))
+        self.min_tenders = int(params.get("min_tenders", 10))
+        self.procurement_methods: List[str] = params.get("procurement_methods") or []
+
+    @property
+    def entity_type(self) -> str:
+        return "tender_items" if self.level == "tender" else "organizations"
+
+    def flag_rows(self, db: Session) -> List[Dict[str, Any]]:
+        """Flags of every entity matching the rule, from the tender_competition summary"""
+        conditions = [or_(
+            TenderCompetition.status.in_(CLOSED_STATUSES),
+            TenderCompetition.submission_deadline < func.now()
+        )]
+        if self.procurement_methods:
+            conditions.append(TenderCompetition.procurement_method.in_(self.procurement_methods))
+
+        if self.level == "tender":
+            rows = db.execute(
+                select(TenderCompetition.tender_item_id, TenderCompetition.bids)
+                .where(TenderCompetition.bids <= self.max_bids, *conditions)
+            ).all()
+            if not rows:
+                return []
+            entity_ids = [tender_id for tender_id, _ in rows]
+            bids = np.array([bids for _, bids in rows], dtype=float)
+            # No bid at all is the strongest signal
+            confidence = self.rule.confidence((self.max_bids + 1 - bids) / (self.max_bids + 1))
+        else:
+            low = func.sum(case((TenderCompetition.bids <= self.max_bids, 1), else_=0))
+            rows = db.execute(
+                select(TenderCompetition.buyer_id, func.count(), low)
+                .where(TenderCompetition.buyer_id.isnot(None), *conditions)
+                .group_by(TenderCompetition.buyer_id)
+                .having(func.count() >= self.min_tenders)
+            ).all()
+            if not rows:
+                return []
+            tenders = np.array([row[1] for row in rows], dtype=float)
+            shares = np.array([row[2] for row in rows], dtype=float) / tenders
+            flagged = np.flatnonzero(shares > self.share)
+            entity_ids = [rows[index][0] for index in flagged]
+            confidence = self.rule.confidence((shares[flagged] - self.share) / max(1 - self.share, 1e-9))
+        return [
+            self.rule.flag_row(self.entity_type, entity_id, score)
+            for entity_id, score in zip(entity_ids, confidence)
+        ]
+
+
+def run_single_bidder_detector(db: Session, full: bool = False) -> Dict[str, Any]:
+    """
+    Refresh the per-tender bid counts incrementally, then evaluate the active
+    ``single_bidder`` rules on them, retiring flags that no longer match
+    """
+    rules, errors = load_dataset_rules(db, DETECTOR)
+    detectors = []
+    for rule in rules:
+        try:
+            detectors.append(SingleBidderRule(rule))
+        except (ValueError, TypeError) as e:
+            errors[rule.id] = str(e)
+
+    try:
+        recounted = refresh_tender_competition(db, full=full)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    flagged: Dict[int, int] = {}
+    for entity_type in ("tender_items", "organizations"):
+        level = [detector for detector in detectors if detector.entity_type == entity_type]
+        if level:
+            flagged.update(replace_dataset_flags(
+                db, [detector.rule for detector in level], entity_type,
+                (detector.flag_rows(db) for detector in level)
+            ))
+    return {"recounted_tenders": recounted, "invalid_rules": errors, "flagged": flagged}
@@ -0,0 +1,183 @@
+from typing import Any, Dict, Iterator, List, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+import numpy as np
+
+from app.core.config import settings
+from app.models.award import AwardItem
+from app.models.contracting_process import ContractingProcess
+from app.services.dataset_rules import DatasetRule, load_dataset_rules, replace_dataset_flags
+
+# Flags of split purchase rules are attached to the awards of a suspicious window
+SPLIT_ENTITY_TYPE = "award_items"
+
+
+def iter_award_groups(
+    db: Session,
+    chunk_size: int = settings.DETECT_STREAM_CHUNK_SIZE
+) -> Iterator[Tuple[List[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Stream awards sorted by buyer, supplier and date with one ordered query.
+
+    Yields (award IDs, buyer/supplier pair codes, dates as epoch seconds,
+    values, procurement methods) for many complete buyer/supplier pairs at a
+    time. An award is dated by its award date, or else by the publication
+    date of its contracting process; awards without a date or a positive
+    value are left out.
+    """
+    date = func.coalesce(AwardItem.award_date, ContractingProcess.date_published)
+    stmt = (
+        select(
+            AwardItem.id, ContractingProcess.buyer_id, AwardItem.supplier_id, date,
+            AwardItem.award_value, ContractingProcess.procurement_method
+        )
+        .join(ContractingProcess, AwardItem.contracting_process_id == ContractingProcess.id)
+        .where(
+            ContractingProcess.buyer_id.isnot(None),
+            AwardItem.supplier_id.isnot(None),
+            AwardItem.award_value > 0,
+            date.isnot(None)
+        )
+        .order_by(ContractingProcess.buyer_id, AwardItem.supplier_id, date)
+        .execution_options(yield_per=chunk_size)
+    )
+    award_ids: List[str] = []
+    pairs: List[int] = []
+    dates: List[float] = []
+    values: List[float] = []
+    methods: List[str] = []
+    last_pair = None
+    for rows in db.execute(stmt).partitions(chunk_size):
+        for award_id, buyer_id, supplier_id, awarded, value, method in rows:
+            if (buyer_id, supplier_id) != last_pair:
+                # A new pair: everything before it is complete
+                if len(award_ids) >= chunk_size:
+                    yield award_ids, np.array(pairs), np.array(dates), np.array(values), np.array(methods, dtype=object)
+                    award_ids, pairs, dates, values, methods = [], [], [], [], []
+                last_pair = (buyer_id, supplier_id)
+                pairs.append(pairs[-1] + 1 if pairs else 0)
+            else:
+                pairs.append(pairs[-1])
+            award_ids.append(award_id)
+            dates.append(awarded.timestamp())
+            values.append(value)
+            methods.append(method)
+    if award_ids:
+        yield award_ids, np.array(pairs), np.array(dates), np.array(values), np.array(methods, dtype=object)
+
+
+def split_windows(
+    pairs: np.ndarray,
+    dates: np.ndarray,
+    values: np.ndarray,
+    threshold: float,
+    window_seconds: float,
+    min_awards: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the sliding windows of at most ``window_seconds`` in which one
+    buyer/supplier pair has at least ``min_awards`` awards adding up to
+    ``threshold`` or more, from awards sorted by pair and date.
+
+    Every award ending a window is located with a binary search for the
+    window's first award, and window sums come from running sums, so the
+    whole chunk takes O(n log n). Returns the indexes of the awards in any
+    such window and, for each, the largest award count of its windows.
+    """
+    if not len(values):
+        return np.array([], dtype=int), np.array([])
+    # Offset each pair's dates so that windows never reach into the previous pair
+    span = dates.max() - dates.min() + window_seconds + 1
+    keys = pairs * span + (dates - dates.min())
+    ends = np.arange(len(keys))
+    starts = np.searchsorted(keys, keys - window_seconds, side="left")
+    running = np.concatenate(([0.0], np.cumsum(values)))
+    counts = ends + 1 - starts
+    hits = np.flatnonzero((counts >= min_awards) & (running[ends + 1] - running[starts] >= threshold))
+    if not len(hits):
+        return np.array([], dtype=int), np.array([])
+
+    lengths = counts[hits]
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    members = np.repeat(starts[hits], lengths) + offsets
+    largest = np.zeros(len(values))
+    np.maximum.at(largest, members, np.repeat(lengths, lengths).astype(float))
+    flagged = np.flatnonzero(largest)
+    return flagged, largest[flagged]
+
+
+class SplitPurchaseRule:
+    """
+    A ``split_purchase`` rule: flags awards of one buyer to one supplier
+    that are each under ``threshold`` (and at least ``min_share`` of it) but
+    of which ``min_awards`` or more, within ``window_days``, add up to the
+    threshold. ``procurement_methods`` restricts it to awards of those
+    methods. Confidence grows from ``base_confidence`` with the number of
+    awards in the window, reaching 1 at twice ``min_awards``.
+    """
+
+    def __init__(self, rule: DatasetRule):
+        self.rule = rule
+        params = rule.params
+        self.threshold = float(params["threshold"])
+        if self.threshold <= 0:
+            raise ValueError("threshold must be positive")
+        self.window_seconds = float(params.get("window_days", 30)) * 86400
+        self.min_awards = int(params.get("min_awards", 2))
+        self.min_share = float(params.get("min_share", 0.0))
+        self.procurement_methods: List[str] = params.get("procurement_methods") or []
+
+    def evaluate(
+        self,
+        pairs: np.ndarray,
+        dates: np.ndarray,
+        values: np.ndarray,
+        methods: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Indexes of the flagged awards and their confidence scores"""
+        eligible = (values < self.threshold) & (values >= self.min_share * self.threshold)
+        if self.procurement_methods:
+            eligible &= np.isin(methods, self.procurement_methods)
+        indexes = np.flatnonzero(eligible)
+        flagged, counts = split_windows(
+            pairs[indexes], dates[indexes], values[indexes], self.threshold, self.window_seconds, self.min_awards
+        )
+        return indexes[flagged], self.rule.confidence((counts - self.min_awards) / self.min_awards)
+
+
+def run_split_purchase_detector(
+    db: Session,
+    chunk_size: int = settings.DETECT_STREAM_CHUNK_SIZE
+) -> Dict[str, Any]:
+    """
+    Evaluate the active ``split_purchase`` rules in one sorted pass over all
+    awards and store their flags on award items, retiring flags of awards
+    that no longer match
+    """
+    rules, errors = load_dataset_rules(db, "split_purchase")
+    detectors = []
+    for rule in rules:
+        try:
+            detectors.append(SplitPurchaseRule(rule))
+        except (KeyError, ValueError, TypeError) as e:
+            errors[rule.id] = str(e)
+
+    summary: Dict[str, Any] = {"awards": 0, "invalid_rules": errors}
+
+    def flag_chunks() -> Iterator[List[Dict[str, Any]]]:
+        for award_ids, pairs, dates, values, methods in iter_award_groups(db, chunk_size):
+            summary["awards"] += len(award_ids)
+            rows = []
+            for detector in detectors:
+                flagged, confidence = detector.evaluate(pairs, dates, values, methods)
+                rows.extend(
+                    detector.rule.flag_row(SPLIT_ENTITY_TYPE, award_ids[index], score)
+                    for index, score in zip(flagged, confidence)
+                )
+            yield rows
+
+    summary["flagged"] = replace_dataset_flags(
+        db, [detector.rule for detector in detectors], SPLIT_ENTITY_TYPE, flag_chunks()
+    )
+    return summary
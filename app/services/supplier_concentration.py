@@ -0,0 +1,231 @@
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.award import AwardItem
+from app.models.contracting_process import ContractingProcess
+from app.models.risk_analytics import BuyerConcentration, BuyerSupplierTotal, RiskProfile
+
+# Risk profiles of buyers are kept under this entity type
+BUYER_ENTITY_TYPE = "organization"
+
+# (buyer_id, procurement_method, supplier_id, award value)
+AwardContribution = Tuple[str, str, str, float]
+
+
+def award_contribution(db: Session, award: Any) -> Optional[AwardContribution]:
+    """What an award adds to its buyer's supplier totals, or None if it has no buyer, supplier or value"""
+    if not award.supplier_id or not award.contracting_process_id or (award.award_value or 0) <= 0:
+        return None
+    process = db.get(ContractingProcess, award.contracting_process_id)
+    if process is None or not process.buyer_id:
+        return None
+    return process.buyer_id, process.procurement_method or "", award.supplier_id, float(award.award_value)
+
+
+def apply_award_change(
+    db: Session,
+    before: Optional[AwardContribution],
+    after: Optional[AwardContribution],
+    commit: bool = True
+) -> None:
+    """
+    Move a buyer's concentration from an award's old contribution to its new
+    one: None before for a new award, None after for a deleted one. Only the
+    affected supplier and buyer rows are read and written, and the buyer's
+    competition risk is updated from the new index.
+    """
+    if before == after:
+        return
+    changes = []
+    if before is not None:
+        changes.append((before, -1))
+    if after is not None:
+        changes.append((after, 1))
+
+    buyers = set()
+    for (buyer_id, method, supplier_id, value), sign in changes:
+        # Every award counts for its own procurement method and for all methods
+        for group in {method, ""}:
+            _add_to_supplier(db, buyer_id, group, supplier_id, sign * value, sign)
+        buyers.add(buyer_id)
+    db.flush()
+    for buyer_id in buyers:
+        update_competition_risk(db, buyer_id)
+    if commit:
+        db.commit()
+
+
+def _add_to_supplier(db: Session, buyer_id: str, method: str, supplier_id: str, amount: float, awards: int) -> None:
+    supplier = db.query(BuyerSupplierTotal).filter(
+        BuyerSupplierTotal.buyer_id == buyer_id,
+        BuyerSupplierTotal.procurement_method == method,
+        BuyerSupplierTotal.supplier_id == supplier_id
+    ).with_for_update().first()
+    if supplier is None:
+        supplier = BuyerSupplierTotal(buyer_id=buyer_id, procurement_method=method, supplier_id=supplier_id,
+                                      total=0.0, awards=0)
+        db.add(supplier)
+    buyer = _lock_buyer(db, buyer_id, method)
+
+    supplier.awards += awards
+    # Without awards left the total is zero, whatever rounding says
+    old, new = supplier.total, max(supplier.total + amount, 0.0) if supplier.awards > 0 else 0.0
+    supplier.total = new
+    buyer.total = max(buyer.total + new - old, 0.0)
+    buyer.sum_squares = max(buyer.sum_squares + new * new - old * old, 0.0)
+    buyer.awards += awards
+    buyer.suppliers += (new > 0) - (old > 0)
+
+    if new >= buyer.top_supplier_total:
+        buyer.top_supplier_id, buyer.top_supplier_total = supplier_id, new
+    elif supplier_id == buyer.top_supplier_id:
+        # The top supplier shrank; another one may have overtaken it
+        db.flush()
+        top = db.execute(
+            select(BuyerSupplierTotal.supplier_id, BuyerSupplierTotal.total)
+            .where(BuyerSupplierTotal.buyer_id == buyer_id, BuyerSupplierTotal.procurement_method == method)
+            .order_by(BuyerSupplierTotal.total.desc())
+            .limit(1)
+        ).first()
+        buyer.top_supplier_id, buyer.top_supplier_total = top
+    buyer.hhi = _hhi(buyer.total, buyer.sum_squares)
+
+
+def _lock_buyer(db: Session, buyer_id: str, method: str) -> BuyerConcentration:
+    buyer = db.query(BuyerConcentration).filter(
+        BuyerConcentration.buyer_id == buyer_id,
+        BuyerConcentration.procurement_method == method
+    ).with_for_update().first()
+    if buyer is None:
+        buyer = BuyerConcentration(buyer_id=buyer_id, procurement_method=method, total=0.0, sum_squares=0.0,
+                                   awards=0, suppliers=0, top_supplier_total=0.0, hhi=0.0)
+        db.add(buyer)
+    return buyer
+
+
+def _hhi(total: float, sum_squares: float) -> float:
+    """Sum of squared percentage market shares, from 0 (no concentration) to 10,000 (one supplier)"""
+    if total <= 0:
+        return 0.0
+    return min(sum_squares / (total * total), 1.0) * 10000
+
+
+def rebuild_supplier_concentration(db: Session) -> int:
+    """
+    Recompute all supplier totals and buyer indexes from the award items with
+    grouped queries, e.g. after a bulk import that bypassed the CRUD layer,
+    and refresh every buyer's competition risk. Returns the number of buyers.
+    """
+    try:
+        db.execute(delete(BuyerSupplierTotal))
+        db.execute(delete(BuyerConcentration))
+        per_method = (
+            select(
+                ContractingProcess.buyer_id,
+                func.coalesce(ContractingProcess.procurement_method, "").label("procurement_method"),
+                AwardItem.supplier_id,
+                func.sum(AwardItem.award_value).label("total"),
+                func.count(AwardItem.id).label("awards"),
+            )
+            .join(ContractingProcess, AwardItem.contracting_process_id == ContractingProcess.id)
+            .where(
+                ContractingProcess.buyer_id.isnot(None),
+                AwardItem.supplier_id.isnot(None),
+                AwardItem.award_value > 0
+            )
+            .group_by(ContractingProcess.buyer_id, ContractingProcess.procurement_method, AwardItem.supplier_id)
+        )
+        rows = [dict(row) for row in db.execute(per_method).mappings()]
+        totals: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        for row in rows:
+            for method in {row["procurement_method"], ""}:
+                key = (row["buyer_id"], method, row["supplier_id"])
+                merged = totals.setdefault(key, {
+                    "buyer_id": row["buyer_id"], "procurement_method": method,
+                    "supplier_id": row["supplier_id"], "total": 0.0, "awards": 0,
+                })
+                merged["total"] += row["total"]
+                merged["awards"] += row["awards"]
+        if totals:
+            db.execute(BuyerSupplierTotal.__table__.insert(), list(totals.values()))
+
+        buyers: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for supplier in totals.values():
+            buyer = buyers.setdefault((supplier["buyer_id"], supplier["procurement_method"]), {
+                "buyer_id": supplier["buyer_id"], "procurement_method": supplier["procurement_method"],
+                "total": 0.0, "sum_squares": 0.0, "awards": 0, "suppliers": 0,
+                "top_supplier_id": None, "top_supplier_total": 0.0,
+            })
+            buyer["total"] += supplier["total"]
+            buyer["sum_squares"] += supplier["total"] ** 2
+            buyer["awards"] += supplier["awards"]
+            buyer["suppliers"] += 1
+            if supplier["total"] > buyer["top_supplier_total"]:
+                buyer["top_supplier_id"], buyer["top_supplier_total"] = supplier["supplier_id"], supplier["total"]
+        for buyer in buyers.values():
+            buyer["hhi"] = _hhi(buyer["total"], buyer["sum_squares"])
+        if buyers:
+            db.execute(BuyerConcentration.__table__.insert(), list(buyers.values()))
+
+        db.query(RiskProfile).filter(RiskProfile.entity_type == BUYER_ENTITY_TYPE).update(
+            {RiskProfile.competition_risk: 0.0}, synchronize_session=False
+        )
+        buyer_ids = {buyer_id for buyer_id, _ in buyers}
+        for buyer_id in buyer_ids:
+            update_competition_risk(db, buyer_id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(buyer_ids)
+
+
+def get_buyer_concentration(db: Session, buyer_id: str, procurement_method: str = "") -> Optional[Dict[str, Any]]:
+    """HHI and top supplier of a buyer, over all procurement methods by default"""
+    row = db.query(BuyerConcentration).filter(
+        BuyerConcentration.buyer_id == buyer_id,
+        BuyerConcentration.procurement_method == procurement_method
+    ).first()
+    if row is None:
+        return None
+    return {
+        "buyer_id": row.buyer_id,
+        "procurement_method": row.procurement_method or None,
+        "hhi": row.hhi,
+        "total_awarded": row.total,
+        "awards": row.awards,
+        "suppliers": row.suppliers,
+        "top_supplier_id": row.top_supplier_id,
+        "top_supplier_share": row.top_supplier_total / row.total if row.total > 0 else 0.0,
+    }
+
+
+def update_competition_risk(db: Session, buyer_id: str) -> Optional[RiskProfile]:
+    """
+    Set the buyer's competition risk to its HHI over all procurement methods,
+    scaled to 0-1, or 0 with fewer than ``CONCENTRATION_MIN_AWARDS`` awards.
+    The overall risk score is the highest of the risk components. Does not commit.
+    """
+    buyer = db.query(BuyerConcentration).filter(
+        BuyerConcentration.buyer_id == buyer_id,
+        BuyerConcentration.procurement_method == ""
+    ).first()
+    risk = buyer.hhi / 10000 if buyer is not None and buyer.awards >= settings.CONCENTRATION_MIN_AWARDS else 0.0
+
+    profile = db.query(RiskProfile).filter(
+        RiskProfile.entity_type == BUYER_ENTITY_TYPE,
+        RiskProfile.entity_id == buyer_id
+    ).first()
+    if profile is None:
+        if not risk:
+            return None
+        profile = RiskProfile(entity_type=BUYER_ENTITY_TYPE, entity_id=buyer_id, overall_risk_score=0.0,
+                              corruption_risk=0.0, process_risk=0.0, supplier_risk=0.0)
+        db.add(profile)
+    profile.competition_risk = risk
+    profile.overall_risk_score = max(
+        profile.corruption_risk or 0.0, risk, profile.process_risk or 0.0, profile.supplier_risk or 0.0
+    )
+    return profile
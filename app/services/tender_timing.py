@@ -0,0 +1,226 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from datetime import datetime, timezone
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+
+import numpy as np
+
+from app.core.config import settings
+from app.models.contract import ApprovalStatus, ContractAmendment, ContractItem
+from app.models.contracting_process import ContractingProcess
+from app.models.tender import TenderItem
+from app.services.dataset_rules import DatasetRule, load_dataset_rules, replace_dataset_flags
+from app.services.rule_set import THRESHOLD_OPERATORS
+
+# Metric of a tender_timing rule: (family of metrics read by one query, flagged entity type, default operator)
+TIMING_METRICS = {
+    "tender_period_days": ("tender_period", "contracting_processes", "<"),
+    "publication_gap_days": ("publication_gap", "tender_items", "<"),
+    "amendments": ("amendments", "contract_items", ">="),
+    "late_amendments": ("amendments", "contract_items", ">="),
+}
+
+# Timing chunk: entity IDs, their procurement methods, and the arrays a family's metrics are computed from
+TimingChunk = Tuple[List[str], np.ndarray, Dict[str, np.ndarray]]
+
+
+def _seconds(value: Optional[datetime]) -> float:
+    """Epoch seconds of a date column value, reading naive values as UTC; NaN when missing"""
+    if value is None:
+        return np.nan
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _days(starts: List[Optional[datetime]], ends: List[Optional[datetime]]) -> np.ndarray:
+    return (np.array([_seconds(end) for end in ends]) - np.array([_seconds(start) for start in starts])) / 86400
+
+
+def iter_timing_chunks(
+    db: Session,
+    family: str,
+    chunk_size: int = settings.DETECT_STREAM_CHUNK_SIZE
+) -> Iterator[TimingChunk]:
+    """
+    Stream the date columns of one metric family with a single query,
+    yielding arrays for many entities at a time:
+
+    - ``tender_period``: days from tender period start to end, per contracting process
+    - ``publication_gap``: days from publication (of the tender item, or
+      else of its contracting process) to the submission deadline, per tender item
+    - ``amendments``: non-rejected amendments per contract and, for each
+      amendment, how far into the contract period it was made (0 at the
+      start date, 1 at the end date)
+    """
+    method = ContractingProcess.procurement_method
+    if family == "tender_period":
+        stmt = select(
+            ContractingProcess.id, method, ContractingProcess.tender_period_start, ContractingProcess.tender_period_end
+        ).where(ContractingProcess.tender_period_start.isnot(None), ContractingProcess.tender_period_end.isnot(None))
+    elif family == "publication_gap":
+        published = func.coalesce(TenderItem.publication_date, ContractingProcess.date_published)
+        stmt = (
+            select(TenderItem.id, method, published, TenderItem.submission_deadline)
+            .outerjoin(ContractingProcess, TenderItem.contracting_process_id == ContractingProcess.id)
+            .where(published.isnot(None), TenderItem.submission_deadline.isnot(None))
+        )
+    elif family == "amendments":
+        yield from _iter_amendment_chunks(db, chunk_size)
+        return
+    else:
+        raise ValueError(f"Unknown timing metric family: {family}")
+
+    for rows in db.execute(stmt.execution_options(yield_per=chunk_size)).partitions(chunk_size):
+        entity_ids, methods, starts, ends = zip(*rows)
+        yield list(entity_ids), np.array(methods, dtype=object), {"days": _days(starts, ends)}
+
+
+def _iter_amendment_chunks(db: Session, chunk_size: int) -> Iterator[TimingChunk]:
+    stmt = (
+        select(
+            ContractItem.id, ContractingProcess.procurement_method,
+            ContractItem.start_date, ContractItem.end_date, ContractAmendment.created_at
+        )
+        .join(ContractAmendment, and_(
+            ContractAmendment.contract_item_id == ContractItem.id,
+            ContractAmendment.status.is_distinct_from(ApprovalStatus.REJECTED)
+        ))
+        .outerjoin(ContractingProcess, ContractItem.contracting_process_id == ContractingProcess.id)
+        .order_by(ContractItem.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    contract_ids: List[str] = []
+    methods: List[Optional[str]] = []
+    counts: List[int] = []
+    progress: List[float] = []
+    for rows in db.execute(stmt).partitions(chunk_size):
+        for contract_id, method, start, end, amended in rows:
+            if not contract_ids or contract_id != contract_ids[-1]:
+                # A new contract: everything before it is complete
+                if len(progress) >= chunk_size:
+                    yield _amendment_chunk(contract_ids, methods, counts, progress)
+                    contract_ids, methods, counts, progress = [], [], [], []
+                contract_ids.append(contract_id)
+                methods.append(method)
+                counts.append(0)
+            counts[-1] += 1
+            duration = _seconds(end) - _seconds(start)
+            progress.append((_seconds(amended) - _seconds(start)) / duration if duration > 0 else np.nan)
+    if contract_ids:
+        yield _amendment_chunk(contract_ids, methods, counts, progress)
+
+
+def _amendment_chunk(
+    contract_ids: List[str],
+    methods: List[Optional[str]],
+    counts: List[int],
+    progress: List[float]
+) -> TimingChunk:
+    counts_array = np.array(counts)
+    return contract_ids, np.array(methods, dtype=object), {
+        "counts": counts_array.astype(float),
+        "contract": np.repeat(np.arange(len(counts)), counts_array),
+        "progress": np.array(progress, dtype=float),
+    }
+
+
+class TenderTimingRule:
+    """
+    A ``tender_timing`` rule: flags entities whose ``metric`` (one of
+    TIMING_METRICS) compares to the threshold of their procurement method
+    with ``operator``. ``method_thresholds`` maps procurement methods to
+    thresholds; ``threshold``, if given, applies to all other methods.
+    ``late_amendments`` counts amendments made after ``late_share`` of the
+    contract period. Confidence grows from ``base_confidence`` with the
+    distance past the threshold, reaching 1 at twice its magnitude.
+    """
+
+    def __init__(self, rule: DatasetRule):
+        self.rule = rule
+        params = rule.params
+        self.metric = params.get("metric", "tender_period_days")
+        if self.metric not in TIMING_METRICS:
+            raise ValueError(f"Unknown timing metric: {self.metric}")
+        self.family, self.entity_type, default_operator = TIMING_METRICS[self.metric]
+        self.operator = params.get("operator", default_operator)
+        self.compare = THRESHOLD_OPERATORS.get(self.operator)
+        if self.compare is None:
+            raise ValueError(f"Unknown operator: {self.operator}")
+        self.threshold = float(params["threshold"]) if params.get("threshold") is not None else np.nan
+        self.method_thresholds = {
+            method: float(threshold) for method, threshold in (params.get("method_thresholds") or {}).items()
+        }
+        if np.isnan(self.threshold) and not self.method_thresholds:
+            raise ValueError("threshold or method_thresholds is required")
+        self.late_share = float(params.get("late_share", 0.75))
+
+    def values(self, data: Dict[str, np.ndarray]) -> np.ndarray:
+        if self.metric == "amendments":
+            return data["counts"]
+        if self.metric == "late_amendments":
+            with np.errstate(invalid="ignore"):
+                late = data["progress"] >= self.late_share
+            return np.bincount(data["contract"], weights=late, minlength=len(data["counts"]))
+        return data["days"]
+
+    def evaluate(self, methods: np.ndarray, data: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """Indexes of the flagged entities and their confidence scores"""
+        values = self.values(data)
+        thresholds = np.full(len(values), self.threshold)
+        for method, threshold in self.method_thresholds.items():
+            thresholds[methods == method] = threshold
+        with np.errstate(invalid="ignore"):
+            flagged = np.flatnonzero(np.isfinite(values) & np.isfinite(thresholds) & self.compare(values, thresholds))
+        threshold = thresholds[flagged]
+        excess = np.abs(values[flagged] - threshold) / np.maximum(np.abs(threshold), 1e-9)
+        return flagged, self.rule.confidence(excess)
+
+
+def run_tender_timing_screens(
+    db: Session,
+    chunk_size: int = settings.DETECT_STREAM_CHUNK_SIZE
+) -> Dict[str, Any]:
+    """
+    Evaluate the active ``tender_timing`` rules, reading the date columns
+    of each metric family once for all of its rules, and store their flags,
+    retiring flags of entities that no longer match
+    """
+    rules, errors = load_dataset_rules(db, "tender_timing")
+    families: Dict[str, List[TenderTimingRule]] = {}
+    for rule in rules:
+        try:
+            timing = TenderTimingRule(rule)
+        except (KeyError, ValueError, TypeError) as e:
+            errors[rule.id] = str(e)
+        else:
+            families.setdefault(timing.family, []).append(timing)
+
+    summary: Dict[str, Any] = {"entities": {}, "invalid_rules": errors, "flagged": {}}
+    for family, timings in families.items():
+        summary["entities"][family] = 0
+        summary["flagged"].update(replace_dataset_flags(
+            db, [timing.rule for timing in timings], timings[0].entity_type,
+            _flag_chunks(db, family, timings, summary["entities"], chunk_size)
+        ))
+    return summary
+
+
+def _flag_chunks(
+    db: Session,
+    family: str,
+    timings: List[TenderTimingRule],
+    counted: Dict[str, int],
+    chunk_size: int
+) -> Iterator[List[Dict[str, Any]]]:
+    for entity_ids, methods, data in iter_timing_chunks(db, family, chunk_size):
+        counted[family] += len(entity_ids)
+        rows = []
+        for timing in timings:
+            flagged, confidence = timing.evaluate(methods, data)
+            rows.extend(
+                timing.rule.flag_row(timing.entity_type, entity_ids[index], score)
+                for index, score in zip(flagged, confidence)
+            )
+        yield rows
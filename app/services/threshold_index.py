@@ -0,0 +1,96 @@
+from typing import Any, Dict, List, Tuple
+from bisect import bisect_left, bisect_right
+import math
+
+
+class SortedCutoffs:
+    """Cut-off values kept in ascending order with the rule position for each"""
+
+    def __init__(self):
+        self._pending: List[Tuple[float, int]] = []
+        self.values: List[float] = []
+        self.positions: List[int] = []
+
+    def add(self, value: float, position: int) -> None:
+        self._pending.append((value, position))
+
+    def build(self) -> None:
+        self._pending.sort()
+        self.values = [value for value, _ in self._pending]
+        self.positions = [position for _, position in self._pending]
+
+    def __bool__(self) -> bool:
+        return bool(self._pending)
+
+
+class ThresholdIndex:
+    """
+    Index of the threshold and anomaly rules reading one field.
+
+    Threshold cut-offs are sorted per operator, so the rules matching a value
+    are a prefix or suffix of that list found with one ``bisect``. Anomaly
+    ranges match values below ``min_value`` or above ``max_value``, which are
+    likewise a suffix of the sorted minimums plus a prefix of the sorted
+    maximums.
+    """
+
+    def __init__(self):
+        self.positions: List[int] = []
+        self._operators: Dict[str, SortedCutoffs] = {
+            op: SortedCutoffs() for op in (">", ">=", "<", "<=")
+        }
+        self._equals: Dict[float, List[int]] = {}
+        self._minimums = SortedCutoffs()
+        self._maximums = SortedCutoffs()
+
+    def add_threshold(self, operator: str, threshold: float, position: int) -> None:
+        """Index a threshold rule"""
+        if operator == "==":
+            self._equals.setdefault(threshold, []).append(position)
+        else:
+            self._operators[operator].add(threshold, position)
+        self.positions.append(position)
+
+    def add_range(self, min_value: float, max_value: float, position: int) -> None:
+        """Index an anomaly rule's allowed [min_value, max_value] range"""
+        self._minimums.add(min_value, position)
+        self._maximums.add(max_value, position)
+        self.positions.append(position)
+
+    def build(self) -> None:
+        for cutoffs in self._operators.values():
+            cutoffs.build()
+        self._minimums.build()
+        self._maximums.build()
+
+    def match(self, value: Any) -> List[int]:
+        """
+        Positions of all indexed rules matched by a raw field value. A rule
+        with an inverted anomaly range can be reported twice.
+        """
+        try:
+            value = float(value)
+        except (ValueError, TypeError, OverflowError):
+            return []
+        if math.isnan(value):
+            return []
+
+        matched: List[int] = []
+        greater = self._operators[">"]
+        if greater:
+            matched.extend(greater.positions[:bisect_left(greater.values, value)])
+        greater_equal = self._operators[">="]
+        if greater_equal:
+            matched.extend(greater_equal.positions[:bisect_right(greater_equal.values, value)])
+        less = self._operators["<"]
+        if less:
+            matched.extend(less.positions[bisect_right(less.values, value):])
+        less_equal = self._operators["<="]
+        if less_equal:
+            matched.extend(less_equal.positions[bisect_left(less_equal.values, value):])
+        matched.extend(self._equals.get(value, ()))
+
+        if self._minimums:
+            matched.extend(self._minimums.positions[bisect_right(self._minimums.values, value):])
+            matched.extend(self._maximums.positions[:bisect_left(self._maximums.values, value)])
+        return matched
@@ -0,0 +1,319 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import delete, literal, select
+from sqlalchemy.orm import Session
+
+import numpy as np
+
+from app.core.config import settings
+from app.models.award import AwardItem
+from app.models.contract import ContractItem
+from app.models.contracting_process import ContractingProcess
+from app.models.ocds import OCDSContract
+from app.models.risk_analytics import ValueDistributionScore
+from app.services.dataset_rules import DatasetRule, load_dataset_rules, replace_dataset_flags
+from app.services.rule_set import THRESHOLD_OPERATORS
+
+# Value column and the groupings screened, per source table. "" groups all values together.
+VALUE_SOURCES: Dict[str, Tuple[Any, Any, Dict[str, Any]]] = {
+    "award_items": (AwardItem, AwardItem.award_value, {
+        "": literal(""), "buyer": ContractingProcess.buyer_id, "supplier": AwardItem.supplier_id,
+    }),
+    "contract_items": (ContractItem, ContractItem.value, {
+        "": literal(""), "buyer": ContractingProcess.buyer_id, "supplier": ContractItem.supplier_id,
+    }),
+    "ocds_contracts": (OCDSContract, OCDSContract.value_amount, {
+        "": literal(""), "procurement_method": OCDSContract.procurement_method,
+    }),
+}
+
+VALUE_STATISTICS = (
+    "first_digit_chi2", "first_digit_mad", "first_two_chi2", "first_two_mad", "round_share", "below_threshold_share"
+)
+
+# Flags of value distribution rules are attached to the buyer or supplier
+FLAGGED_GROUPS = ("buyer", "supplier")
+VALUE_ENTITY_TYPE = "organizations"
+
+# Benford's law: probability of each first digit (1-9) and first two digits (10-99)
+FIRST_DIGIT_EXPECTED = np.log10(1 + 1 / np.arange(1, 10))
+FIRST_TWO_EXPECTED = np.log10(1 + 1 / np.arange(10, 100))
+
+
+def value_histograms(
+    counts: np.ndarray,
+    values: np.ndarray,
+    round_unit: float = settings.VALUE_SCREEN_ROUND_UNIT,
+    thresholds: Optional[List[float]] = None,
+    margin: float = settings.VALUE_SCREEN_THRESHOLD_MARGIN
+) -> Dict[str, np.ndarray]:
+    """
+    Additive counts of every entity at once, from value counts and values
+    grouped per entity: first two digits histograms (10-99) of values of 10
+    or more, multiples of ``round_unit``, and values within ``margin`` below
+    and above one of the approval ``thresholds``
+    """
+    if thresholds is None:
+        thresholds = settings.VALUE_SCREEN_THRESHOLDS
+    entities = len(counts)
+    group = np.repeat(np.arange(entities), counts)
+
+    tested = values >= 10
+    exponent = np.floor(np.log10(values[tested]))
+    leading = np.clip(np.floor(values[tested] / 10 ** (exponent - 1)), 10, 99).astype(int)
+    first_two = np.bincount(group[tested] * 90 + leading - 10, minlength=entities * 90).reshape(entities, 90)
+
+    units = values / round_unit
+    is_round = (values >= round_unit) & (np.abs(units - np.round(units)) < 1e-9 * np.maximum(units, 1))
+    below = np.zeros(len(values), dtype=bool)
+    above = np.zeros(len(values), dtype=bool)
+    for threshold in thresholds:
+        below |= (values >= threshold * (1 - margin)) & (values < threshold)
+        above |= (values >= threshold) & (values < threshold * (1 + margin))
+    return {
+        "value_count": np.asarray(counts, dtype=float),
+        "first_two": first_two.astype(float),
+        "round": np.bincount(group, weights=is_round, minlength=entities),
+        "below": np.bincount(group, weights=below, minlength=entities),
+        "above": np.bincount(group, weights=above, minlength=entities),
+    }
+
+
+def iter_value_histograms(
+    db: Session,
+    source: str,
+    group_by: str,
+    chunk_size: int = settings.DETECT_STREAM_CHUNK_SIZE
+) -> Iterator[Tuple[List[str], Dict[str, np.ndarray]]]:
+    """
+    Stream the positive values of a source table ordered by entity with one
+    query, turning each chunk into histograms. Yields (entity IDs,
+    histograms) of complete entities; an entity spanning chunks is carried
+    over and its counts added up.
+    """
+    model, value, groups = VALUE_SOURCES[source]
+    entity = groups[group_by]
+    stmt = select(entity, value).select_from(model).where(value > 0)
+    if group_by == "buyer":
+        stmt = stmt.join(ContractingProcess, model.contracting_process_id == ContractingProcess.id)
+    if group_by:
+        stmt = stmt.where(entity.isnot(None)).order_by(entity)
+
+    carry_id, carry = None, None
+    for rows in db.execute(stmt.execution_options(yield_per=chunk_size)).partitions(chunk_size):
+        ids = np.array([row[0] for row in rows], dtype=object)
+        starts = np.concatenate(([0], np.flatnonzero(ids[1:] != ids[:-1]) + 1))
+        entity_ids = list(ids[starts])
+        values = np.array([row[1] for row in rows], dtype=float)
+        histograms = value_histograms(np.diff(np.append(starts, len(ids))), values)
+        if carry is not None:
+            if entity_ids[0] == carry_id:
+                for name, counts in histograms.items():
+                    counts[0] += carry[name][0]
+            else:
+                entity_ids.insert(0, carry_id)
+                histograms = {name: np.concatenate((carry[name], counts)) for name, counts in histograms.items()}
+        # The last entity may continue in the next chunk
+        carry_id, carry = entity_ids[-1], {name: counts[-1:] for name, counts in histograms.items()}
+        if len(entity_ids) > 1:
+            yield entity_ids[:-1], {name: counts[:-1] for name, counts in histograms.items()}
+    if carry is not None:
+        yield [carry_id], carry
+
+
+def value_statistics(histograms: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Forensic screens of every entity at once from its histograms. NaN where
+    an entity has no values to test.
+
+    - ``first_digit_*`` and ``first_two_*``: chi-square statistic and mean
+      absolute deviation (MAD) of the first digit and first two digits
+      histograms from Benford's law
+    - ``round_share``: share of values that are round numbers
+    - ``below_threshold_share``: of the values near an approval threshold,
+      the share just below it rather than just above
+    """
+    first_two = histograms["first_two"]
+    # The first digit histogram sums the first two digits one by tens
+    first_digit = first_two.reshape(len(first_two), 9, 10).sum(axis=2)
+    benford_count = first_two.sum(axis=1)
+    near = histograms["below"] + histograms["above"]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        statistics: Dict[str, np.ndarray] = {
+            "benford_count": benford_count,
+            "round_share": histograms["round"] / histograms["value_count"],
+            "below_threshold_share": np.where(near > 0, histograms["below"] / near, np.nan),
+        }
+        for name, histogram, expected_share in (
+            ("first_digit", first_digit, FIRST_DIGIT_EXPECTED),
+            ("first_two", first_two, FIRST_TWO_EXPECTED),
+        ):
+            total = benford_count[:, None]
+            expected = total * expected_share
+            has_values = benford_count > 0
+            statistics[f"{name}_chi2"] = np.where(
+                has_values, ((histogram - expected) ** 2 / expected).sum(axis=1), np.nan
+            )
+            statistics[f"{name}_mad"] = np.where(
+                has_values, np.abs(histogram / total - expected_share).mean(axis=1), np.nan
+            )
+    return statistics
+
+
+def store_value_scores(
+    db: Session,
+    source: str,
+    group_by: str,
+    chunk_size: int = settings.DETECT_STREAM_CHUNK_SIZE
+) -> int:
+    """
+    Recompute the value distribution scores of every entity of a grouping,
+    replacing the stored ones. Does not commit. Returns the number of entities.
+    """
+    db.execute(delete(ValueDistributionScore).where(
+        ValueDistributionScore.source == source,
+        ValueDistributionScore.group_by == group_by
+    ))
+    stored = 0
+    for entity_ids, histograms in iter_value_histograms(db, source, group_by, chunk_size):
+        statistics = value_statistics(histograms)
+        columns = {
+            name: [None if np.isnan(value) else float(value) for value in statistics[name]]
+            for name in VALUE_STATISTICS
+        }
+        db.execute(ValueDistributionScore.__table__.insert(), [
+            {
+                "source": source,
+                "group_by": group_by,
+                "entity_id": entity_id,
+                "value_count": int(histograms["value_count"][index]),
+                "benford_count": int(statistics["benford_count"][index]),
+                **{name: columns[name][index] for name in VALUE_STATISTICS},
+            }
+            for index, entity_id in enumerate(entity_ids)
+        ])
+        stored += len(entity_ids)
+    return stored
+
+
+class ValueDistributionScreen:
+    """
+    A ``value_distribution`` rule: flags the buyers or suppliers
+    (``group_by``) whose values in ``source`` have a ``statistic`` (one of
+    VALUE_STATISTICS) comparing to ``threshold`` with ``operator``, among
+    those with at least ``min_values`` values.
+    """
+
+    def __init__(self, rule: DatasetRule):
+        self.rule = rule
+        params = rule.params
+        self.source = params.get("source", "award_items")
+        if self.source not in VALUE_SOURCES:
+            raise ValueError(f"Unknown value source: {self.source}")
+        self.group_by = params.get("group_by", "supplier")
+        if self.group_by not in FLAGGED_GROUPS or self.group_by not in VALUE_SOURCES[self.source][2]:
+            raise ValueError(f"Cannot flag {self.source} values by {self.group_by!r}")
+        self.statistic = params.get("statistic", "first_digit_mad")
+        if self.statistic not in VALUE_STATISTICS:
+            raise ValueError(f"Unknown value statistic: {self.statistic}")
+        self.operator = params.get("operator", ">")
+        self.compare = THRESHOLD_OPERATORS.get(self.operator)
+        if self.compare is None:
+            raise ValueError(f"Unknown operator: {self.operator}")
+        self.threshold = float(params["threshold"])
+        self.min_values = int(params.get("min_values", 100))
+
+    def flag_rows(self, db: Session) -> List[Dict[str, Any]]:
+        """Flags of every entity matching the rule, from the stored scores"""
+        column = getattr(ValueDistributionScore, self.statistic)
+        rows = db.execute(
+            select(ValueDistributionScore.entity_id, column).where(
+                ValueDistributionScore.source == self.source,
+                ValueDistributionScore.group_by == self.group_by,
+                ValueDistributionScore.value_count >= self.min_values,
+                column.isnot(None)
+            )
+        ).all()
+        if not rows:
+            return []
+        values = np.array([value for _, value in rows], dtype=float)
+        flagged = np.flatnonzero(self.compare(values, self.threshold))
+        excess = np.abs(values[flagged] - self.threshold) / max(abs(self.threshold), 1e-9)
+        return [
+            self.rule.flag_row(VALUE_ENTITY_TYPE, rows[index][0], score)
+            for index, score in zip(flagged, self.rule.confidence(excess))
+        ]
+
+
+def run_value_screens(
+    db: Session,
+    sources: Optional[List[str]] = None,
+    chunk_size: int = settings.DETECT_STREAM_CHUNK_SIZE
+) -> Dict[str, Any]:
+    """
+    Recompute the value distribution scores of every grouping of the given
+    sources (all by default), then evaluate the active ``value_distribution``
+    rules on them, retiring flags that no longer match
+    """
+    sources = sources or list(VALUE_SOURCES)
+    unknown = [source for source in sources if source not in VALUE_SOURCES]
+    if unknown:
+        raise ValueError(f"Unknown value sources: {', '.join(unknown)}")
+
+    rules, errors = load_dataset_rules(db, "value_distribution")
+    screens = []
+    for rule in rules:
+        try:
+            screens.append(ValueDistributionScreen(rule))
+        except (KeyError, ValueError, TypeError) as e:
+            errors[rule.id] = str(e)
+
+    scored: Dict[str, Dict[str, int]] = {}
+    try:
+        for source in sources:
+            scored[source] = {
+                group_by or "all": store_value_scores(db, source, group_by, chunk_size)
+                for group_by in VALUE_SOURCES[source][2]
+            }
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    # Rules on sources not rescored keep evaluating their last stored scores
+    flagged = replace_dataset_flags(
+        db, [screen.rule for screen in screens], VALUE_ENTITY_TYPE,
+        (screen.flag_rows(db) for screen in screens)
+    )
+    return {"scored": scored, "invalid_rules": errors, "flagged": flagged}
+
+
+def get_value_scores(
+    db: Session,
+    source: str = "award_items",
+    group_by: str = "supplier",
+    statistic: str = "first_digit_mad",
+    min_values: int = 100,
+    limit: int = 100
+) -> List[Dict[str, Any]]:
+    """Stored scores of the entities deviating most on a statistic"""
+    if source not in VALUE_SOURCES or group_by not in VALUE_SOURCES[source][2]:
+        raise ValueError(f"No value scores for {source} by {group_by!r}")
+    if statistic not in VALUE_STATISTICS:
+        raise ValueError(f"Unknown value statistic: {statistic}")
+    column = getattr(ValueDistributionScore, statistic)
+    rows = db.query(ValueDistributionScore).filter(
+        ValueDistributionScore.source == source,
+        ValueDistributionScore.group_by == group_by,
+        ValueDistributionScore.value_count >= min_values,
+        column.isnot(None)
+    ).order_by(column.desc()).limit(limit).all()
+    return [
+        {
+            "entity_id": row.entity_id or None,
+            "value_count": row.value_count,
+            "benford_count": row.benford_count,
+            **{name: getattr(row, name) for name in VALUE_STATISTICS},
+        }
+        for row in rows
+    ]
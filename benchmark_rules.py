@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Benchmark the red flag rule engine on generated OCDS contracts
+
+Runs every combination of rule catalogue size, record count and mode
+(single: one detect call per record; batch: the batch path over chunks;
+parallel: the process pool scanner) and writes records/s and p50/p99
+latencies to a JSON file. Latency is per call: one record in single mode,
+one chunk in batch mode, and the time between completed chunks in parallel
+mode. Rules and records are generated from --seed, so runs are comparable
+between versions.
+
+Examples:
+    python benchmark_rules.py --output bench.json
+    python benchmark_rules.py --rules 10 100 --records 1000 --modes batch --baseline bench.json
+    python benchmark_rules.py --rule-types regex --rules 300 --records 1000 --modes batch
+    python benchmark_rules.py --rules 10000 --records 1000 --modes single --profile-sample-rate 1
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.ocds_generator import RULE_KINDS, OCDSGenerator, generate_rules
+from app.services.parallel_scanner import ParallelScanner, iter_chunks
+from app.services.red_flag_engine import RedFlagEngine
+from app.services.rule_profiler import RuleProfiler
+from app.services.rule_set import CompiledRuleSet
+
+MODES = ("single", "batch", "parallel")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", type=int, nargs="+", default=[10, 100, 1000, 10000],
+                        help="rule catalogue sizes")
+    parser.add_argument("--records", type=int, nargs="+", default=[1000, 10000], help="record counts")
+    parser.add_argument("--rule-types", nargs="+", choices=RULE_KINDS, default=list(RULE_KINDS),
+                        help="rule types in the generated catalogue, e.g. regex alone to time the regex scanner")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=settings.DETECT_STREAM_CHUNK_SIZE,
+                        help="records per batch call or worker task")
+    parser.add_argument("--workers", type=int, default=settings.SCAN_WORKERS,
+                        help="worker processes in parallel mode (default: CPU count)")
+    parser.add_argument("--output", default="benchmark.json", help="JSON file to write results to")
+    parser.add_argument("--baseline", help="earlier results file to compare records/s against")
+    parser.add_argument("--profile-sample-rate", type=float,
+                        help="run with the rule profiler timing this share of calls (default: no profiler)")
+    return parser.parse_args()
+
+
+def run_case(rules: List[Any], records: List[Dict[str, Any]], mode: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """Time one mode over the records, returning throughput and latency percentiles"""
+    compile_started = time.perf_counter()
+    rule_set = CompiledRuleSet(rules)
+    compile_seconds = time.perf_counter() - compile_started
+    profiler = None
+    if args.profile_sample_rate is not None:
+        profiler = RuleProfiler(enabled=True, slow_rule_ms=None, sample_rate=args.profile_sample_rate)
+    engine = RedFlagEngine(db=None, cache=None, rule_set=rule_set, profiler=profiler)
+
+    latencies = []
+    flagged = 0
+    started = time.perf_counter()
+    if mode == "single":
+        for record in records:
+            call_started = time.perf_counter()
+            flagged += bool(engine.detect_red_flags(record))
+            latencies.append(time.perf_counter() - call_started)
+    elif mode == "batch":
+        for chunk in iter_chunks(records, args.chunk_size):
+            call_started = time.perf_counter()
+            flagged += sum(bool(flags) for flags in engine.detect_red_flags_batch(chunk))
+            latencies.append(time.perf_counter() - call_started)
+    else:
+        completions = [started]
+
+        def progress(processed: int) -> None:
+            completions.append(time.perf_counter())
+
+        scanner = ParallelScanner(rules, workers=args.workers, chunk_size=args.chunk_size, progress=progress)
+        flagged = sum(bool(flags) for _, flags in scanner.scan(records))
+        latencies = list(np.diff(completions))
+    seconds = time.perf_counter() - started
+
+    return {
+        "rules": len(rules),
+        "compiled_rules": len(rule_set),
+        "records": len(records),
+        "mode": mode,
+        "compile_ms": compile_seconds * 1000,
+        "seconds": seconds,
+        "records_per_second": len(records) / seconds,
+        "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+        "p99_ms": float(np.percentile(latencies, 99)) * 1000,
+        "flagged_records": flagged,
+    }
+
+
+def compare(results: List[Dict[str, Any]], path: str) -> None:
+    """Print the records/s change of every case also found in the baseline file"""
+    with open(path, encoding="utf-8") as handle:
+        baseline = {
+            (case["rules"], case["records"], case["mode"]): case
+            for case in json.load(handle)["results"]
+        }
+    matched = 0
+    for case in results:
+        previous = baseline.get((case["rules"], case["records"], case["mode"]))
+        if previous:
+            matched += 1
+            change = case["records_per_second"] / previous["records_per_second"] - 1
+            print(f"   {case['mode']:>8} {case['rules']:>6} rules {case['records']:>7} records: "
+                  f"{change:+.1%} records/s", file=sys.stderr)
+    if not matched:
+        print("   no case of this run is in the baseline", file=sys.stderr)
+
+
+def main():
+    """Run the benchmark matrix and write the results"""
+    args = parse_args()
+    results = []
+    for record_count in args.records:
+        records = list(OCDSGenerator(seed=args.seed).contracts(record_count))
+        for rule_count in args.rules:
+            rules = generate_rules(rule_count, seed=args.seed, kinds=args.rule_types)
+            for mode in args.modes:
+                case = run_case(rules, records, mode, args)
+                results.append(case)
+                print(f"⏱️  {mode:>8} {rule_count:>6} rules {record_count:>7} records: "
+                      f"{case['records_per_second']:.0f} records/s, "
+                      f"p50 {case['p50_ms']:.2f} ms, p99 {case['p99_ms']:.2f} ms", file=sys.stderr)
+
+    report = {
+        "version": settings.VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "seed": args.seed,
+        "rule_types": args.rule_types,
+        "profile_sample_rate": args.profile_sample_rate,
+        "chunk_size": args.chunk_size,
+        "workers": args.workers or os.cpu_count(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"✅ {len(results)} cases written to {args.output}", file=sys.stderr)
+    if args.baseline:
+        print(f"📊 Compared with {args.baseline}:", file=sys.stderr)
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
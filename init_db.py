@@ -73,6 +73,114 @@ def create_initial_data():
                     "severity": "medium",
                     "base_confidence": 0.7
                 })
+            },
+            {
+                "name": "Clustered Bid Prices",
+                "description": "Detect tenders whose bids are suspiciously close together",
+                "rule_type": "bid_rigging",
+                "parameters": json.dumps({
+                    "statistic": "cv",
+                    "operator": "<",
+                    "threshold": 0.03,
+                    "min_bids": 3,
+                    "category": "collusion",
+                    "severity": "high",
+                    "base_confidence": 0.6
+                })
+            },
+            {
+                "name": "Cover Bidding Pattern",
+                "description": "Detect tenders where losing bids cluster far above the winning bid",
+                "rule_type": "bid_rigging",
+                "parameters": json.dumps({
+                    "statistic": "relative_distance",
+                    "operator": ">",
+                    "threshold": 3,
+                    "min_bids": 4,
+                    "category": "collusion",
+                    "severity": "high",
+                    "base_confidence": 0.6
+                })
+            },
+            {
+                "name": "Benford Deviation of Supplier Awards",
+                "description": "Detect suppliers whose award values do not conform to Benford's law",
+                "rule_type": "value_distribution",
+                "parameters": json.dumps({
+                    "source": "award_items",
+                    "group_by": "supplier",
+                    "statistic": "first_two_mad",
+                    "operator": ">",
+                    "threshold": 0.0022,
+                    "min_values": 1000,
+                    "category": "fraud",
+                    "severity": "medium",
+                    "base_confidence": 0.4
+                })
+            },
+            {
+                "name": "Split Purchases",
+                "description": "Detect awards to one supplier split to stay under an approval threshold",
+                "rule_type": "split_purchase",
+                "parameters": json.dumps({
+                    "threshold": 50000,
+                    "window_days": 30,
+                    "min_awards": 2,
+                    "min_share": 0.2,
+                    "category": "procurement",
+                    "severity": "high",
+                    "base_confidence": 0.5
+                })
+            },
+            {
+                "name": "Related Suppliers Bidding Together",
+                "description": "Detect tenders with bids from suppliers that look like the same company",
+                "rule_type": "related_suppliers",
+                "parameters": json.dumps({
+                    "min_similarity": 0.9,
+                    "category": "collusion",
+                    "severity": "high",
+                    "base_confidence": 0.6
+                })
+            },
+            {
+                "name": "Bid Rotation",
+                "description": "Detect suppliers that repeatedly bid together and take turns winning",
+                "rule_type": "bid_rotation",
+                "parameters": json.dumps({
+                    "min_tenders": 5,
+                    "threshold": 0.6,
+                    "category": "collusion",
+                    "severity": "high",
+                    "base_confidence": 0.6
+                })
+            },
+            {
+                "name": "Short Tender Period",
+                "description": "Detect tender periods too short for the procurement method",
+                "rule_type": "tender_timing",
+                "parameters": json.dumps({
+                    "metric": "tender_period_days",
+                    "operator": "<",
+                    "method_thresholds": {"open": 30, "selective": 25, "limited": 10},
+                    "category": "procurement",
+                    "severity": "medium",
+                    "base_confidence": 0.5
+                })
+            },
+            {
+                "name": "Late Contract Amendments",
+                "description": "Detect contracts amended repeatedly near the end of their period",
+                "rule_type": "tender_timing",
+                "parameters": json.dumps({
+                    "metric": "late_amendments",
+                    "operator": ">=",
+                    "threshold": 2,
+                    "late_share": 0.75,
+                    "category": "contract",
+                    "severity": "medium",
+                    "base_confidence": 0.5
+                })
             }
         ]
         
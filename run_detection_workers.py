@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Run detection job workers outside the API process
+
+Set DETECTION_JOB_WORKERS=0 for the API when jobs are drained by this script.
+
+Example:
+    python run_detection_workers.py --workers 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.crud.detection_job import requeue_stale_detection_jobs
+from app.services.detection_jobs import DetectionJobWorkerPool
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: CPU count)")
+    parser.add_argument("--poll-seconds", type=float, default=settings.DETECTION_JOB_POLL_SECONDS,
+                        help="how often idle workers check the queue")
+    return parser.parse_args()
+
+
+def run_worker(poll_seconds: float) -> None:
+    """Drain the queue from one process"""
+    pool = DetectionJobWorkerPool(workers=1, poll_seconds=poll_seconds)
+    pool.work(f"{socket.gethostname()}:{os.getpid()}")
+
+
+def main():
+    """Start the worker processes and wait for them"""
+    args = parse_args()
+    db = SessionLocal()
+    try:
+        requeued = requeue_stale_detection_jobs(db, stale_seconds=settings.DETECTION_JOB_STALE_SECONDS)
+    finally:
+        db.close()
+    if requeued:
+        print(f"♻️  Requeued {requeued} stale jobs", file=sys.stderr)
+
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(args.poll_seconds,), daemon=True)
+        for _ in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    print(f"🚀 {len(processes)} detection job workers running", file=sys.stderr)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        print("\n🛑 Workers stopped", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
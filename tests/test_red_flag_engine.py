@@ -0,0 +1,944 @@
+"""
+Tests for the red flag rule engine
+"""
+
+from datetime import datetime, timedelta
+import json
+import random
+import re
+import statistics
+from types import SimpleNamespace
+
+import pytest
+import scan_records
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app.core.config import settings
+from app.core.database import Base
+from app.models.ocds import OCDSContract
+from app.models.red_flag import DetectionJob, RedFlag, RedFlagRule
+from app.models.award import AwardItem
+from app.models.contract import ContractAmendment, ContractItem
+from app.models.contracting_process import ContractingProcess
+from app.models.organization import Organization
+from app.models.risk_analytics import (
+    BuyerConcentration, BuyerSupplierTotal, DetectorState, PeerGroupStatistic, RiskProfile, TenderCompetition,
+    CoBiddingTender, OrganizationLshBucket, SupplierCoBid, ValueDistributionScore
+)
+from app.models.tender import TenderItem, TenderResponse
+from app.crud.detection_job import cancel_detection_job, claim_detection_job, enqueue_detection_job, enqueue_rescan_job
+from app.crud.red_flag import get_active_red_flag_rules, upsert_detected_red_flags
+from app.crud import award as award_crud
+from app.schemas.award import AwardItemUpdate
+from app.schemas.red_flag import DetectionJobCreate
+from app.services.detection_cache import DetectionCache
+from app.services.bid_screens import run_bid_rigging_screens
+from app.services.co_bidding import CoBiddingGraph, refresh_co_bidding, run_bid_rotation_detector
+from app.services.detection_jobs import DetectionJobWorkerPool, run_detection_job
+from app.services.ocds_generator import OCDSGenerator, generate_rules
+from app.services.organization_matching import (
+    find_similar_organizations, index_organization, rebuild_organization_index, run_related_suppliers_detector
+)
+from app.services.parallel_scanner import ParallelScanner
+from app.services.peer_statistics import PeerStatisticsStore, peer_statistics, record_observations
+from app.services.red_flag_engine import RedFlagEngine, red_flag_row
+from app.services.regex_scanner import RegexScanner, required_literal
+from app.services.rule_profiler import RuleProfiler
+from app.services.rule_rescan import rescan_rule
+from app.services.rule_set import CompiledRuleSet, RuleSetRegistry, compile_rule
+from app.services.shadow_rules import ShadowRuleEvaluator
+from app.services.single_bidder import run_single_bidder_detector
+from app.services.split_purchases import run_split_purchase_detector
+from app.services.tender_timing import run_tender_timing_screens
+from app.services.value_screens import get_value_scores, run_value_screens
+from app.services.supplier_concentration import (
+    apply_award_change, award_contribution, get_buyer_concentration, rebuild_supplier_concentration
+)
+
+
+def make_rule(id, rule_type, **params):
+    """Build a stand-in for a stored RedFlagRule row"""
+    return SimpleNamespace(
+        id=id,
+        name=f"rule-{id}",
+        description=f"Rule {id}",
+        rule_type=rule_type,
+        parameters=json.dumps(params),
+        is_active=True,
+    )
+
+
+SAMPLE_RULES = [
+    make_rule(1, "threshold", field="value_amount", threshold=1000000, operator=">",
+              category="financial", severity="high", base_confidence=0.8),
+    make_rule(2, "pattern", field="title", pattern="Suspicious",
+              category="compliance", base_confidence=0.6),
+    make_rule(3, "anomaly", field="value_amount", min_value=1000, max_value=10000000),
+    make_rule(4, "threshold", field="value.amount", threshold=500, operator="<="),
+]
+
+
+@pytest.fixture
+def engine_factory(monkeypatch):
+    """Create engines evaluating a fixed list of rules"""
+    def factory(rules, db=None, cache=None):
+        rule_set = CompiledRuleSet(rules)
+        monkeypatch.setattr(RedFlagEngine, "_load_rules", lambda self: rule_set)
+        return RedFlagEngine(db=db, cache=cache)
+    return factory
+
+
+@pytest.fixture
+def contracts_db():
+    """In-memory database holding a few stored OCDS contracts"""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    table = OCDSContract.__table__
+    Base.metadata.create_all(bind=engine, tables=[
+        table, RedFlag.__table__, RedFlagRule.__table__, DetectionJob.__table__, TenderResponse.__table__,
+        TenderItem.__table__, ContractingProcess.__table__, DetectorState.__table__, TenderCompetition.__table__,
+        AwardItem.__table__, BuyerSupplierTotal.__table__, BuyerConcentration.__table__, RiskProfile.__table__,
+        ValueDistributionScore.__table__, Organization.__table__, OrganizationLshBucket.__table__,
+        CoBiddingTender.__table__, SupplierCoBid.__table__, ContractItem.__table__, ContractAmendment.__table__,
+        PeerGroupStatistic.__table__
+    ])
+    with Session(bind=engine) as db:
+        db.execute(table.insert(), [
+            {"contract_id": "c-1", "title": "Road works", "value_amount": 500},
+            {"contract_id": "c-2", "title": "Suspicious consulting", "value_amount": 2000000},
+            {"contract_id": "c-3", "title": "Office supplies", "value_amount": None},
+        ])
+        db.commit()
+        yield db
+
+
+@pytest.fixture
+def file_db(tmp_path):
+    """File-backed SQLite database, where an open read cursor blocks writes, holding 25 contracts"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'scan.db'}")
+    Base.metadata.create_all(bind=engine, tables=[
+        OCDSContract.__table__, RedFlag.__table__, RedFlagRule.__table__, DetectionJob.__table__
+    ])
+    with Session(bind=engine) as db:
+        db.execute(OCDSContract.__table__.insert(), [
+            {"contract_id": f"c-{i}", "title": "Suspicious" if i % 2 else "Road works", "value_amount": i * 100000}
+            for i in range(25)
+        ])
+        db.commit()
+        yield db
+    engine.dispose()
+
+
+def test_detects_matching_rules(engine_factory):
+    """Threshold, pattern and anomaly rules are evaluated on one record"""
+    engine = engine_factory(SAMPLE_RULES)
+    flags = engine.detect_red_flags({
+        "value_amount": 20000000,
+        "title": "A SUSPICIOUS supplier",
+        "value": {"amount": 100},
+    })
+
+    assert [flag["rule_id"] for flag in flags] == [1, 2, 3, 4]
+    assert flags[0]["confidence_score"] == 1.0
+    assert flags[0]["severity"] == "high"
+    assert flags[1]["category"] == "compliance"
+    assert flags[1]["severity"] == "medium"
+    assert flags[3]["severity"] == "low"
+
+
+def test_missing_fields_do_not_match(engine_factory):
+    """Rules whose field is absent from the record never fire"""
+    engine = engine_factory(SAMPLE_RULES)
+    assert engine.detect_red_flags({"title": "regular supplier"}) == []
+
+
+def test_invalid_rules_are_skipped():
+    """Rules with malformed parameters are reported instead of evaluated"""
+    broken = SimpleNamespace(id=9, name="broken", description="", rule_type="threshold",
+                             parameters="{not json", is_active=True)
+    rule_set = CompiledRuleSet(SAMPLE_RULES + [broken])
+
+    assert len(rule_set) == len(SAMPLE_RULES)
+    assert 9 in rule_set.errors
+
+
+def test_rule_set_registry_logs_compile_errors_once(contracts_db, caplog):
+    """A broken stored rule is logged when the rule set is compiled, not on every recompile"""
+    contracts_db.add(RedFlagRule(name="broken", description="", rule_type="threshold", parameters="{not json"))
+    contracts_db.commit()
+    registry = RuleSetRegistry(refresh_seconds=0)
+
+    assert list(registry.get(contracts_db).errors) == [1]
+    registry.invalidate()
+    registry.get(contracts_db)
+
+    assert caplog.text.count("Red flag rule 1 cannot be compiled") == 1
+
+
+def test_ruleset_version_tracks_rule_changes():
+    """Editing a rule changes the rule set version"""
+    original = CompiledRuleSet(SAMPLE_RULES)
+    edited = CompiledRuleSet(SAMPLE_RULES[:-1] + [
+        make_rule(4, "threshold", field="value.amount", threshold=600, operator="<="),
+    ])
+
+    assert original.version == CompiledRuleSet(list(SAMPLE_RULES)).version
+    assert original.version != edited.version
+
+
+def test_batch_detection_matches_single_record_path(engine_factory):
+    """Batch detection returns the same flags as per-record detection"""
+    engine = engine_factory(SAMPLE_RULES)
+    records = [
+        {"value_amount": 20000000, "title": "suspicious", "value": {"amount": 100}},
+        {"value_amount": "500", "title": 42},
+        {"value_amount": None, "value": {"amount": "n/a"}},
+        {},
+        {"value_amount": 150000, "title": "Regular"},
+    ]
+
+    assert engine.detect_red_flags_batch(records) == [
+        engine.detect_red_flags(record) for record in records
+    ]
+
+
+def test_pattern_rules_share_one_automaton_per_field(engine_factory):
+    """Overlapping keywords on one field are all reported in rule order"""
+    rules = [
+        make_rule(10, "pattern", field="supplier.name", pattern="Shell"),
+        make_rule(11, "pattern", field="supplier.name", pattern="holdings ltd"),
+        make_rule(12, "pattern", field="supplier.name", pattern="hell"),
+        make_rule(13, "pattern", field="supplier.name", pattern="offshore"),
+    ]
+    engine = engine_factory(rules)
+
+    assert len(engine.rule_set.pattern_matchers) == 1
+    flags = engine.detect_red_flags({"supplier": {"name": "SHELL Holdings Ltd"}})
+    assert [flag["rule_id"] for flag in flags] == [10, 11, 12]
+
+
+def test_threshold_index_returns_every_matching_cutoff(engine_factory):
+    """Threshold and anomaly rules on one field are answered by the sorted index"""
+    rules = [
+        make_rule(20, "threshold", field="value_amount", threshold=1000, operator=">"),
+        make_rule(21, "threshold", field="value_amount", threshold=5000, operator=">="),
+        make_rule(22, "threshold", field="value_amount", threshold=9000, operator=">"),
+        make_rule(23, "threshold", field="value_amount", threshold=5000, operator="=="),
+        make_rule(24, "threshold", field="value_amount", threshold=6000, operator="<"),
+        make_rule(25, "anomaly", field="value_amount", min_value=0, max_value=4000),
+        make_rule(26, "anomaly", field="value_amount", min_value=6000, max_value=9000),
+    ]
+    engine = engine_factory(rules)
+
+    assert list(engine.rule_set.threshold_indexes) == ["value_amount"]
+    flags = engine.detect_red_flags({"value_amount": 5000})
+    assert [flag["rule_id"] for flag in flags] == [20, 21, 23, 24, 25, 26]
+
+
+def test_field_paths_support_array_indexing(engine_factory):
+    """OCDS-style paths index into lists, and bad indexes resolve to nothing"""
+    rules = [
+        make_rule(30, "threshold", field="awards[0].value.amount", threshold=100, operator=">"),
+        make_rule(31, "threshold", field="awards[-1].value.amount", threshold=100, operator=">"),
+        make_rule(32, "pattern", field="parties[2].name", pattern="ltd"),
+    ]
+    engine = engine_factory(rules)
+    record = {
+        "awards": [{"value": {"amount": 500}}, {"value": {"amount": 50}}],
+        "parties": [{"name": "Buyer"}],
+    }
+
+    assert [flag["rule_id"] for flag in engine.detect_red_flags(record)] == [30]
+    assert engine.rule_set.accessors["awards[0].value.amount"] is engine.rules[0].accessor
+
+
+def test_detect_in_table_pushes_rules_down_to_sql(engine_factory, contracts_db):
+    """Stored rows are screened in SQL, with pattern rules streamed in Python and composites skipped"""
+    engine = engine_factory(SAMPLE_RULES + [
+        make_rule(10, "composite", field="value_amount", condition={"rule": 1})
+    ], db=contracts_db)
+
+    matches = engine.detect_in_table("ocds_contracts")
+
+    assert matches == {1: [2], 2: [2], 3: [1]}
+
+
+def test_persisted_detections_are_deduplicated(engine_factory, contracts_db):
+    """Re-scanning with the same rules refreshes stored flags instead of duplicating them"""
+    engine = engine_factory(SAMPLE_RULES, db=contracts_db)
+
+    engine.detect_in_table("ocds_contracts", persist=True)
+    engine.detect_in_table("ocds_contracts", persist=True)
+
+    stored = contracts_db.execute(RedFlag.__table__.select()).mappings().all()
+    assert sorted((row["rule_id"], row["entity_id"]) for row in stored) == [
+        (1, "2"), (2, "2"), (3, "1")
+    ]
+    assert all(row["entity_type"] == "ocds_contracts" for row in stored)
+
+
+def test_detection_cache_skips_unchanged_records(engine_factory):
+    """Re-submitted records hit the cache until the rule set version changes"""
+    cache = DetectionCache(max_entries=10, ttl_seconds=0)
+    engine = engine_factory(SAMPLE_RULES, cache=cache)
+    record = {"title": "suspicious", "value_amount": 20000000}
+
+    first = engine.detect_red_flags(record)
+    assert engine.detect_red_flags(dict(reversed(list(record.items())))) == first
+    assert engine.detect_red_flags_batch([record, {"title": "other"}]) == [first, []]
+    assert (cache.hits, cache.misses) == (2, 2)
+
+    edited = engine_factory(SAMPLE_RULES[:1], cache=cache)
+    assert [flag["rule_id"] for flag in edited.detect_red_flags(record)] == [1]
+    assert cache.stats()["entries"] == 1
+
+
+def test_rescan_rule_retires_flags_from_old_rule_version(contracts_db):
+    """Editing a rule and re-scanning swaps its stored flags to the new matches"""
+    rule = RedFlagRule(name="High value", description="", rule_type="threshold",
+                       parameters=json.dumps({"field": "value_amount", "threshold": 1000}))
+    contracts_db.add(rule)
+    contracts_db.commit()
+
+    summary = rescan_rule(contracts_db, rule.id, targets=["ocds_contracts"])
+    assert summary["targets"]["ocds_contracts"] == {"previously_flagged": 0, "flagged": 1}
+    # A flag stored through /detect/ for an entity type that is not a stored table
+    compiled = compile_rule(rule)
+    upsert_detected_red_flags(contracts_db, objs_in=[
+        red_flag_row(compiled.to_flag(5000), compiled.version, "api_records", "r-1")
+    ])
+
+    rule.parameters = json.dumps({"field": "value_amount", "threshold": 100})
+    contracts_db.commit()
+    job = enqueue_rescan_job(contracts_db, rule_id=rule.id)
+    pool = DetectionJobWorkerPool(workers=0, session_factory=lambda: Session(bind=contracts_db.get_bind()))
+    done = pool.run_once("test")
+    assert (done.id, done.status, done.error, done.flagged) == (job.id, "completed", None, 2)
+    summary = done.results[0]
+    assert summary["targets"]["ocds_contracts"] == {"previously_flagged": 1, "flagged": 2}
+    assert summary["other_entity_types"] == {"retired": 1}
+
+    active = contracts_db.execute(
+        RedFlag.__table__.select().where(RedFlag.__table__.c.is_active == True)
+    ).mappings().all()
+    assert sorted(row["entity_id"] for row in active) == ["1", "2"]
+    assert {row["rule_version"] for row in active} == {summary["rule_version"]}
+
+
+def test_rescan_rejects_composite_rules_and_keeps_their_flags(contracts_db):
+    """Composite rules are not re-evaluated per table, so a re-scan must not retire their flags"""
+    rule = RedFlagRule(name="Combined", description="", rule_type="composite",
+                       parameters=json.dumps({"condition": {"all": [{"rule": 1}]}}))
+    contracts_db.add(rule)
+    contracts_db.commit()
+    compiled = compile_rule(rule)
+    upsert_detected_red_flags(contracts_db, objs_in=[
+        red_flag_row(compiled.to_flag(None), compiled.version, "ocds_contracts", 2)
+    ])
+
+    with pytest.raises(ValueError, match="combines other rules"):
+        rescan_rule(contracts_db, rule.id)
+
+    active = contracts_db.execute(
+        RedFlag.__table__.select().where(RedFlag.__table__.c.is_active == True)
+    ).mappings().all()
+    assert [(row["rule_id"], row["entity_id"]) for row in active] == [(rule.id, "2")]
+
+
+def test_rescan_loads_peer_statistics_of_statistical_rules(contracts_db):
+    """A re-scan in a process that never loaded the peer statistics reads the stored ones"""
+    rule = RedFlagRule(name="Outlier", description="", rule_type="statistical",
+                       parameters=json.dumps({"field": "value_amount", "k": 3}))
+    contracts_db.add(rule)
+    contracts_db.commit()
+    generator = random.Random(3)
+    try:
+        peer_statistics.observe(contracts_db, [
+            (("value_amount", "", ""), generator.gauss(600, 100)) for _ in range(100)
+        ])
+        # As in a freshly started job worker
+        peer_statistics.restore({})
+        peer_statistics.invalidate()
+
+        summary = rescan_rule(contracts_db, rule.id, targets=["ocds_contracts"])
+    finally:
+        peer_statistics.restore({})
+
+    assert summary["targets"]["ocds_contracts"] == {"previously_flagged": 0, "flagged": 1}
+
+
+def test_parallel_scanner_preserves_order_and_results(engine_factory):
+    """Records sharded across worker processes come back in input order"""
+    engine = engine_factory(SAMPLE_RULES)
+    records = [{"id": i, "value_amount": i * 100000, "title": "suspicious" if i % 3 else "ok"}
+               for i in range(50)]
+    progress = []
+
+    scanner = ParallelScanner(SAMPLE_RULES, workers=2, chunk_size=7, progress=progress.append)
+    results = list(scanner.scan(iter(records)))
+
+    assert [record["id"] for record, _ in results] == list(range(50))
+    assert [flags for _, flags in results] == [engine.detect_red_flags(record) for record in records]
+    assert progress[-1] == 50
+
+
+def test_statistical_rule_flags_outliers_within_peer_group(engine_factory):
+    """Values far from their peer group's running mean or median are flagged"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine, tables=[PeerGroupStatistic.__table__])
+    rules = [
+        make_rule(5, "statistical", field="value_amount", group_by="procurement_method", k=3),
+        make_rule(6, "statistical", field="value_amount", method="mad", k=5),
+    ]
+    generator = random.Random(7)
+    records = [{"procurement_method": "open", "value_amount": generator.gauss(1000, 50)} for _ in range(300)]
+    records += [{"procurement_method": "direct", "value_amount": generator.gauss(90000, 5000)} for _ in range(300)]
+
+    try:
+        with Session(bind=engine) as db:
+            peer_statistics.observe(db, record_observations(CompiledRuleSet(rules).peer_group_specs, records))
+
+            warm = PeerStatisticsStore()
+            warm.ensure_loaded(db)
+            open_stats = warm.get(("value_amount", "procurement_method", "open"))
+            open_values = [record["value_amount"] for record in records[:300]]
+            assert open_stats.count == 300
+            assert open_stats.mean == pytest.approx(statistics.mean(open_values))
+            assert open_stats.std == pytest.approx(statistics.stdev(open_values))
+            assert open_stats.median.value() == pytest.approx(statistics.median(open_values), rel=0.02)
+
+            # Ingestion moves the cache generation on at most once per refresh interval
+            generation = warm.generation
+            warm.refresh_seconds = 3600
+            warm.observe(db, record_observations(CompiledRuleSet(rules).peer_group_specs, records[:1]))
+            assert warm.generation == generation
+            warm.refresh_seconds = 0
+            assert warm.generation == generation + 1 == warm.generation
+
+        detector = engine_factory(rules)
+        candidates = [
+            {"procurement_method": "open", "value_amount": 5000},
+            {"procurement_method": "direct", "value_amount": 90000},
+            {"procurement_method": "limited", "value_amount": 5000},
+            {"procurement_method": "open", "value_amount": 10000000},
+        ]
+        flagged = [[flag["rule_id"] for flag in detector.detect_red_flags(record)] for record in candidates]
+        assert flagged == [[5], [], [], [5, 6]]
+        assert detector.detect_red_flags_batch(candidates) == [detector.detect_red_flags(r) for r in candidates]
+    finally:
+        peer_statistics.restore({})
+
+
+def test_rule_profiler_counts_evaluations_matches_and_errors(caplog):
+    """Every evaluated rule is counted; failing rules count errors and slow ones are logged"""
+    rule_set = CompiledRuleSet(SAMPLE_RULES + [make_rule(5, "statistical", field="value_amount")])
+
+    def fail(values):
+        raise ZeroDivisionError
+
+    rule_set.rules[-1].matches_resolved = fail
+    profiler = RuleProfiler(enabled=True, slow_rule_ms=0, window=10, sample_rate=1.0)
+    engine = RedFlagEngine(db=None, cache=None, rule_set=rule_set, profiler=profiler)
+    unsampled = RuleProfiler(enabled=True, sample_rate=0.0)
+    RedFlagEngine(db=None, cache=None, rule_set=rule_set, profiler=unsampled).detect_red_flags({"value_amount": 1})
+    assert unsampled.report()["rules"] == []
+
+    engine.detect_red_flags({"value_amount": 20000000, "title": "suspicious"})
+    engine.detect_red_flags_batch([{"value_amount": 5000}, {"value_amount": 20000000}])
+
+    report = {row["rule_id"]: row for row in profiler.report(sort_by="matches")["rules"]}
+    assert {rule_id: row["evaluations"] for rule_id, row in report.items()} == {1: 3, 2: 3, 3: 3, 4: 3, 5: 3}
+    assert (report[1]["matches"], report[2]["matches"], report[3]["matches"]) == (2, 1, 2)
+    assert report[5]["errors"] == 3 and report[5]["matches"] == 0
+    assert report[1]["match_rate"] == pytest.approx(2 / 3)
+    # Only the single-record call contributes to the percentiles
+    assert report[1]["p99_ms"] <= report[1]["total_ms"]
+    assert "Slow red flag rule" in caplog.text
+
+
+def test_detection_jobs_run_by_priority_and_can_be_cancelled(engine_factory, contracts_db):
+    """Queued jobs run highest priority first; cancelled jobs are never run"""
+    engine_factory(SAMPLE_RULES)
+    records = [{"id": "a", "title": "suspicious"}, {"id": "b", "title": "fine"}]
+    low = enqueue_detection_job(contracts_db, obj_in=DetectionJobCreate(records=records))
+    high = enqueue_detection_job(contracts_db, obj_in=DetectionJobCreate(target="ocds_contracts", priority=5))
+    cancelled = enqueue_detection_job(contracts_db, obj_in=DetectionJobCreate(records=records, priority=9))
+    assert cancel_detection_job(contracts_db, db_obj=cancelled).status == "cancelled"
+
+    pool = DetectionJobWorkerPool(workers=0, session_factory=lambda: Session(bind=contracts_db.get_bind()))
+    first = pool.run_once("test")
+    assert (first.id, first.status, first.total, first.processed) == (high.id, "completed", 3, 3)
+    assert [(result["id"], len(result["red_flags"])) for result in first.results] == [(1, 1), (2, 2)]
+
+    second = pool.run_once("test")
+    assert (second.id, second.status, second.flagged) == (low.id, "completed", 1)
+    assert second.results[0]["index"] == 0
+    assert pool.run_once("test") is None
+
+
+def test_target_jobs_persist_flags_on_file_sqlite(engine_factory, file_db):
+    """Table jobs commit between chunks without a read cursor holding the database lock"""
+    engine_factory(SAMPLE_RULES)
+    job = enqueue_detection_job(file_db, obj_in=DetectionJobCreate(target="ocds_contracts", persist=True))
+
+    with Session(bind=file_db.get_bind()) as db, Session(bind=file_db.get_bind()) as read_db:
+        done = run_detection_job(db, read_db, claim_detection_job(db, worker="test"), chunk_size=10)
+        assert (done.id, done.status, done.error, done.processed) == (job.id, "completed", None, 25)
+        flags = sum(len(result["red_flags"]) for result in done.results)
+
+    assert len(file_db.execute(RedFlag.__table__.select()).all()) == flags > 0
+
+
+def test_scan_records_persists_table_flags_on_file_sqlite(file_db, monkeypatch):
+    """The bulk scanner stores flags chunk by chunk while paging through a table"""
+    file_db.add(RedFlagRule(name="High value", description="", rule_type="threshold",
+                            parameters=json.dumps({"field": "value_amount", "threshold": 1000000})))
+    file_db.commit()
+    monkeypatch.setattr(scan_records, "SessionLocal", lambda: Session(bind=file_db.get_bind()))
+    monkeypatch.setattr("sys.argv", [
+        "scan_records.py", "--table", "ocds_contracts", "--persist", "--workers", "2", "--chunk-size", "2"
+    ])
+
+    scan_records.main()
+
+    stored = file_db.execute(RedFlag.__table__.select()).mappings().all()
+    assert sorted(int(row["entity_id"]) for row in stored) == list(range(12, 26))
+
+
+def test_composite_rules_share_predicates_and_match_batch(engine_factory):
+    """Composite conditions reuse rule results and shared predicates; batch agrees with single"""
+    framework = {"type": "pattern", "field": "title", "pattern": "framework"}
+    rules = SAMPLE_RULES + [
+        make_rule(10, "composite", condition={"all": [{"rule": 1}, {"not": framework}]}),
+        make_rule(11, "composite", field="value_amount", condition={"any": [
+            {"rule": 10},
+            {"all": [{"type": "threshold", "field": "value_amount", "threshold": 500000}, {"rule": 2}]},
+        ]}),
+        make_rule(12, "composite", condition={"all": [{"rule": 99}, framework]}),
+        make_rule(13, "composite", condition={"not": {"rule": 13}}),
+        make_rule(14, "composite", condition={"all": [framework, {"rule": 3}]}),
+    ]
+    engine = engine_factory(rules)
+    assert set(engine.rule_set.errors) == {12, 13}
+
+    records = [
+        {"value_amount": 2000000, "title": "Road works"},
+        {"value_amount": 2000000, "title": "Framework agreement"},
+        {"value_amount": 600000, "title": "suspicious"},
+        {"value_amount": 20000000, "title": "framework"},
+        {"title": "framework"},
+    ]
+    flagged = [
+        [flag["rule_id"] for flag in engine.detect_red_flags(record) if flag["rule_id"] >= 10]
+        for record in records
+    ]
+    assert flagged == [[10, 11], [], [11], [14], []]
+    assert engine.detect_red_flags_batch(records) == [engine.detect_red_flags(record) for record in records]
+
+    # The framework predicate is shared by rules 10 and 14 and evaluated once per record
+    predicate = next(node for node in engine.rule_set.rules[-1].expression.children if hasattr(node, "rule"))
+    evaluations = predicate.evaluations
+    engine.detect_red_flags(records[3])
+    assert predicate.shared and predicate.evaluations == evaluations + 1
+
+
+def test_repeated_junctions_do_not_share_their_operands(engine_factory):
+    """Only nodes with several parents are memoised, not the children of a repeated condition"""
+    works = {"type": "pattern", "field": "title", "pattern": "works"}
+    rules = SAMPLE_RULES + [
+        make_rule(10, "composite", condition={"all": [{"rule": 1}, works, works]}),
+        make_rule(11, "composite", condition={"all": [works, {"rule": 1}]}),
+    ]
+    compiled = {rule.id: rule for rule in engine_factory(rules).rule_set.rules}
+
+    junction = compiled[10].expression
+    assert compiled[11].expression is junction and junction.shared
+    assert len(junction.children) == 2 and not any(child.shared for child in junction.children)
+
+
+def test_regex_rules_share_one_scanner_per_field(engine_factory):
+    """Regex rules on a field are answered by one shared scan; risky patterns are rejected"""
+    rules = [
+        make_rule(20, "regex", field="supplier.tax_id", pattern=r"^\d{2}-\d{7}$"),
+        make_rule(21, "regex", field="supplier.tax_id", pattern=r"(\d)\1{3}"),
+        make_rule(22, "regex", field="supplier.name", pattern=r"\b(ltd|llc|gmbh)\b", ignore_case=True),
+        make_rule(23, "regex", field="supplier.name", pattern=r"(\w+\s?)+$"),
+        make_rule(24, "regex", field="supplier.name", pattern=r"[Hh]olding"),
+        make_rule(25, "regex", field="supplier.account", pattern=r"(\d)(?:\d)*0000"),
+        make_rule(26, "regex", field="supplier.name", pattern=r"(a|aa)+b"),
+        make_rule(27, "regex", field="supplier.name", pattern=r"(?:x(?:ab|cd))*z"),
+    ]
+    engine = engine_factory(rules)
+    assert set(engine.rule_set.errors) == {21, 23, 26, 27}
+    assert len(engine.rule_set.regex_scanners["supplier.name"]) == 2
+
+    records = [
+        {"supplier": {"tax_id": "12-3456789", "name": "Acme Holding LTD", "account": "9910000"}},
+        {"supplier": {"tax_id": "123456789", "name": "Acme Ltdx", "account": 10000}},
+        {"supplier": {"name": "Holding Co."}},
+    ]
+    flagged = [[flag["rule_id"] for flag in engine.detect_red_flags(record)] for record in records]
+    assert flagged == [[20, 22, 24, 25], [], [24]]
+    assert engine.detect_red_flags_batch(records) == [engine.detect_red_flags(record) for record in records]
+
+
+def test_regex_scanner_prefilter_agrees_with_separate_searches():
+    """Only patterns whose required literal occurs are searched, without missing any match"""
+    patterns = [(r"holding\s+group", True), (r"^emergency", False), (r"\b(ltd|llc)\b", True),
+                (r"(?:ab)+c\d", False), (r"risk", True), (r"desk", True)]
+    assert [required_literal(pattern) for pattern, _ in patterns] == ["holding", "emergency", "l", "abc", "risk", "desk"]
+    scanner = RegexScanner()
+    for position, (pattern, ignore_case) in enumerate(patterns):
+        scanner.add(pattern, ignore_case, position)
+
+    # U+0130 and U+017F match "i" and "s" case-insensitively, as does the Kelvin sign "k"
+    for text in ["HOLDING  Group Ltd", "emergency works", "an Emergency", "ababc7 llc", "R\u0130S\u212a", "de\u017fk"]:
+        expected = {position for position, (pattern, ignore_case) in enumerate(patterns)
+                    if re.search(pattern, text, re.IGNORECASE if ignore_case else 0)}
+        assert scanner.search(text) == expected
+
+
+def test_shadow_rules_are_counted_apart_from_production_flags(contracts_db):
+    """Shadow rules never reach production rule sets; their hits are counted on sampled records"""
+    shadow = make_rule(30, "pattern", field="title", pattern="consulting")
+    shadow.shadow = True
+    contracts_db.add(RedFlagRule(name="shadow", description="Shadow", rule_type="pattern", parameters="{}", shadow=True))
+    contracts_db.commit()
+    assert get_active_red_flag_rules(contracts_db) == []
+
+    rule_set = CompiledRuleSet(SAMPLE_RULES + [shadow])
+    evaluator = ShadowRuleEvaluator(
+        sample_rate=1.0, session_factory=lambda: Session(bind=contracts_db.get_bind()),
+        registry=SimpleNamespace(get=lambda db: rule_set)
+    )
+    evaluator.evaluate([
+        {"id": "a", "title": "Suspicious consulting", "value_amount": 5000},
+        {"id": "b", "title": "IT consulting"},
+        {"id": "c", "title": "Road works"},
+    ])
+
+    report = evaluator.report()
+    assert [row["rule_id"] for row in report["rules"]] == [30]
+    row = report["rules"][0]
+    assert (row["evaluations"], row["matches"], row["co_flagged"]) == (3, 2, 1)
+    assert row["examples"] == ["a", "b"] and row["co_flagged_rate"] == 0.5
+    assert row["total_ms"] > 0
+
+
+def test_benchmark_generators_are_reproducible():
+    """The same seed yields the same contracts and a rule catalogue that compiles cleanly"""
+    assert list(OCDSGenerator(seed=7).contracts(20)) == list(OCDSGenerator(seed=7).contracts(20))
+    assert list(OCDSGenerator(seed=7).contracts(5)) != list(OCDSGenerator(seed=8).contracts(5))
+
+    rule_set = CompiledRuleSet(generate_rules(200, seed=7))
+    assert len(rule_set) == 200 and rule_set.errors == {}
+    assert {rule.rule_type for rule in rule_set.rules} == {"threshold", "pattern", "anomaly", "regex", "composite"}
+    assert {rule.rule_type for rule in generate_rules(50, seed=7, kinds=["regex"])} == {"regex"}
+
+
+def test_bid_rigging_screens_flag_tenders_and_retire_old_flags(contracts_db):
+    """Screens are computed per tender in one pass; re-runs retire tenders that stopped matching"""
+    bids = {"t-1": [100.0, 101.0, 102.0], "t-2": [100.0, 150.0, 151.0, 152.0], "t-3": [100.0, 130.0, 170.0]}
+    contracts_db.execute(TenderResponse.__table__.insert(), [
+        {"id": f"{tender}-{number}", "tender_item_id": tender, "price": price, "status": "SUBMITTED"}
+        for tender, prices in bids.items() for number, price in enumerate(prices)
+    ] + [{"id": "t-1-withdrawn", "tender_item_id": "t-1", "price": 500.0, "status": "WITHDRAWN"}])
+    contracts_db.add_all([
+        RedFlagRule(id=1, name="Clustered bids", description="CV", rule_type="bid_rigging",
+                    parameters=json.dumps({"statistic": "cv", "operator": "<", "threshold": 0.05})),
+        RedFlagRule(id=2, name="Cover bids", description="RD", rule_type="bid_rigging",
+                    parameters=json.dumps({"statistic": "relative_distance", "operator": ">", "threshold": 3})),
+    ])
+    contracts_db.commit()
+    assert len(CompiledRuleSet(contracts_db.query(RedFlagRule).all())) == 0
+
+    summary = run_bid_rigging_screens(contracts_db, chunk_size=2)
+    assert (summary["tenders"], summary["bids"], summary["flagged"]) == (3, 10, {1: 1, 2: 1})
+    active = contracts_db.execute(
+        RedFlag.__table__.select().where(RedFlag.is_active == True)
+    ).mappings().all()
+    assert sorted((flag["rule_id"], flag["entity_id"]) for flag in active) == [(1, "t-1"), (2, "t-2")]
+    assert all(0.5 < flag["confidence_score"] <= 1 for flag in active)
+
+    contracts_db.execute(TenderResponse.__table__.update().where(TenderResponse.id == "t-1-2").values(price=130.0))
+    run_bid_rigging_screens(contracts_db)
+    active = contracts_db.execute(
+        RedFlag.__table__.select().where(RedFlag.is_active == True)
+    ).mappings().all()
+    assert [(flag["rule_id"], flag["entity_id"]) for flag in active] == [(2, "t-2")]
+
+
+def test_single_bidder_detector_recounts_only_changed_tenders(contracts_db):
+    """Closed tenders with one bid and buyers with many of them are flagged; re-runs are incremental"""
+    past = datetime(2020, 1, 1)
+    contracts_db.execute(ContractingProcess.__table__.insert(), [
+        {"id": "p-1", "title": "P1", "buyer_id": "b-1"}, {"id": "p-2", "title": "P2", "buyer_id": "b-2"},
+    ])
+    contracts_db.execute(TenderItem.__table__.insert(), [
+        {"id": f"t-{number}", "title": "T", "contracting_process_id": f"p-{1 + number % 2}",
+         "status": "COMPLETE", "created_at": past}
+        for number in range(6)
+    ] + [{"id": "t-open", "title": "T", "contracting_process_id": "p-1", "status": "ACTIVE", "created_at": past}])
+    bids = {"t-0": 1, "t-1": 3, "t-2": 0, "t-3": 2, "t-4": 1, "t-5": 2}
+    contracts_db.execute(TenderResponse.__table__.insert(), [
+        {"id": f"{tender}-{number}", "tender_item_id": tender, "price": 1.0, "status": "SUBMITTED", "created_at": past}
+        for tender, count in bids.items() for number in range(count)
+    ])
+    contracts_db.add_all([
+        RedFlagRule(id=1, name="Single bid", description="Tender", rule_type="single_bidder",
+                    parameters=json.dumps({"level": "tender"})),
+        RedFlagRule(id=2, name="Single bid buyer", description="Buyer", rule_type="single_bidder",
+                    parameters=json.dumps({"level": "buyer", "share": 0.5, "min_tenders": 3})),
+    ])
+    contracts_db.commit()
+
+    summary = run_single_bidder_detector(contracts_db)
+    assert (summary["recounted_tenders"], summary["flagged"]) == (7, {1: 3, 2: 1})
+    active = contracts_db.execute(
+        RedFlag.__table__.select().where(RedFlag.is_active == True)
+    ).mappings().all()
+    assert sorted((flag["entity_type"], flag["entity_id"]) for flag in active) == [
+        ("organizations", "b-1"), ("tender_items", "t-0"), ("tender_items", "t-2"), ("tender_items", "t-4")
+    ]
+    assert run_single_bidder_detector(contracts_db)["recounted_tenders"] == 0
+
+    contracts_db.execute(TenderResponse.__table__.insert(), [{
+        "id": "t-0-late", "tender_item_id": "t-0", "price": 1.0, "status": "SUBMITTED",
+        "created_at": datetime.utcnow() + timedelta(hours=1)
+    }])
+    summary = run_single_bidder_detector(contracts_db)
+    assert (summary["recounted_tenders"], summary["flagged"]) == (1, {1: 2, 2: 1})
+
+
+def test_supplier_concentration_is_updated_per_award(contracts_db, monkeypatch):
+    """Each award moves its buyer's HHI and competition risk; a full rebuild agrees"""
+    monkeypatch.setattr(settings, "CONCENTRATION_MIN_AWARDS", 2)
+    contracts_db.execute(ContractingProcess.__table__.insert(), [
+        {"id": "p-1", "title": "P1", "buyer_id": "b-1", "procurement_method": "open"},
+        {"id": "p-2", "title": "P2", "buyer_id": "b-1", "procurement_method": "direct"},
+    ])
+    awards = [
+        AwardItem(id="a-1", title="A", supplier_id="s-1", award_value=600.0, contracting_process_id="p-1"),
+        AwardItem(id="a-2", title="A", supplier_id="s-2", award_value=200.0, contracting_process_id="p-1"),
+        AwardItem(id="a-3", title="A", supplier_id="s-2", award_value=200.0, contracting_process_id="p-2"),
+    ]
+    contracts_db.add_all(awards)
+    contracts_db.commit()
+    for award in awards:
+        apply_award_change(contracts_db, None, award_contribution(contracts_db, award))
+
+    overall = get_buyer_concentration(contracts_db, "b-1")
+    assert overall["hhi"] == pytest.approx(0.6 ** 2 * 10000 + 0.4 ** 2 * 10000)
+    assert (overall["top_supplier_id"], overall["top_supplier_share"]) == ("s-1", pytest.approx(0.6))
+    assert get_buyer_concentration(contracts_db, "b-1", "direct")["hhi"] == pytest.approx(10000)
+    profile = contracts_db.query(RiskProfile).filter(RiskProfile.entity_id == "b-1").one()
+    assert profile.competition_risk == pytest.approx(0.52)
+
+    # Shrinking the top supplier hands the top spot to the next one
+    before = award_contribution(contracts_db, awards[0])
+    awards[0].award_value = 100.0
+    apply_award_change(contracts_db, before, award_contribution(contracts_db, awards[0]))
+    incremental = get_buyer_concentration(contracts_db, "b-1")
+    assert (incremental["top_supplier_id"], incremental["top_supplier_share"]) == ("s-2", pytest.approx(0.8))
+
+    assert rebuild_supplier_concentration(contracts_db) == 1
+    assert get_buyer_concentration(contracts_db, "b-1") == pytest.approx(incremental)
+
+
+def test_award_is_kept_when_supplier_concentration_fails(contracts_db, monkeypatch, caplog):
+    """A failing concentration update is logged; the award stays stored and a rebuild catches up"""
+    monkeypatch.setattr(settings, "CONCENTRATION_MIN_AWARDS", 1)
+    contracts_db.execute(ContractingProcess.__table__.insert(), [
+        {"id": "p-1", "title": "P1", "buyer_id": "b-1", "procurement_method": "open"},
+    ])
+    contracts_db.add_all([
+        AwardItem(id="a-1", title="A", supplier_id="s-1", award_value=500.0, contracting_process_id="p-1"),
+        AwardItem(id="a-2", title="A", supplier_id="s-2", award_value=500.0, contracting_process_id="p-1"),
+    ])
+    contracts_db.commit()
+    rebuild_supplier_concentration(contracts_db)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("lock timeout")
+
+    monkeypatch.setattr(award_crud, "apply_award_change", fail)
+    award = award_crud.update_award_item(contracts_db, db_obj=contracts_db.get(AwardItem, "a-2"),
+                                         obj_in=AwardItemUpdate(supplier_id="s-1"))
+    assert "Could not update supplier concentration with award item a-2" in caplog.text
+    assert contracts_db.get(AwardItem, award.id).supplier_id == "s-1"
+    assert get_buyer_concentration(contracts_db, "b-1")["hhi"] == pytest.approx(5000)
+
+    rebuild_supplier_concentration(contracts_db)
+    assert get_buyer_concentration(contracts_db, "b-1")["hhi"] == pytest.approx(10000)
+
+
+def test_value_screens_score_entities_across_chunks(contracts_db, monkeypatch):
+    """Histograms of an entity spanning chunks add up; suppliers far from Benford's law are flagged"""
+    monkeypatch.setattr(settings, "VALUE_SCREEN_THRESHOLDS", [10000.0])
+    rng = random.Random(3)
+    # s-1 follows Benford's law, s-2 bunches round values just below the 10,000 threshold
+    values = [("s-1", 10 ** rng.uniform(1, 6)) for _ in range(2000)]
+    values += [("s-2", 9000.0 + 100 * (number % 10)) for number in range(150)]
+    contracts_db.execute(AwardItem.__table__.insert(), [
+        {"id": f"a-{number}", "title": "A", "supplier_id": supplier, "award_value": value}
+        for number, (supplier, value) in enumerate(values)
+    ])
+    contracts_db.add(RedFlagRule(id=1, name="Benford", description="MAD", rule_type="value_distribution",
+                                 parameters=json.dumps({"statistic": "first_digit_mad", "threshold": 0.015})))
+    contracts_db.commit()
+
+    summary = run_value_screens(contracts_db, sources=["award_items"], chunk_size=7)
+    assert summary["scored"]["award_items"]["supplier"] == 2 and summary["flagged"] == {1: 1}
+    scores = {row["entity_id"]: row for row in get_value_scores(contracts_db, min_values=0)}
+    assert (scores["s-1"]["value_count"], scores["s-2"]["value_count"]) == (2000, 150)
+    assert scores["s-2"]["round_share"] == pytest.approx(0.1)
+    assert scores["s-2"]["below_threshold_share"] == 1.0
+    assert scores["s-1"]["first_digit_mad"] < 0.015 < scores["s-2"]["first_digit_mad"]
+    flag = contracts_db.query(RedFlag).filter(RedFlag.is_active == True).one()
+    assert (flag.entity_type, flag.entity_id) == ("organizations", "s-2")
+
+
+def test_split_purchase_detector_flags_awards_summing_over_threshold(contracts_db):
+    """Awards under the threshold adding up to it within the window are flagged, per buyer and supplier"""
+    contracts_db.execute(ContractingProcess.__table__.insert(), [
+        {"id": "p-1", "title": "P1", "buyer_id": "b-1"}, {"id": "p-2", "title": "P2", "buyer_id": "b-2"},
+    ])
+    start = datetime(2024, 1, 1)
+    awards = [
+        ("a-1", "p-1", "s-1", 0, 60.0), ("a-2", "p-1", "s-1", 20, 50.0),  # split within 30 days
+        ("a-3", "p-1", "s-1", 60, 60.0), ("a-4", "p-1", "s-1", 95, 60.0),  # too far apart
+        ("a-5", "p-1", "s-2", 61, 50.0),  # other supplier
+        ("a-6", "p-2", "s-1", 61, 150.0), ("a-7", "p-2", "s-1", 62, 10.0),  # one award over the threshold
+    ]
+    contracts_db.execute(AwardItem.__table__.insert(), [
+        {"id": award_id, "title": "A", "contracting_process_id": process, "supplier_id": supplier,
+         "award_date": start + timedelta(days=days), "award_value": value}
+        for award_id, process, supplier, days, value in awards
+    ])
+    contracts_db.add(RedFlagRule(id=1, name="Split", description="Split", rule_type="split_purchase",
+                                 parameters=json.dumps({"threshold": 100, "window_days": 30})))
+    contracts_db.commit()
+
+    summary = run_split_purchase_detector(contracts_db, chunk_size=2)
+    assert (summary["awards"], summary["flagged"]) == (7, {1: 2})
+    flagged = contracts_db.query(RedFlag).filter(RedFlag.is_active == True).all()
+    assert sorted(flag.entity_id for flag in flagged) == ["a-1", "a-2"]
+    assert {flag.entity_type for flag in flagged} == {"award_items"}
+
+
+def test_near_duplicate_organizations_flag_tenders_they_bid_on(contracts_db):
+    """LSH candidates are verified by similarity; tenders with bids from both duplicates are flagged"""
+    contracts_db.add_all([
+        Organization(id="o-1", name="Acme Construction Ltd.", address="12 Main Street, Springfield"),
+        Organization(id="o-2", name="Globex Medical Supplies", address="4 Elm Road"),
+        Organization(id="o-3", name="Initech Consulting", address="99 High Street"),
+    ])
+    contracts_db.commit()
+    assert rebuild_organization_index(contracts_db) == 3
+
+    # Indexed on create, like the CRUD layer does
+    duplicate = Organization(id="o-4", name="ACME  Construction Company", address="12 Main St Springfield")
+    contracts_db.add(duplicate)
+    index_organization(contracts_db, duplicate)
+    contracts_db.commit()
+    matches = find_similar_organizations(contracts_db, duplicate.name, duplicate.address, exclude_id="o-4")
+    assert [match["organization_id"] for match in matches] == ["o-1"]
+
+    contracts_db.execute(TenderResponse.__table__.insert(), [
+        {"id": "r-1", "tender_item_id": "t-1", "supplier_id": "o-1", "status": "SUBMITTED"},
+        {"id": "r-2", "tender_item_id": "t-1", "supplier_id": "o-4", "status": "SUBMITTED"},
+        {"id": "r-3", "tender_item_id": "t-2", "supplier_id": "o-1", "status": "SUBMITTED"},
+        {"id": "r-4", "tender_item_id": "t-2", "supplier_id": "o-2", "status": "SUBMITTED"},
+    ])
+    contracts_db.add(RedFlagRule(id=1, name="Related", description="Related", rule_type="related_suppliers",
+                                 parameters=json.dumps({"min_similarity": 0.8})))
+    contracts_db.commit()
+    summary = run_related_suppliers_detector(contracts_db)
+    assert (summary["duplicate_pairs"], summary["flagged"]) == (1, {1: 1})
+    flag = contracts_db.query(RedFlag).filter(RedFlag.is_active == True).one()
+    assert (flag.entity_type, flag.entity_id) == ("tender_items", "t-1")
+
+
+def test_co_bidding_graph_is_updated_incrementally(contracts_db, monkeypatch):
+    """Re-reading a tender replaces its edges; rotating winners are flagged and clustered"""
+    monkeypatch.setattr(settings, "DETECTOR_WATERMARK_OVERLAP_SECONDS", 0)
+    past = datetime(2020, 1, 1)
+    # s-a and s-b share four tenders and win two each; s-c only loses
+    bidders = {"t-1": ["s-a", "s-b"], "t-2": ["s-a", "s-b", "s-c"], "t-3": ["s-a", "s-b"], "t-4": ["s-a", "s-b"]}
+    contracts_db.execute(TenderResponse.__table__.insert(), [
+        {"id": f"{tender}-{supplier}", "tender_item_id": tender, "supplier_id": supplier,
+         "status": "SUBMITTED", "created_at": past}
+        for tender, suppliers in bidders.items() for supplier in suppliers
+    ])
+    contracts_db.execute(AwardItem.__table__.insert(), [
+        {"id": f"a-{tender}", "title": "A", "tender_id": tender, "supplier_id": winner, "created_at": past}
+        for tender, winner in (("t-1", "s-a"), ("t-2", "s-b"), ("t-3", "s-a"), ("t-4", "s-b"))
+    ])
+    contracts_db.add(RedFlagRule(id=1, name="Rotation", description="Rotation", rule_type="bid_rotation",
+                                 parameters=json.dumps({"min_tenders": 3, "threshold": 0.6})))
+    contracts_db.commit()
+
+    summary = run_bid_rotation_detector(contracts_db)
+    assert (summary["counted_tenders"], summary["edges"], summary["flagged"]) == (4, 3, {1: 2})
+    graph = CoBiddingGraph.load(contracts_db)
+    assert graph.clusters(min_tenders=3) == [["s-a", "s-b"]]
+    assert graph.neighbours("s-a")[0] == {
+        "partner_id": "s-b", "tenders": 4, "wins": 2, "partner_wins": 2, "rotation": 1.0
+    }
+
+    # A late bid on t-1 re-reads only that tender
+    contracts_db.execute(TenderResponse.__table__.insert(), [
+        {"id": "t-1-s-c", "tender_item_id": "t-1", "supplier_id": "s-c", "status": "SUBMITTED",
+         "created_at": datetime.utcnow() + timedelta(hours=1)}
+    ])
+    assert refresh_co_bidding(contracts_db) == 1
+    contracts_db.commit()
+    edges = {(edge.supplier_id, edge.partner_id): edge.tenders for edge in contracts_db.query(SupplierCoBid)}
+    assert edges == {("s-a", "s-b"): 4, ("s-a", "s-c"): 2, ("s-b", "s-c"): 2}
+
+
+def test_tender_timing_screens_use_thresholds_per_procurement_method(contracts_db):
+    """Tender periods are compared to their method's threshold; late amendments are counted per contract"""
+    start = datetime(2024, 1, 1)
+    contracts_db.execute(ContractingProcess.__table__.insert(), [
+        {"id": "p-open", "title": "P", "procurement_method": "open",
+         "tender_period_start": start, "tender_period_end": start + timedelta(days=20)},
+        {"id": "p-limited", "title": "P", "procurement_method": "limited",
+         "tender_period_start": start, "tender_period_end": start + timedelta(days=20)},
+        {"id": "p-direct", "title": "P", "procurement_method": "direct",
+         "tender_period_start": start, "tender_period_end": start + timedelta(days=2)},
+    ])
+    contracts_db.execute(ContractItem.__table__.insert(), [
+        {"id": f"c-{number}", "title": "C", "start_date": start, "end_date": start + timedelta(days=100)}
+        for number in range(2)
+    ])
+    contracts_db.execute(ContractAmendment.__table__.insert(), [
+        {"id": "m-1", "contract_item_id": "c-0", "title": "M", "created_at": start + timedelta(days=80),
+         "status": "APPROVED"},
+        {"id": "m-2", "contract_item_id": "c-0", "title": "M", "created_at": start + timedelta(days=90),
+         "status": "APPROVED"},
+        {"id": "m-3", "contract_item_id": "c-1", "title": "M", "created_at": start + timedelta(days=10),
+         "status": "APPROVED"},
+        {"id": "m-4", "contract_item_id": "c-1", "title": "M", "created_at": start + timedelta(days=95),
+         "status": "APPROVED"},
+        {"id": "m-5", "contract_item_id": "c-1", "title": "M", "created_at": start + timedelta(days=96),
+         "status": "REJECTED"},
+    ])
+    contracts_db.add_all([
+        RedFlagRule(id=1, name="Short period", description="Period", rule_type="tender_timing",
+                    parameters=json.dumps({"metric": "tender_period_days", "method_thresholds": {"open": 30}})),
+        RedFlagRule(id=2, name="Late amendments", description="Late", rule_type="tender_timing",
+                    parameters=json.dumps({"metric": "late_amendments", "threshold": 2})),
+    ])
+    contracts_db.commit()
+
+    summary = run_tender_timing_screens(contracts_db, chunk_size=2)
+    assert summary["entities"] == {"tender_period": 3, "amendments": 2}
+    assert summary["flagged"] == {1: 1, 2: 1}
+    flags = contracts_db.query(RedFlag).filter(RedFlag.is_active == True).all()
+    assert sorted((flag.entity_type, flag.entity_id) for flag in flags) == [
+        ("contract_items", "c-0"), ("contracting_processes", "p-open")
+    ]